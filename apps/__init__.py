@@ -3,6 +3,8 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
+import os
+
 from flask import Flask
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
@@ -12,11 +14,45 @@ from importlib import import_module
 db = SQLAlchemy()
 login_manager = LoginManager()
 
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
 
 def register_extensions(app):
+    # First after_request hook registered, so it runs last
+    from apps.compression import compression
+    compression.init_app(app)
+
+    # ETags are taken on the plain body, before the compression
+    from apps.conditional import conditional
+    conditional.init_app(app)
+
+    from apps.db_pool import pool_monitor
+    pool_monitor.init_app(app)
+
     db.init_app(app)
     login_manager.init_app(app)
 
+    from apps.query_plans import query_plans
+    query_plans.init_app(app)
+
+    from apps.query_stats import query_stats
+    query_stats.init_app(app)
+
+    from apps.fragments import fragment_cache
+    fragment_cache.init_app(app)
+
+    from apps.metrics import metrics
+    metrics.init_app(app)
+
+    from apps.timeseries import series_store
+    series_store.init_app(app)
+
+    from apps.live import live_updates
+    live_updates.init_app(app)
+
+    from apps.authentication.util import password_hasher
+    password_hasher.init_app(app)
+
 
 def register_blueprints(app):
     # Register core modules
@@ -30,16 +66,49 @@ def register_blueprints(app):
 
 
 def configure_database(app):
-
-    @app.before_first_request
-    def initialize_database():
-        db.create_all()
+    # The schema is managed by the migrations (flask db upgrade) at deploy time,
+    # request workers never check or create it
 
     @app.teardown_request
     def shutdown_session(exception=None):
         db.session.remove()
 
-from apps.authentication.oauth import github_blueprint
+
+def warm_up(app):
+    """
+    Prepare a freshly forked server worker before it serves traffic
+
+    :param app: Flask application instance
+    """
+    with app.app_context():
+        # Connections inherited from the master process must not be shared
+        db.engine.dispose()
+
+        # Open the pooled connections now rather than on the first requests
+        from apps.db_pool import pool_monitor
+        pool_monitor.warm_up(db.engine)
+
+
+def register_migrations(app):
+    """
+    Register Flask-Migrate, which the `flask db` commands need
+    Kept out of the serving path: it imports all of alembic
+
+    :param app: Flask application instance
+    """
+    from flask_migrate import Migrate
+    Migrate(app, db, directory=MIGRATIONS_DIR)
+
+
+def register_commands(app):
+    """
+    Register the application commands (flask users ...)
+
+    :param app: Flask application instance
+    """
+    from apps.authentication.commands import users_cli
+    app.cli.add_command(users_cli)
+
 
 def create_app(config):
     app = Flask(__name__)
@@ -48,8 +117,10 @@ def create_app(config):
     # Initialize extensions
     register_extensions(app)
     
-    # OAuth registration
-    app.register_blueprint(github_blueprint, url_prefix="/login")
+    # OAuth registration, flask_dance is only imported when it is enabled
+    if app.config.get('SOCIAL_AUTH_GITHUB'):
+        from apps.authentication.oauth import github_blueprint
+        app.register_blueprint(github_blueprint, url_prefix="/login")
     
     # Register blueprints
     register_blueprints(app)
@@ -57,6 +128,10 @@ def create_app(config):
     # Configure database
     configure_database(app)
     
+    # Fingerprinted static assets
+    from apps.assets import static_assets
+    static_assets.init_app(app)
+
     # Initialize API security features
     from apps.api_security import api_security
     api_security.init_app(app)
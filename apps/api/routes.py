@@ -4,19 +4,28 @@ API Routes
 Secure API endpoints with rate limiting, validation, and JWT authentication
 """
 
-from flask import jsonify, request
+from flask import Response, jsonify, request
 from apps.api import blueprint
 from apps.api_limiter import rate_limiter
-from apps.api_validation import validate_with_schema, user_login_schema, user_registration_schema
+from apps.api_validation import validate_with_schema, user_login_schema, user_registration_schema, series_query_schema
 from apps.api_security import jwt_required
-from apps.authentication.models import Users
-from apps.authentication.util import verify_pass
+from apps.authentication.importer import FORMATS, UserImporter, read_rows
+from apps.authentication.models import Users, register_user
+from apps.authentication.util import verify_pass, needs_rehash, hash_pass
+from apps.db_pool import pool_monitor
+from apps.fragments import fragment_cache
+from apps.live import live_updates
+from apps.metrics import metrics
+from apps.query_stats import query_stats
+from apps.timeseries import series_store
+from apps.lazy import lazy_import
 from apps import db
 
-import jwt
 import datetime
 from flask import current_app
 
+jwt = lazy_import('jwt')
+
 # Public API endpoint with rate limiting
 @blueprint.route('/status', methods=['GET'])
 @rate_limiter.limit
@@ -29,7 +38,7 @@ def api_status():
 
 # API Login with validation and rate limiting
 @blueprint.route('/auth/login', methods=['POST'])
-@rate_limiter.limit
+@rate_limiter.limit(policy='auth')
 @validate_with_schema(user_login_schema)
 def api_login():
     """
@@ -48,12 +57,21 @@ def api_login():
     
     # Check password
     if user and verify_pass(password, user.password):
-        # Generate token
-        token = jwt.encode({
+        # Store the hash again if the configured cost changed
+        if needs_rehash(user.password):
+            user.password = hash_pass(password)
+            db.session.commit()
+
+        # Generate token, with the profile claims read by the claims-only routes
+        payload = {
             'user_id': user.id,
             'username': user.username,
             'exp': datetime.datetime.now() + datetime.timedelta(hours=24)
-        }, current_app.config['SECRET_KEY'], algorithm="HS256")
+        }
+        for claim in current_app.config.get('JWT_PROFILE_CLAIMS', ()):
+            payload[claim] = getattr(user, claim)
+
+        token = jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm="HS256")
         
         return jsonify({
             'token': token,
@@ -64,7 +82,7 @@ def api_login():
 
 # API Registration with validation
 @blueprint.route('/auth/register', methods=['POST'])
-@rate_limiter.limit
+@rate_limiter.limit(policy='auth')
 @validate_with_schema(user_registration_schema)
 def api_register():
     """
@@ -72,38 +90,52 @@ def api_register():
     - Validates input with schema
     - Rate limited for security
     """
-    # Get validated data
-    data = request.validated_data
-    username = data.get('username')
-    email = data.get('email')
-    
-    # Check if username exists
-    user = Users.query.filter_by(username=username).first()
-    if user:
-        return jsonify({'error': 'Username already registered'}), 400
-    
-    # Check if email exists
-    user = Users.query.filter_by(email=email).first()
-    if user:
-        return jsonify({'error': 'Email already registered'}), 400
-    
-    # Create new user
-    new_user = Users(**data)
-    db.session.add(new_user)
-    db.session.commit()
-    
+    # One query on both unique columns, the constraints settle concurrent signups
+    user, error = register_user(**request.validated_data)
+    if error:
+        return jsonify({'error': error}), 400
+
     return jsonify({'message': 'User registered successfully'}), 201
 
+# Bulk user import (JSON Lines or CSV body)
+@blueprint.route('/users/import', methods=['POST'])
+@rate_limiter.limit(policy='user')
+@jwt_required(admin=True)
+def api_users_import(current_user):
+    """
+    Bulk user import
+    - Requires JWT authentication, admins only
+    - Body read as it comes: one JSON object per line, or CSV with a header line
+      (Content-Type text/csv or ?format=csv)
+    - At most USER_IMPORT_MAX_BYTES and USER_IMPORT_MAX_ROWS rows, hashed within
+      the request: larger files go through `flask users import`
+    - Invalid and already registered rows are reported, the others imported
+    """
+    max_bytes = current_app.config.get('USER_IMPORT_MAX_BYTES', 1024 * 1024)
+    if request.content_length is not None and request.content_length > max_bytes:
+        return jsonify({'error': 'Request body too large, at most {} bytes: use flask users import'.format(
+            max_bytes)}), 413
+
+    format = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'jsonl')
+    if format not in FORMATS:
+        return jsonify({'error': 'Unknown format, expected one of: ' + ', '.join(FORMATS)}), 400
+
+    importer = UserImporter(batch_size=current_app.config.get('USER_IMPORT_BATCH_SIZE', 1000),
+                            max_errors=current_app.config.get('USER_IMPORT_MAX_ERRORS', 1000),
+                            max_rows=current_app.config.get('USER_IMPORT_MAX_ROWS', 200))
+    report = importer.run(read_rows(request.stream, format))
+    return jsonify(report.to_dict()), 200 if report.imported or not report.failed else 400
+
 # Protected API endpoint requiring JWT authentication
 @blueprint.route('/profile', methods=['GET'])
-@rate_limiter.limit
-@jwt_required
+@rate_limiter.limit(policy='user')
+@jwt_required(claims=['username', 'email'])
 def api_profile(current_user):
     """
     Protected API endpoint
     - Requires JWT authentication
     - Rate limited for security
-    - Gets current user from JWT token
+    - Gets current user from the JWT claims (no database query)
     """
     return jsonify({
         'id': current_user.id,
@@ -113,23 +145,113 @@ def api_profile(current_user):
 
 # Protected API with both JWT and rate limiting
 @blueprint.route('/dashboard/stats', methods=['GET'])
-@rate_limiter.limit
-@jwt_required
+@rate_limiter.limit(policy='user')
+@jwt_required(claims=['username'])
 def api_dashboard_stats(current_user):
     """
     Protected dashboard stats API
     - Requires JWT authentication
     - Rate limited for security
-    - Example of a data API endpoint
+    - Precomputed metrics, as of the last rollup
     """
-    # This would typically fetch data from a database
-    # For demo purposes, we're returning mock data
+    stats = metrics.snapshot()
     return jsonify({
-        'total_users': Users.query.count(),
-        'active_sessions': 42,
-        'daily_requests': 1024,
+        'total_users': stats['total_users'],
+        'active_sessions': stats['active_sessions'],
+        'daily_requests': stats['daily_requests'],
         'user_info': {
             'id': current_user.id,
             'username': current_user.username
         }
-    }) 
\ No newline at end of file
+    }) 
+
+# Live dashboard stats (Server-Sent Events)
+@blueprint.route('/dashboard/stream', methods=['GET'])
+@rate_limiter.limit(policy='user')
+@jwt_required(claims=[], session=True)
+def api_dashboard_stream(current_user):
+    """
+    Dashboard stats pushed as they change
+    - Requires JWT authentication, or the dashboard login (EventSource)
+    - One `stats` event right away, then one per change, heartbeats in between
+    - Replaces polling /api/dashboard/stats
+    """
+    subscriber = live_updates.subscribe()
+    if subscriber is None:
+        response = jsonify({'message': 'Too many live connections, poll /api/dashboard/stats'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(live_updates.tick_interval)
+        return response
+
+    return Response(live_updates.stream(subscriber), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # nginx: pass the events through as they are written
+        'X-Accel-Buffering': 'no',
+    })
+
+# Chart data
+@blueprint.route('/dashboard/series', methods=['GET'])
+@rate_limiter.limit(policy='user')
+@jwt_required(claims=[])
+@validate_with_schema(series_query_schema, location='query')
+def api_dashboard_series(current_user):
+    """
+    Time series of a metric
+    - Requires JWT authentication
+    - Query string: metric (requests, signups, deletions), start and end
+      (ISO 8601, the last 24 hours by default), points (default 300) and
+      method (lttb or minmax)
+    - Rollups of the granularity matching the range, downsampled to points
+    """
+    query = request.validated_data
+    return jsonify(series_store.query(query['metric'], query['start'], query['end'],
+                                      points=query['points'], method=query['method']))
+
+# Database connection pool metrics
+@blueprint.route('/metrics/db', methods=['GET'])
+@rate_limiter.limit(policy='user')
+@jwt_required(admin=True)
+def api_metrics_db(current_user):
+    """
+    Connection pool metrics
+    - Requires JWT authentication, admins only
+    - Connections in use, overflow and checkout wait times
+    """
+    return jsonify(pool_monitor.stats(db.engine))
+
+# SQL statements per endpoint
+@blueprint.route('/metrics/queries', methods=['GET'])
+@rate_limiter.limit(policy='user')
+@jwt_required(admin=True)
+def api_metrics_queries(current_user):
+    """
+    Query metrics
+    - Requires JWT authentication, admins only
+    - Statements, database time and duplicates per endpoint, with the
+      statements repeated in a request (possible N+1)
+    """
+    return jsonify(query_stats.summary())
+
+# Template fragment cache metrics
+@blueprint.route('/metrics/templates', methods=['GET'])
+@rate_limiter.limit(policy='user')
+@jwt_required(admin=True)
+def api_metrics_templates(current_user):
+    """
+    Template fragment cache metrics
+    - Requires JWT authentication, admins only
+    - Cached fragments and the hit rate of each one
+    """
+    return jsonify(fragment_cache.stats())
+
+# Live updates metrics
+@blueprint.route('/metrics/live', methods=['GET'])
+@rate_limiter.limit(policy='user')
+@jwt_required(admin=True)
+def api_metrics_live(current_user):
+    """
+    Live updates metrics
+    - Requires JWT authentication, admins only
+    - Streams connected to this server process and frames dropped for slow clients
+    """
+    return jsonify(live_updates.summary())
@@ -3,101 +3,740 @@
 API Security Module - Rate Limiting for Flask
 """
 
-from flask import request, jsonify
+from flask import request, jsonify, make_response, current_app
+from abc import ABC, abstractmethod
+from collections import OrderedDict, namedtuple
+import ipaddress
+import json
+import math
+import os
+import sqlite3
 import time
 from functools import wraps
 import threading
+from apps.lazy import lazy_import
+
+jwt = lazy_import('jwt')
+
+
+class FixedWindow:
+    """
+    Fixed window counter
+    Counts requests per key inside aligned windows of window_ms
+
+    State: (window_start, count)
+    """
+    name = 'fixed-window'
+
+    def __init__(self, max_requests, window_ms):
+        self.max_requests = max_requests
+        self.window_ms = window_ms
+
+    def hit(self, state, now):
+        """
+        Register a request against the state of a key
+
+        :param state: Previous state tuple of the key (None for a new key)
+        :param now: Current time in milliseconds
+        :return: Tuple (new_state, allowed)
+        """
+        window_start = now - now % self.window_ms
+        count = state[1] if state and state[0] == window_start else 0
+
+        if count >= self.max_requests:
+            return (window_start, count), False
+        return (window_start, count + 1), True
+
+    def status(self, state, now):
+        """
+        Quota left for a key
+
+        :return: Tuple (remaining requests, ms until the quota grows again)
+        """
+        return max(0, self.max_requests - state[1]), state[0] + self.window_ms - now
+
+    def expires_at(self, state):
+        """Time (ms) after which the state carries no information"""
+        return state[0] + self.window_ms
+
+
+class SlidingWindowCounter:
+    """
+    Sliding window counter
+    Weights the previous window count by its overlap with the sliding window,
+    which approximates a true sliding log with two integers per key
+
+    State: (window_start, current_count, previous_count)
+    """
+    name = 'sliding-window'
+
+    def __init__(self, max_requests, window_ms):
+        self.max_requests = max_requests
+        self.window_ms = window_ms
+
+    def hit(self, state, now):
+        """
+        Register a request against the state of a key
+
+        :param state: Previous state tuple of the key (None for a new key)
+        :param now: Current time in milliseconds
+        :return: Tuple (new_state, allowed)
+        """
+        window_start = now - now % self.window_ms
+        current, previous = 0, 0
+
+        if state:
+            if state[0] == window_start:
+                current, previous = state[1], state[2]
+            elif state[0] == window_start - self.window_ms:
+                previous = state[1]
+
+        weight = 1 - (now - window_start) / self.window_ms
+        if previous * weight + current >= self.max_requests:
+            return (window_start, current, previous), False
+        return (window_start, current + 1, previous), True
+
+    def status(self, state, now):
+        """
+        Quota left for a key
+
+        :return: Tuple (remaining requests, ms until the quota grows again)
+        """
+        window_start, current, previous = state
+        used = previous * (1 - (now - window_start) / self.window_ms) + current
+        remaining = max(0, math.ceil(self.max_requests - used))
+        if remaining:
+            return remaining, window_start + self.window_ms - now
+
+        # Time at which the weighted estimate drops back under the limit
+        if current < self.max_requests:
+            retry_at = window_start + self.window_ms * (1 - (self.max_requests - current) / previous)
+        else:
+            retry_at = window_start + self.window_ms * (2 - self.max_requests / current)
+        return 0, max(0, retry_at - now)
+
+    def expires_at(self, state):
+        """Time (ms) after which the state carries no information"""
+        return state[0] + 2 * self.window_ms
+
+
+class TokenBucket:
+    """
+    Token bucket
+    Holds up to max_requests tokens, refilled continuously at
+    max_requests per window_ms. Allows short bursts at a smooth average rate
+
+    State: (tokens, last_refill)
+    """
+    name = 'token-bucket'
+
+    def __init__(self, max_requests, window_ms):
+        self.max_requests = max_requests
+        self.window_ms = window_ms
+        self.rate = max_requests / window_ms  # tokens per millisecond
+
+    def hit(self, state, now):
+        """
+        Register a request against the state of a key
+
+        :param state: Previous state tuple of the key (None for a new key)
+        :param now: Current time in milliseconds
+        :return: Tuple (new_state, allowed)
+        """
+        if state:
+            tokens = min(self.max_requests, state[0] + (now - state[1]) * self.rate)
+        else:
+            tokens = self.max_requests
+
+        if tokens < 1:
+            return (tokens, now), False
+        return (tokens - 1, now), True
+
+    def status(self, state, now):
+        """
+        Quota left for a key
+
+        :return: Tuple (remaining requests, ms until the next token, 0 once the bucket is full)
+        """
+        tokens = min(self.max_requests, state[0] + (now - state[1]) * self.rate)
+        if tokens >= self.max_requests:
+            return self.max_requests, 0
+        # With tokens left or not, the time until one more request is allowed
+        return int(tokens), (math.floor(tokens) + 1 - tokens) / self.rate
+
+    def expires_at(self, state):
+        """Time (ms) at which the bucket is full again"""
+        return state[1] + (self.max_requests - state[0]) / self.rate
+
+
+# Available rate limiting algorithms, selectable with RATE_LIMIT_STRATEGY
+STRATEGIES = {
+    FixedWindow.name          : FixedWindow,
+    SlidingWindowCounter.name : SlidingWindowCounter,
+    TokenBucket.name          : TokenBucket,
+}
+
+
+def make_strategy(name, max_requests, window_ms):
+    """Build a strategy instance from its RATE_LIMIT_STRATEGY name"""
+    try:
+        return STRATEGIES[name](max_requests, window_ms)
+    except KeyError:
+        raise ValueError('Unknown rate limit strategy: {} (expected one of {})'.format(
+            name, ', '.join(STRATEGIES)))
+
+
+class LimiterStore(ABC):
+    """
+    Storage backend interface for the rate limiter
+    A store keeps one strategy state per key and applies strategy.hit
+    atomically, so a key is never updated by two requests at once.
+    A backend missing one of the methods cannot be instantiated
+    """
+    # Number of partitions the cleanup thread sweeps one at a time
+    partitions = 1
+
+    @abstractmethod
+    def hit(self, key, strategy, now):
+        """
+        Apply strategy.hit to the state of a key and save the new state
+
+        :param key: Client identifier
+        :param strategy: Strategy instance (see STRATEGIES)
+        :param now: Current time in milliseconds
+        :return: Tuple (new_state, allowed)
+        """
+
+    @abstractmethod
+    def evict(self, partition, strategy, now):
+        """
+        Drop the expired keys of one partition
+
+        :return: Number of evicted keys
+        """
+
+    @abstractmethod
+    def items(self):
+        """Snapshot of all (key, state) pairs"""
+
+    @abstractmethod
+    def clear(self):
+        """Drop every key"""
+
+    def __len__(self):
+        return len(self.items())
+
+
+class ShardedStore(LimiterStore):
+    """
+    In-process key/state store split into hash partitions
+    Each shard has its own lock, so concurrent requests for different keys
+    rarely contend, and eviction only ever blocks one shard at a time.
+
+    Shards are kept in least recently used order and capped, so the memory
+    stays flat however many distinct keys the clients make up
+    """
+    def __init__(self, shards=16, max_keys=None):
+        """
+        :param shards: Number of partitions (and locks)
+        :param max_keys: Maximum number of tracked keys (None for no limit)
+        """
+        self.shards = [(OrderedDict(), threading.Lock()) for _ in range(max(1, shards))]
+        self.partitions = len(self.shards)
+        self.max_keys = max_keys
+        self.shard_capacity = -(-max_keys // self.partitions) if max_keys else None
+
+    def _shard(self, key):
+        return self.shards[hash(key) % self.partitions]
+
+    def hit(self, key, strategy, now):
+        data, lock = self._shard(key)
+        with lock:
+            state = data.get(key)
+            if state is None:
+                # Make room by dropping the least recently used key
+                if self.shard_capacity and len(data) >= self.shard_capacity:
+                    data.popitem(last=False)
+            else:
+                data.move_to_end(key)
+
+            state, allowed = strategy.hit(state, now)
+            data[key] = state
+        return state, allowed
+
+    def evict(self, partition, strategy, now):
+        data, lock = self.shards[partition]
+        expires_at = strategy.expires_at
+        with lock:
+            # Last-hit order is not expiry order (token buckets, policies with
+            # different windows): scan the whole shard
+            expired = [key for key, state in data.items() if expires_at(state) <= now]
+            for key in expired:
+                del data[key]
+            evicted = len(expired)
+        return evicted
+
+    def items(self):
+        result = []
+        for data, lock in self.shards:
+            with lock:
+                result.extend(data.items())
+        return result
+
+    def clear(self):
+        for data, lock in self.shards:
+            with lock:
+                data.clear()
+
+    def __len__(self):
+        return sum(len(data) for data, lock in self.shards)
+
+
+class SqliteStore(LimiterStore):
+    """
+    Store shared by every process on the host, backed by a WAL-mode SQLite file
+    Each hit is one short IMMEDIATE transaction, so the read-modify-write is
+    atomic across gunicorn workers. With synchronous=NORMAL a commit only
+    appends to the WAL; the fsyncs are batched into the periodic checkpoints.
+
+    The keys of a namespace are counted in rate_limit_keys and capped: past
+    max_keys, a new key replaces the one of the namespace expiring first.
+    Eviction only sweeps the store's own namespace, as a single partition
+    """
+    def __init__(self, path, namespace='', timeout=5.0, max_keys=None):
+        """
+        :param path: Database file, created if missing
+        :param namespace: Key prefix, so several policies can share the file
+        :param timeout: Seconds to wait for the write lock of another process
+        :param max_keys: Maximum number of keys of the namespace (None for no limit)
+        """
+        self.path = path
+        self.namespace = namespace
+        self.timeout = timeout
+        self.max_keys = max_keys
+        self._local = threading.local()
+        self._create_schema()
+
+    def _create_schema(self):
+        """Create the table and switch the file to WAL (once, for all processes)"""
+        conn = self._connect()
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                # Changing the journal mode does not wait on the busy handler
+                if conn.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+                    conn.execute('PRAGMA journal_mode=WAL')
+                break
+            except sqlite3.OperationalError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.01)
+
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS rate_limits ('
+            ' key TEXT PRIMARY KEY,'
+            ' state TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL'
+            ') WITHOUT ROWID')
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_rate_limits_expires_at ON rate_limits (expires_at)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit_keys ('
+            ' namespace TEXT PRIMARY KEY,'
+            ' keys INTEGER NOT NULL'
+            ')')
+        # Counted once, for a file written before the key counts
+        conn.execute(
+            'INSERT OR IGNORE INTO rate_limit_keys (namespace, keys)'
+            ' SELECT ?, COUNT(*) FROM rate_limits WHERE key >= ? AND key < ?',
+            (self.namespace,) + _prefix_range(self.namespace + '/'))
+
+    def _connect(self):
+        """One connection per thread and per process (never reused after fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def hit(self, key, strategy, now):
+        # States built by different policies and strategies must not mix
+        key = '{}/{}:{}'.format(self.namespace, strategy.name, key)
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT state FROM rate_limits WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self._add_key(conn)
+            state, allowed = strategy.hit(json.loads(row[0]) if row else None, now)
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_limits (key, state, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(state), strategy.expires_at(state)))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return state, allowed
+
+    def _add_key(self, conn):
+        """Count a new key of the namespace, making room first when at max_keys"""
+        keys = conn.execute('SELECT keys FROM rate_limit_keys WHERE namespace = ?',
+                            (self.namespace,)).fetchone()[0]
+        if self.max_keys and keys >= self.max_keys:
+            # The key expiring first: one of the oldest windows for the window strategies
+            conn.execute(
+                'DELETE FROM rate_limits WHERE key = (SELECT key FROM rate_limits'
+                ' WHERE key >= ? AND key < ? ORDER BY expires_at LIMIT 1)',
+                _prefix_range(self.namespace + '/'))
+            keys -= conn.execute('SELECT changes()').fetchone()[0]
+        conn.execute('UPDATE rate_limit_keys SET keys = ? WHERE namespace = ?',
+                     (keys + 1, self.namespace))
+
+    def evict(self, partition, strategy, now):
+        # The expired states of this namespace and strategy only: the other
+        # policies sweep their own
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            evicted = conn.execute(
+                'DELETE FROM rate_limits WHERE key >= ? AND key < ? AND expires_at <= ?',
+                _prefix_range('{}/{}:'.format(self.namespace, strategy.name)) + (now,)).rowcount
+            conn.execute('UPDATE rate_limit_keys SET keys = MAX(0, keys - ?) WHERE namespace = ?',
+                         (evicted, self.namespace))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return evicted
+
+    def items(self):
+        rows = self._connect().execute(
+            'SELECT key, state FROM rate_limits WHERE key LIKE ?', (self.namespace + '/%',)).fetchall()
+        return [(key.split(':', 1)[1], tuple(json.loads(state))) for key, state in rows]
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM rate_limits WHERE key >= ? AND key < ?',
+                         _prefix_range(self.namespace + '/'))
+            conn.execute('UPDATE rate_limit_keys SET keys = 0 WHERE namespace = ?', (self.namespace,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def _prefix_range(prefix):
+    """(low, high) bounds of the keys starting with prefix, for a primary key range scan"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def make_store(url, shards=16, max_keys=None, namespace=''):
+    """
+    Build a limiter store from a RATE_LIMIT_STORAGE url
+
+    :param url: 'memory' or 'sqlite:///<path>'
+    :param shards: Partitions of the in-process store
+    :param max_keys: Cap on the keys tracked per store (per policy)
+    :param namespace: Key prefix in the shared SQLite store
+    """
+    if url == 'memory':
+        return ShardedStore(shards, max_keys)
+    if url.startswith('sqlite:///'):
+        return SqliteStore(url[len('sqlite:///'):], namespace, max_keys=max_keys)
+    raise ValueError('Unknown rate limit storage: {} (expected memory or sqlite:///<path>)'.format(url))
+
+
+# Loopback only, a reverse proxy (nginx) on the same host. Trusting a whole
+# private network would let any client on it pick its own limiter key
+DEFAULT_TRUSTED_PROXIES = '127.0.0.0/8,::1/128'
+
+
+def parse_networks(value):
+    """Parse a comma separated list of IP networks ('' for none)"""
+    if isinstance(value, str):
+        value = value.split(',')
+    return [ipaddress.ip_network(network.strip(), strict=False)
+            for network in value if network.strip()]
+
+
+# Endpoint groups with their own limits, overridable with RATE_LIMIT_POLICIES
+DEFAULT_POLICIES = {
+    # Credential endpoints, per IP
+    'auth': {'max_requests': 20, 'window_ms': 15 * 60 * 1000},
+    # Authenticated API, per JWT user
+    'user': {'max_requests': 300, 'window_ms': 15 * 60 * 1000, 'key': 'user'},
+}
+
+# Outcome of a rate limited request
+RateLimitStatus = namedtuple('RateLimitStatus', 'allowed limit remaining reset_ms')
+
+
+class RateLimitPolicy:
+    """
+    A named limit shared by a group of endpoints
+    Requests are counted per client IP, or per JWT user for authenticated routes
+    """
+    def __init__(self, name, max_requests, window_ms, strategy='sliding-window', key='ip'):
+        """
+        :param name: Policy name, as used in @rate_limiter.limit(policy=...)
+        :param max_requests: Maximum number of requests per client in the time window
+        :param window_ms: Time window in milliseconds
+        :param strategy: Algorithm name, one of STRATEGIES
+        :param key: 'ip' or 'user' (falls back to the IP without a valid token)
+        """
+        if key not in ('ip', 'user'):
+            raise ValueError('Unknown rate limit key: {} (expected ip or user)'.format(key))
+
+        self.name = name
+        self.max_requests = max_requests
+        self.window_ms = window_ms
+        self.key = key
+        self.strategy = make_strategy(strategy, max_requests, window_ms)
+
+        # Assigned by the RateLimiter, one store per policy
+        self.store = None
+
 
 class RateLimiter:
     """
     Rate limiter for Flask API endpoints
     Similar to express-rate-limit but for Flask applications
     """
-    def __init__(self, window_ms=15 * 60 * 1000, max_requests=100, message="Too many requests from this IP, please try again later."):
+    def __init__(self, window_ms=15 * 60 * 1000, max_requests=100, message="Too many requests from this IP, please try again later.", strategy='sliding-window', shards=16, storage='memory', max_keys=100000, trusted_proxies=DEFAULT_TRUSTED_PROXIES, policies=None):
         """
         Initialize rate limiter
-        
+
         :param window_ms: Time window in milliseconds
         :param max_requests: Maximum number of requests per IP in the time window
         :param message: Message to return when rate limit is exceeded
+        :param strategy: Algorithm name, one of STRATEGIES
+        :param shards: Number of independently locked partitions of the state
+        :param storage: 'memory' (per process) or 'sqlite:///<path>' (shared)
+        :param max_keys: Maximum number of clients tracked per policy, least recently seen are dropped first
+        :param trusted_proxies: Networks whose X-Forwarded-For header is believed
+        :param policies: Extra named policies, name -> RateLimitPolicy keyword arguments
         """
         self.window_ms = window_ms
         self.max_requests = max_requests
         self.message = message
-        
-        # Store IP requests with timestamps
-        self.requests = {}
-        
-        # Lock for thread safety
-        self.lock = threading.Lock()
-        
-        # Clean expired entries periodically
+        self.trusted_proxies = parse_networks(trusted_proxies)
+        self.max_keys = max_keys
+
+        # The O(1) strategy state of each client, one store per policy
+        self.policies = self._make_policies(strategy, storage, shards, policies or DEFAULT_POLICIES)
+
+        # Policy names of the decorated routes, checked once the config is loaded
+        self.used_policies = set()
+
+        # Clean expired entries periodically, also in forked (preloaded) workers
         self._start_cleanup_thread()
-    
+        os.register_at_fork(after_in_child=self._start_cleanup_thread)
+
+    @property
+    def strategy(self):
+        """Strategy of the default policy"""
+        return self.policies['default'].strategy
+
+    @property
+    def store(self):
+        """Store of the default policy"""
+        return self.policies['default'].store
+
+    def _make_policies(self, strategy, storage, shards, policies):
+        """Build the default policy plus the named ones, each with its own store"""
+        built = {'default': RateLimitPolicy('default', self.max_requests, self.window_ms, strategy)}
+        for name, options in policies.items():
+            options = dict(options)
+            options.setdefault('window_ms', self.window_ms)
+            options.setdefault('strategy', strategy)
+            built[name] = RateLimitPolicy(name, **options)
+
+        for policy in built.values():
+            policy.store = make_store(storage, shards, self.max_keys, namespace=policy.name)
+        return built
+
+    def init_app(self, app):
+        """
+        Load the rate limiting settings from the Flask app config
+
+        :param app: Flask application instance
+        """
+        self.window_ms = app.config.get('RATE_LIMIT_WINDOW_MS', self.window_ms)
+        self.max_requests = app.config.get('RATE_LIMIT_MAX_REQUESTS', self.max_requests)
+        self.trusted_proxies = parse_networks(
+            app.config.get('RATE_LIMIT_TRUSTED_PROXIES', DEFAULT_TRUSTED_PROXIES))
+        self.max_keys = app.config.get('RATE_LIMIT_MAX_KEYS', self.max_keys)
+
+        policies = dict(DEFAULT_POLICIES)
+        policies.update(app.config.get('RATE_LIMIT_POLICIES', {}))
+
+        # State built by another strategy is meaningless for the new one
+        self.policies = self._make_policies(
+            app.config.get('RATE_LIMIT_STRATEGY', self.strategy.name),
+            app.config.get('RATE_LIMIT_STORAGE', 'memory'),
+            app.config.get('RATE_LIMIT_SHARDS', self.store.partitions),
+            policies)
+
+        # Routes are decorated at import, before the config policies are known
+        unknown = self.used_policies - set(self.policies)
+        if unknown:
+            raise ValueError('Unknown rate limit policy: {}'.format(', '.join(sorted(unknown))))
+
     def _start_cleanup_thread(self):
         """Start a thread to clean up expired entries periodically"""
         def cleanup():
+            partition = 0
             while True:
-                time.sleep(self.window_ms / 2000)  # Half the window time in seconds
-                self._cleanup_expired()
-        
+                # One partition per tick, a full sweep every half window
+                policies = list(self.policies.values())
+                partitions = max(policy.store.partitions for policy in policies)
+                time.sleep(self.window_ms / 2000 / partitions)
+                partition = (partition + 1) % partitions
+                for policy in policies:
+                    if partition < policy.store.partitions:
+                        self._cleanup_expired(policy, partition)
+
         thread = threading.Thread(target=cleanup, daemon=True)
         thread.start()
-    
-    def _cleanup_expired(self):
-        """Remove expired entries from the requests dictionary"""
-        now = time.time() * 1000
-        with self.lock:
-            for ip in list(self.requests.keys()):
-                # Filter timestamps that haven't expired yet
-                valid_timestamps = [ts for ts in self.requests[ip] 
-                                  if now - ts < self.window_ms]
-                
-                if valid_timestamps:
-                    self.requests[ip] = valid_timestamps
-                else:
-                    del self.requests[ip]
-    
+
+    def _cleanup_expired(self, policy, partition):
+        """Remove expired entries from one partition of a policy store"""
+        return policy.store.evict(partition, policy.strategy, time.time() * 1000)
+
     def _get_ip(self):
-        """Get the client's IP address"""
-        # Try to get IP from X-Forwarded-For header for proxies
-        if 'X-Forwarded-For' in request.headers:
-            return request.headers['X-Forwarded-For'].split(',')[0].strip()
-        return request.remote_addr
-    
-    def limit(self, f):
+        """
+        Get the client's IP address
+
+        X-Forwarded-For is only believed when the request comes from a trusted
+        proxy, and is walked from the right (the hop closest to us) so a client
+        cannot pick its own key by sending a forged header
+        """
+        ip = request.remote_addr
+        if not self._is_trusted(ip) or 'X-Forwarded-For' not in request.headers:
+            return ip
+
+        for hop in reversed(request.headers['X-Forwarded-For'].split(',')):
+            hop = hop.strip()
+            try:
+                ipaddress.ip_address(hop)
+            except ValueError:
+                # Garbage in the header: keep the last address we can vouch for
+                return ip
+
+            ip = hop
+            if not self._is_trusted(ip):
+                break
+        return ip
+
+    def _is_trusted(self, ip):
+        try:
+            address = ipaddress.ip_address(ip)
+        except (TypeError, ValueError):
+            return False
+        return any(address in network for network in self.trusted_proxies)
+
+    def _get_user_id(self):
+        """User id carried by a valid JWT bearer token, None otherwise"""
+        # Import here to avoid circular imports
+        from apps.api_security import token_cache
+
+        try:
+            token = request.headers.get('Authorization', '').split(" ")[1]
+            data = token_cache.decode(token, current_app.config['SECRET_KEY'])
+        except (IndexError, jwt.InvalidTokenError):
+            return None
+        return data.get('user_id')
+
+    def _get_key(self, policy):
+        """Client identifier under a policy"""
+        if policy.key == 'user':
+            user_id = self._get_user_id()
+            if user_id is not None:
+                return 'user:{}'.format(user_id)
+        return self._get_ip()
+
+    def hit(self, key, now=None, policy='default'):
+        """
+        Register a request for a key
+
+        :param key: Client identifier (the IP address)
+        :param now: Current time in milliseconds (defaults to the clock)
+        :param policy: Policy name
+        :return: True if the request is within the limit
+        """
+        if now is None:
+            now = time.time() * 1000
+
+        policy = self.policies[policy]
+        return policy.store.hit(key, policy.strategy, now)[1]
+
+    def check(self, key, policy='default', now=None):
+        """
+        Register a request for a key and report the quota left
+
+        :param key: Client identifier
+        :param policy: Policy name
+        :param now: Current time in milliseconds (defaults to the clock)
+        :return: RateLimitStatus
+        """
+        if now is None:
+            now = time.time() * 1000
+
+        policy = self.policies[policy]
+        state, allowed = policy.store.hit(key, policy.strategy, now)
+        remaining, reset_ms = policy.strategy.status(state, now)
+        return RateLimitStatus(allowed, policy.max_requests, remaining, reset_ms)
+
+    def _set_headers(self, response, status):
+        """Advertise the quota (IETF RateLimit draft and the common X- variant)"""
+        reset = str(math.ceil(status.reset_ms / 1000))
+        for prefix in ('RateLimit-', 'X-RateLimit-'):
+            response.headers[prefix + 'Limit'] = str(status.limit)
+            response.headers[prefix + 'Remaining'] = str(status.remaining)
+            response.headers[prefix + 'Reset'] = reset
+
+        if not status.allowed:
+            response.headers['Retry-After'] = reset
+
+    def limit(self, f=None, policy='default'):
         """
         Decorator to limit requests to an endpoint
-        
+
         Usage:
-        @rate_limiter.limit
         @app.route('/api/endpoint')
+        @rate_limiter.limit
         def endpoint():
             return jsonify({"data": "response"})
+
+        @app.route('/api/auth/login', methods=['POST'])
+        @rate_limiter.limit(policy='auth')
+        def login():
+            ...
         """
+        if f is None:
+            return lambda f: self.limit(f, policy)
+
+        self.used_policies.add(policy)
+
         @wraps(f)
         def wrapper(*args, **kwargs):
-            ip = self._get_ip()
-            now = time.time() * 1000
-            
-            with self.lock:
-                if ip not in self.requests:
-                    self.requests[ip] = []
-                
-                # Add current timestamp
-                self.requests[ip].append(now)
-                
-                # Clean up expired timestamps for this IP
-                self.requests[ip] = [ts for ts in self.requests[ip] 
-                                  if now - ts < self.window_ms]
-                
-                # Check if the number of requests exceeds the limit
-                if len(self.requests[ip]) > self.max_requests:
-                    return jsonify({"error": self.message}), 429
-            
-            return f(*args, **kwargs)
-        
+            status = self.check(self._get_key(self.policies[policy]), policy)
+
+            # Check if the number of requests exceeds the limit
+            if not status.allowed:
+                response = jsonify({"error": self.message})
+                response.status_code = 429
+            else:
+                response = make_response(f(*args, **kwargs))
+
+            self._set_headers(response, status)
+            return response
+
         return wrapper
 
 # Create a default rate limiter instance
-rate_limiter = RateLimiter() 
\ No newline at end of file
+rate_limiter = RateLimiter()
@@ -5,8 +5,82 @@ Implements various security measures for Flask APIs
 """
 
 from flask import request, jsonify, make_response
+from collections import OrderedDict
 from functools import wraps
+import hashlib
+import threading
+import time
 from apps.api_limiter import rate_limiter
+from apps.lazy import lazy_import
+
+jwt = lazy_import('jwt')
+
+# Headers added to every response (Helmet-like defaults)
+DEFAULT_SECURITY_HEADERS = {
+    # Content Security Policy
+    'Content-Security-Policy': "default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'; style-src 'self' 'unsafe-inline'; img-src 'self' data:; font-src 'self' data:;",
+    # Prevent MIME type sniffing
+    'X-Content-Type-Options': 'nosniff',
+    # Clickjacking protection
+    'X-Frame-Options': 'SAMEORIGIN',
+    # XSS Protection
+    'X-XSS-Protection': '1; mode=block',
+    # HTTP Strict Transport Security
+    'Strict-Transport-Security': 'max-age=31536000; includeSubDomains',
+    # Referrer policy
+    'Referrer-Policy': 'same-origin',
+}
+
+# Static files are not documents: the page policies (CSP, framing) do not apply to them
+STATIC_HEADERS = {
+    'Content-Security-Policy': None,
+    'X-Frame-Options': None,
+    'X-XSS-Protection': None,
+    'Referrer-Policy': None,
+}
+
+# Never copied into a token: the secret columns, and the claims the login
+# sets itself (identity, registered JWT claims)
+PRIVATE_COLUMNS = {'id', 'password'}
+RESERVED_CLAIMS = {'user_id', 'username', 'exp', 'iat', 'nbf', 'iss', 'aud', 'sub', 'jti'}
+
+
+class HeaderPolicy:
+    """
+    Precomputed response headers of an endpoint
+    Built once per endpoint, then merged into each response in one pass
+    """
+    def __init__(self, headers, cors_headers, preflight_headers, origins):
+        self.origins = origins
+        self.headers = tuple(headers.items()) + tuple(cors_headers.items())
+        self.names = frozenset(name.lower() for name, _ in self.headers)
+        self.preflight_headers = tuple(preflight_headers.items())
+
+    def apply(self, response):
+        """Merge the headers into a response"""
+        headers = response.headers
+        if any(name.lower() in self.names for name, _ in headers):
+            # The view already set some of them: replace those instead of duplicating them
+            headers.update(self.headers)
+        else:
+            headers.extend(self.headers)
+        self._allow_origin(response)
+        return response
+
+    def preflight(self):
+        """Answer to a CORS preflight request"""
+        response = make_response('', 204)
+        response.headers.extend(self.preflight_headers)
+        return response
+
+    def _allow_origin(self, response):
+        # With a list of origins, echo the request origin when it is allowed
+        if self.origins is not None:
+            origin = request.headers.get('Origin')
+            if origin in self.origins:
+                response.headers['Access-Control-Allow-Origin'] = origin
+            response.vary.add('Origin')
+
 
 class APISecurity:
     """
@@ -15,6 +89,7 @@ class APISecurity:
     """
     def __init__(self, app=None):
         self.app = app
+        self._policies = {}
         if app is not None:
             self.init_app(app)
     
@@ -24,59 +99,283 @@ class APISecurity:
         
         :param app: Flask application instance
         """
-        # Apply security headers similar to Helmet in Express
-        @app.after_request
-        def apply_security_headers(response):
-            # Content Security Policy
-            response.headers['Content-Security-Policy'] = "default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'; style-src 'self' 'unsafe-inline'; img-src 'self' data:; font-src 'self' data:;"
-            
-            # Prevent MIME type sniffing
-            response.headers['X-Content-Type-Options'] = 'nosniff'
-            
-            # Clickjacking protection
-            response.headers['X-Frame-Options'] = 'SAMEORIGIN'
-            
-            # XSS Protection
-            response.headers['X-XSS-Protection'] = '1; mode=block'
-            
-            # HTTP Strict Transport Security
-            response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
-            
-            # Referrer policy
-            response.headers['Referrer-Policy'] = 'same-origin'
-            
-            return response
-        
-        # Apply CORS headers
+        self.security_headers = dict(DEFAULT_SECURITY_HEADERS)
+        self.security_headers.update(app.config.get('SECURITY_HEADERS', {}))
+
+        origins = app.config.get('CORS_ORIGINS', '*')
+        self.cors_headers = {
+            'Access-Control-Allow-Origin': '*' if origins == '*' else None,
+            'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+            'Access-Control-Allow-Methods': 'GET,PUT,POST,DELETE,OPTIONS',
+            'Access-Control-Expose-Headers': 'RateLimit-Limit,RateLimit-Remaining,RateLimit-Reset,Retry-After',
+        }
+        self.origins = None if origins == '*' else frozenset(origins)
+
+        # Browsers reuse a preflight answer that long (Chrome caps it at 2 hours)
+        self.max_age = app.config.get('CORS_MAX_AGE', 7200)
+
+        self._policies = {}
+        self._overrides = {'static': {'headers': STATIC_HEADERS}}
+
+        # Answer CORS preflights before routing to the view, which never runs for them
+        @app.before_request
+        def short_circuit_preflight():
+            if request.method == 'OPTIONS' and 'Access-Control-Request-Method' in request.headers:
+                policy = self._policy()
+                if policy.preflight_headers:
+                    return policy.preflight()
+
+        # Apply the security and CORS headers, similar to Helmet and cors in Express
         @app.after_request
-        def apply_cors(response):
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization'
-            response.headers['Access-Control-Allow-Methods'] = 'GET,PUT,POST,DELETE,OPTIONS'
-            
-            # Handle preflight requests
-            if request.method == 'OPTIONS':
-                return make_response()
-                
-            return response
+        def apply_headers(response):
+            return self._policy().apply(response)
         
         # Make rate limiter available at the app level
+        rate_limiter.init_app(app)
         app.rate_limiter = rate_limiter
+
+        # Verified token cache used by jwt_required
+        token_cache.init_app(app)
+
+        # Profile claims added to the tokens at login, checked here rather than at each login
+        self.check_profile_claims(app.config.get('JWT_PROFILE_CLAIMS', ()))
         
         # Register a blueprint for rate limiting endpoints if needed
         # This would be done at the app level when initializing
 
+    @staticmethod
+    def check_profile_claims(names):
+        """
+        Raise ValueError unless every name is a Users column that can go in a token:
+        not the password, nor a claim the login sets itself
+
+        :param names: JWT_PROFILE_CLAIMS
+        """
+        # Import here to avoid circular imports
+        from apps.authentication.models import Users
+        columns = set(Users.__table__.columns.keys()) - PRIVATE_COLUMNS - RESERVED_CLAIMS
+        invalid = [name for name in names if name not in columns]
+        if invalid:
+            raise ValueError('Invalid JWT_PROFILE_CLAIMS: {} (expected some of: {})'.format(
+                ', '.join(invalid), ', '.join(sorted(columns))))
+
+    def policy(self, headers=None, cors=True):
+        """
+        Decorator to override the response headers of a route
+        
+        :param headers: Headers to add or replace, None as a value removes a header
+        :param cors: False to send no CORS headers (and answer no preflight)
+        
+        Usage:
+        @app.route('/embed')
+        @api_security.policy(headers={'X-Frame-Options': None})
+        def embed():
+            return render_template('embed.html')
+        """
+        def decorator(f):
+            f.header_policy = {'headers': headers or {}, 'cors': cors}
+            return f
+        return decorator
+
+    def _policy(self):
+        """HeaderPolicy of the current endpoint, built on its first request"""
+        endpoint = request.endpoint
+        policy = self._policies.get(endpoint)
+        if policy is None:
+            policy = self._policies[endpoint] = self._build_policy(endpoint)
+        return policy
+
+    def _build_policy(self, endpoint):
+        # Import here to avoid circular imports
+        from flask import current_app
+
+        view = current_app.view_functions.get(endpoint)
+        override = getattr(view, 'header_policy', None) or self._overrides.get(endpoint, {})
+
+        headers = dict(self.security_headers)
+        headers.update(override.get('headers', {}))
+        headers = {name: value for name, value in headers.items() if value is not None}
+
+        if not override.get('cors', True):
+            return HeaderPolicy(headers, {}, {}, None)
+
+        cors_headers = {name: value for name, value in self.cors_headers.items() if value is not None}
+        # The other headers are added to the preflight answer by apply_headers, like to any response
+        preflight_headers = {'Access-Control-Max-Age': str(self.max_age)}
+        return HeaderPolicy(headers, cors_headers, preflight_headers, self.origins)
+
+
+class UserSnapshot:
+    """
+    Detached, read-only copy of a Users row (without the password hash)
+    Safe to keep across requests, unlike an ORM instance bound to a session
+    """
+    def __init__(self, user):
+        for column in user.__table__.columns:
+            if column.key != 'password':
+                setattr(self, column.key, getattr(user, column.key))
+
+    def __repr__(self):
+        return str(self.username)
+
+
+class TokenCache:
+    """
+    Bounded cache of verified JWTs
+    Maps the SHA-256 digest of a token to its decoded claims and a snapshot
+    of its user, so polling clients skip jwt.decode and the Users lookup.
+    An entry lives until the token expires, at most ttl seconds, and is
+    dropped as soon as its user is updated or deleted in this process
+    """
+    def __init__(self, max_entries=10000, ttl=300):
+        """
+        :param max_entries: Maximum number of cached tokens (least recently used are dropped)
+        :param ttl: Maximum seconds an entry is trusted (0 disables the cache)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._listening = False
+
+    def init_app(self, app):
+        """
+        Load the cache settings and invalidate entries when users change
+
+        :param app: Flask application instance
+        """
+        self.max_entries = app.config.get('JWT_CACHE_MAX_ENTRIES', self.max_entries)
+        self.ttl = app.config.get('JWT_CACHE_TTL', self.ttl)
+        self.clear()
+
+        if not self._listening:
+            # Import here to avoid circular imports
+            from sqlalchemy import event
+            from apps.authentication.models import Users
+
+            def invalidate(mapper, connection, user):
+                self.invalidate_user(user.id)
+
+            event.listen(Users, 'after_update', invalidate)
+            event.listen(Users, 'after_delete', invalidate)
+            self._listening = True
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        """
+        Cached (claims, user) of a token, None when unknown or expired
+        user is None if only the claims were cached
+        """
+        digest = self._digest(token)
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self.entries[digest]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(digest)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, token, claims, user=None):
+        """
+        Cache a verified token
+
+        :param token: The encoded JWT
+        :param claims: Its decoded (verified) claims
+        :param user: UserSnapshot of claims['user_id'], if loaded
+        """
+        if not self.ttl or not self.max_entries:
+            return
+
+        digest = self._digest(token)
+        expires_at = min(claims.get('exp', float('inf')), time.time() + self.ttl)
+        with self.lock:
+            self.entries[digest] = (expires_at, claims, user)
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def decode(self, token, secret):
+        """
+        Verified claims of a token, from the cache or jwt.decode
+        Raises jwt.InvalidTokenError (and subclasses) like jwt.decode
+        """
+        entry = self.get(token)
+        if entry is not None:
+            return entry[0]
+
+        claims = jwt.decode(token, secret, algorithms=["HS256"])
+        self.put(token, claims)
+        return claims
+
+    def invalidate_user(self, user_id):
+        """Drop every cached token of a user"""
+        with self.lock:
+            for digest in [digest for digest, entry in self.entries.items()
+                           if entry[1].get('user_id') == user_id]:
+                del self.entries[digest]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TokenPrincipal:
+    """
+    The user of an API request, built from the token claims alone
+    Used by jwt_required(claims=...) to serve a route without the database.
+    The values are those at login time, until the token expires
+    """
+    def __init__(self, claims):
+        for name, value in claims.items():
+            setattr(self, name, value)
+        self.id = claims['user_id']
+
+    def __repr__(self):
+        return str(self.username)
+
+
+def is_admin(user, app):
+    """True if the user is listed in ADMIN_USERNAMES"""
+    return user.username in app.config.get('ADMIN_USERNAMES', ())
+
+
 # Authentication decorator using JWT
-def jwt_required(f):
+def jwt_required(f=None, claims=None, session=False, admin=False):
     """
     Decorator to protect routes with JWT authentication
     
+    :param claims: Optional claim names; when the token carries all of them,
+                   the route gets a TokenPrincipal and no database query is made.
+                   Older tokens without them fall back to loading the user.
+                   For read-only routes: a deleted account keeps its token until it expires
+    :param session: Without a token, accept the user logged in to the dashboard
+                    (session cookie), e.g. for EventSource which cannot send headers
+    :param admin: Only for the users listed in ADMIN_USERNAMES. The account is
+                  read at each request (no claims, no cache), so a deleted or
+                  removed admin loses access at once
+    
     Usage:
     @app.route('/protected')
     @jwt_required
-    def protected():
+    def protected(current_user):
         return jsonify({"message": "This is protected"})
+
+    @app.route('/api/profile')
+    @jwt_required(claims=['username', 'email'])
+    def profile(current_user):
+        return jsonify({"email": current_user.email})
     """
+    if f is None:
+        return lambda f: jwt_required(f, claims, session, admin)
+
     @wraps(f)
     def decorated(*args, **kwargs):
         token = None
@@ -89,23 +388,66 @@ def jwt_required(f):
             except IndexError:
                 pass
         
+        # Import here to avoid circular imports
+        from flask import current_app
+
+        if not token and session:
+            from flask_login import current_user
+            if current_user.is_authenticated:
+                if admin and not is_admin(current_user, current_app):
+                    return jsonify({'message': 'Admin access required'}), 403
+                return f(UserSnapshot(current_user), *args, **kwargs)
+
         if not token:
             return jsonify({'message': 'Token is missing'}), 401
-        
+
+        # Admin routes: the account as it is now, never the claims or the cache
+        if admin:
+            try:
+                data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+            except jwt.ExpiredSignatureError:
+                return jsonify({'message': 'Token has expired'}), 401
+            except jwt.InvalidTokenError:
+                return jsonify({'message': 'Invalid token'}), 401
+
+            from apps.authentication.models import Users
+            user = Users.query.filter_by(id=data['user_id']).first()
+            if not user:
+                return jsonify({'message': 'User not found'}), 401
+            if not is_admin(user, current_app):
+                return jsonify({'message': 'Admin access required'}), 403
+            return f(UserSnapshot(user), *args, **kwargs)
+
+        # Claims-only mode: the token is all we need
+        if claims is not None:
+            try:
+                data = token_cache.decode(token, current_app.config['SECRET_KEY'])
+            except jwt.ExpiredSignatureError:
+                return jsonify({'message': 'Token has expired'}), 401
+            except jwt.InvalidTokenError:
+                return jsonify({'message': 'Invalid token'}), 401
+
+            if all(name in data for name in claims):
+                return f(TokenPrincipal(data), *args, **kwargs)
+
+        # Verified recently: skip the decode and the user lookup
+        entry = token_cache.get(token)
+        if entry is not None and entry[1] is not None:
+            return f(entry[1], *args, **kwargs)
+
         try:
-            # Import here to avoid circular imports
-            from flask import current_app
-            import jwt
-            
             # Decode the token
             data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
             
             # Get the user from the token data
             from apps.authentication.models import Users
-            current_user = Users.query.filter_by(id=data['user_id']).first()
+            user = Users.query.filter_by(id=data['user_id']).first()
             
-            if not current_user:
+            if not user:
                 return jsonify({'message': 'User not found'}), 401
+
+            current_user = UserSnapshot(user)
+            token_cache.put(token, data, current_user)
                 
         except jwt.ExpiredSignatureError:
             return jsonify({'message': 'Token has expired'}), 401
@@ -118,4 +460,5 @@ def jwt_required(f):
     return decorated
 
 # Create an instance for import
-api_security = APISecurity() 
\ No newline at end of file
+api_security = APISecurity()
+token_cache = TokenCache() 
\ No newline at end of file
@@ -6,14 +6,17 @@ Implements request validation similar to Joi in Express.js
 
 from flask import request, jsonify
 from functools import wraps
-from marshmallow import Schema, fields, ValidationError
+from marshmallow import Schema, fields, post_load, validate, validates_schema, ValidationError
+import datetime
+import time
 
 # Base validator function
-def validate_with_schema(schema):
+def validate_with_schema(schema, location='body'):
     """
     Decorator to validate incoming request data with a marshmallow schema
     
     :param schema: Marshmallow schema class to validate against
+    :param location: 'body' (JSON or form) or 'query' (query string)
     
     Usage:
     class UserSchema(Schema):
@@ -31,7 +34,9 @@ def validate_with_schema(schema):
         @wraps(f)
         def wrapper(*args, **kwargs):
             # Determine the request data based on content type
-            if request.is_json:
+            if location == 'query':
+                data = request.args.to_dict()
+            elif request.is_json:
                 data = request.json
             elif request.content_type == 'application/x-www-form-urlencoded':
                 data = request.form.to_dict()
@@ -69,7 +74,50 @@ class ProfileUpdateSchema(Schema):
     email = fields.Email()
     bio = fields.String(validate=lambda s: len(s) <= 500)
 
+class UserImportSchema(UserRegistrationSchema):
+    """Schema for bulk imported users: registration fields, column sizes and profile"""
+    username = fields.String(required=True, validate=validate.Length(min=3, max=64))
+    email = fields.Email(required=True, validate=validate.Length(max=64))
+    first_name = fields.String(validate=validate.Length(max=64))
+    last_name = fields.String(validate=validate.Length(max=64))
+    address = fields.String(validate=validate.Length(max=128))
+    city = fields.String(validate=validate.Length(max=64))
+    country = fields.String(validate=validate.Length(max=64))
+    postal_code = fields.String(validate=validate.Length(max=16))
+    about_me = fields.String()
+    position = fields.String(validate=validate.Length(max=64))
+
+class SeriesQuerySchema(Schema):
+    """Schema for time series queries (query string)"""
+    metric = fields.String(required=True, validate=validate.OneOf(('requests', 'signups', 'deletions')))
+    start = fields.DateTime()
+    end = fields.DateTime()
+    points = fields.Integer(load_default=300, validate=validate.Range(min=3, max=2000))
+    method = fields.String(load_default='lttb', validate=validate.OneOf(('lttb', 'minmax')))
+
+    @validates_schema
+    def validate_range(self, data, **kwargs):
+        if 'start' in data and 'end' in data and utc_timestamp(data['start']) >= utc_timestamp(data['end']):
+            raise ValidationError('start must be before end', 'start')
+        if 'start' in data and utc_timestamp(data['start']) > time.time():
+            raise ValidationError('start must not be in the future', 'start')
+
+    @post_load
+    def to_timestamps(self, data, **kwargs):
+        # Seconds since the epoch, the last 24 hours by default
+        data['end'] = utc_timestamp(data['end']) if 'end' in data else time.time()
+        data['start'] = utc_timestamp(data['start']) if 'start' in data else data['end'] - 86400
+        return data
+
+def utc_timestamp(value):
+    """Seconds since the epoch of a datetime, in UTC when it has no timezone"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
 # Export common schemas
 user_registration_schema = UserRegistrationSchema()
 user_login_schema = UserLoginSchema()
-profile_update_schema = ProfileUpdateSchema() 
\ No newline at end of file
+profile_update_schema = ProfileUpdateSchema()
+series_query_schema = SeriesQuerySchema()
+user_import_schema = UserImportSchema() 
\ No newline at end of file
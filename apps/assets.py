@@ -0,0 +1,101 @@
+# -*- encoding: utf-8 -*-
+"""
+Static Assets
+Resolves asset paths through the manifest written by `gulp assets` and
+serves the fingerprinted files with long-lived caching and their
+precompressed (brotli, gzip) variants
+"""
+
+import json
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory
+
+# Fingerprinted files never change: browsers can keep them for a year without revalidating
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Precompressed variants, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class StaticAssets:
+    """
+    Fingerprinted static assets
+    Without a manifest (not built, or in development) asset_url() returns
+    the plain paths and the static files are served as before
+    """
+    def __init__(self):
+        self.root = ''
+        self.manifest = {}
+        self.variants = {}
+        self.prefix = None
+
+    def init_app(self, app):
+        """
+        Load the manifest and take over the static view
+
+        :param app: Flask application instance
+        """
+        self.root = app.config.get('ASSETS_ROOT', '/static/assets').rstrip('/')
+        self.manifest = {}
+        self.variants = {}
+        self.prefix = None
+
+        path = app.config.get('ASSETS_MANIFEST')
+        if path and os.path.isfile(path):
+            with open(path) as manifest:
+                self.manifest = json.load(manifest)
+
+            # Location of the build under the static folder, e.g. 'assets/dist/'
+            dist = os.path.dirname(os.path.abspath(path))
+            self.prefix = os.path.relpath(dist, app.static_folder).replace(os.sep, '/') + '/'
+
+            # The variants are looked up once here, not on every request
+            for hashed in self.manifest.values():
+                self.variants[hashed] = tuple(
+                    (encoding, suffix) for encoding, suffix in ENCODINGS
+                    if os.path.isfile(os.path.join(dist, hashed + suffix)))
+
+        app.add_template_global(self.url, 'asset_url')
+
+        if app.static_folder:
+            app.view_functions['static'] = self.serve
+
+    def url(self, path):
+        """
+        URL of an asset, fingerprinted when it is in the manifest
+
+        Usage:
+        <link href="{{ asset_url('css/black-dashboard.css') }}" rel="stylesheet" />
+
+        :param path: Path under ASSETS_ROOT
+        """
+        hashed = self.manifest.get(path)
+        if hashed is None:
+            return '{}/{}'.format(self.root, path)
+        return '{}/dist/{}'.format(self.root, hashed)
+
+    def serve(self, filename):
+        """Static view: fingerprinted files are immutable and sent precompressed when accepted"""
+        hashed = filename[len(self.prefix):] if self.prefix and filename.startswith(self.prefix) else None
+        if hashed not in self.variants:
+            return current_app.send_static_file(filename)
+
+        response = None
+        for encoding, suffix in self.variants[hashed]:
+            if request.accept_encodings[encoding]:
+                response = send_from_directory(current_app.static_folder, filename + suffix,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                break
+
+        if response is None:
+            response = send_from_directory(current_app.static_folder, filename)
+
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+
+static_assets = StaticAssets()
@@ -0,0 +1,49 @@
+# -*- encoding: utf-8 -*-
+"""
+Users CLI
+$ flask users import users.jsonl
+$ flask users import users.csv --batch-size 5000
+"""
+
+import json
+import os
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+users_cli = AppGroup('users', help='Manage the user accounts.')
+
+
+@users_cli.command('import')
+@click.argument('file', type=click.File('rb'))
+@click.option('--format', type=click.Choice(['jsonl', 'csv']),
+              help='Rows format (default: from the file extension, else jsonl).')
+@click.option('--batch-size', type=int, help='Rows checked, hashed and inserted together.')
+def import_users(file, format, batch_size):
+    """Create users from a JSON Lines or CSV FILE ('-' for stdin)."""
+    # Import here, the serving processes never need it
+    from apps.authentication.importer import UserImporter, read_rows
+    from apps.authentication.util import password_hasher
+    from apps.metrics import metrics
+
+    if format is None:
+        format = 'csv' if os.path.splitext(file.name)[1].lower() == '.csv' else 'jsonl'
+    # No logins in this process: hash on every worker
+    importer = UserImporter(batch_size=batch_size or current_app.config.get('USER_IMPORT_BATCH_SIZE', 1000),
+                            max_errors=current_app.config.get('USER_IMPORT_MAX_ERRORS', 1000),
+                            hash_workers=password_hasher.workers)
+    try:
+        report = importer.run(read_rows(file, format))
+    finally:
+        # The flush thread only runs in the serving processes: roll the
+        # signups up into the totals before exiting, whatever got imported
+        metrics.flush()
+
+    for error in report.errors:
+        click.echo('row {row}: {error}'.format(**error), err=True)
+    if report.failed > len(report.errors):
+        click.echo('... {} more errors'.format(report.failed - len(report.errors)), err=True)
+    click.echo(json.dumps({'imported': report.imported, 'failed': report.failed}))
+    if report.failed and not report.imported:
+        raise SystemExit(1)
@@ -0,0 +1,200 @@
+# -*- encoding: utf-8 -*-
+"""
+Bulk User Import
+Creates users from a JSON Lines or CSV stream, by batches: one query checks
+the usernames and emails of a batch against the existing users, the
+passwords are hashed in parallel on the login hashing pool and the rows
+inserted with a single executemany and commit. Invalid rows are reported,
+the others imported
+"""
+
+import csv
+import io
+import json
+
+from marshmallow import ValidationError
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from apps import db
+from apps.api_validation import user_import_schema
+from apps.authentication.models import Users, registration_error
+from apps.authentication.util import password_hasher
+
+FORMATS = ('jsonl', 'csv')
+
+
+def read_rows(stream, format='jsonl'):
+    """
+    Rows of a JSON Lines or CSV byte stream, read as they come
+    Yield (row number, dict), or (row number, error message) for unreadable rows
+
+    :param stream: Binary file-like object (request stream, open file)
+    :param format: 'jsonl' (one JSON object per line) or 'csv' (header line first)
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if format == 'csv':
+        for number, row in enumerate(csv.DictReader(text), 1):
+            if None in row:
+                yield number, 'More values than columns'
+            else:
+                # Empty cells are missing values
+                yield number, {key: value for key, value in row.items() if value != ''}
+        return
+
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, 'Invalid JSON: {}'.format(e)
+            continue
+        yield number, row if isinstance(row, dict) else 'Not a JSON object'
+
+
+class ImportReport:
+    """Outcome of an import: counts and the errors of the first failed rows"""
+    def __init__(self, max_errors=1000):
+        self.max_errors = max_errors
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.truncated = False
+
+    def error(self, number, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': number, 'error': message})
+
+    def to_dict(self):
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+            'errors_truncated': self.failed > len(self.errors),
+            'truncated': self.truncated,
+        }
+
+
+class UserImporter:
+    """
+    Imports users by batches of batch_size rows
+    Needs an application context
+    """
+    def __init__(self, batch_size=1000, max_errors=1000, max_rows=None, hash_workers=None):
+        """
+        :param batch_size: Rows checked, hashed and inserted together
+        :param max_errors: Row errors listed in the report (all are counted)
+        :param max_rows: Rows read at most, the rest is left unread (default: all)
+        :param hash_workers: Hashing workers taken at most (default: half, the logins keep the others)
+        """
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.max_rows = max_rows
+        self.hash_workers = hash_workers
+
+    def run(self, rows):
+        """
+        Import the rows, return an ImportReport
+
+        :param rows: (row number, dict or error message) as given by read_rows
+        """
+        report = ImportReport(self.max_errors)
+        batch = []
+        for count, (number, row) in enumerate(rows, 1):
+            if self.max_rows is not None and count > self.max_rows:
+                report.truncated = True
+                break
+            if isinstance(row, str):
+                report.error(number, row)
+                continue
+            try:
+                batch.append((number, user_import_schema.load(row)))
+            except ValidationError as e:
+                report.error(number, _message(e.messages))
+                continue
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch, report)
+                batch = []
+        if batch:
+            self._import_batch(batch, report)
+        return report
+
+    def _import_batch(self, batch, report):
+        # Duplicates within the batch: the first one wins
+        usernames, emails, unique = set(), set(), []
+        for number, user in batch:
+            if user['username'] in usernames:
+                report.error(number, 'Username already registered')
+            elif user['email'] in emails:
+                report.error(number, 'Email already registered')
+            else:
+                usernames.add(user['username'])
+                emails.add(user['email'])
+                unique.append((number, user))
+
+        # Against the existing users, in one query on both unique columns
+        existing = db.session.query(Users.username, Users.email).filter(
+            or_(Users.username.in_(usernames), Users.email.in_(emails))).all()
+        db.session.rollback()
+        taken_usernames = {username for username, _ in existing}
+        taken_emails = {email for _, email in existing}
+        new = []
+        for number, user in unique:
+            if user['username'] in taken_usernames:
+                report.error(number, 'Username already registered')
+            elif user['email'] in taken_emails:
+                report.error(number, 'Email already registered')
+            else:
+                new.append((number, user))
+        if not new:
+            return
+
+        # PBKDF2 on the shared pool, next to the logins
+        hashes = password_hasher.hash_many([user['password'] for _, user in new], workers=self.hash_workers)
+        for (_, user), pwdhash in zip(new, hashes):
+            user['password'] = pwdhash
+
+        try:
+            self._insert([user for _, user in new])
+        except IntegrityError:
+            # Registered meanwhile by another request: insert the rows one by one
+            db.session.rollback()
+            inserted = 0
+            for number, user in new:
+                try:
+                    self._insert([user])
+                    inserted += 1
+                except IntegrityError:
+                    db.session.rollback()
+                    report.error(number, registration_error(user['username'], user['email'])
+                                 or 'Username or email already registered')
+            report.imported += inserted
+            self._count(inserted)
+        else:
+            report.imported += len(new)
+            self._count(len(new))
+
+    @staticmethod
+    def _insert(users):
+        # One executemany, one commit. Missing profile columns take their defaults
+        columns = Users.__table__.columns
+        rows = [{column.key: user.get(column.key, column.default.arg if column.default else None)
+                 for column in columns if column.key != 'id'} for user in users]
+        db.session.execute(Users.__table__.insert(), rows)
+        db.session.commit()
+
+    @staticmethod
+    def _count(signups):
+        # Core inserts do not go through the Users mapper events the metrics listen to
+        from apps.metrics import metrics
+        metrics.incr('signups', signups)
+
+
+def _message(messages):
+    """One line of a marshmallow error dict"""
+    return '; '.join('{}: {}'.format(field, ' '.join(errors) if isinstance(errors, list) else errors)
+                     for field, errors in sorted(messages.items()))
@@ -3,10 +3,14 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
+from datetime import datetime
+
 from flask_login import UserMixin
 
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import relationship
-from flask_dance.consumer.storage.sqla import OAuthConsumerMixin
+from sqlalchemy.ext.mutable import MutableDict
 
 from apps import db, login_manager
 
@@ -21,7 +25,20 @@ class Users(db.Model, UserMixin):
     email         = db.Column(db.String(64), unique=True)
     password      = db.Column(db.LargeBinary)
 
-    oauth_github  = db.Column(db.String(100), nullable=True)
+    # Looked up at every Github login
+    oauth_github  = db.Column(db.String(100), nullable=True, index=True)
+
+    # Profile
+    first_name    = db.Column(db.String(64))
+    last_name     = db.Column(db.String(64))
+    address       = db.Column(db.String(128))
+    city          = db.Column(db.String(64))
+    country       = db.Column(db.String(64))
+    postal_code   = db.Column(db.String(16))
+    about_me      = db.Column(db.Text)
+    position      = db.Column(db.String(64), default='Member', server_default='Member')
+    profile_image = db.Column(db.String(128), default='img/default-avatar.png',
+                              server_default='img/default-avatar.png')
 
     def __init__(self, **kwargs):
         for property, value in kwargs.items():
@@ -41,6 +58,42 @@ class Users(db.Model, UserMixin):
         return str(self.username)
 
 
+def registration_error(username, email):
+    """
+    Message for a username or email already taken, None if both are free
+    One query on both unique columns
+    """
+    taken = db.session.query(Users.username, Users.email).filter(
+        or_(Users.username == username, Users.email == email)).all()
+    if any(row.username == username for row in taken):
+        return 'Username already registered'
+    if taken:
+        return 'Email already registered'
+    return None
+
+
+def register_user(**kwargs):
+    """
+    Create a user, return (user, None) or (None, error message)
+    A taken username or email is found by one query, before the password is
+    hashed. The unique constraints on both columns still decide between two
+    concurrent signups: the one whose INSERT fails gets the error as well
+    """
+    username, email = kwargs.get('username'), kwargs.get('email')
+    error = registration_error(username, email)
+    if error:
+        return None, error
+
+    user = Users(**kwargs)
+    db.session.add(user)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return None, registration_error(username, email) or 'Username or email already registered'
+    return user, None
+
+
 @login_manager.user_loader
 def user_loader(id):
     return Users.query.filter_by(id=id).first()
@@ -52,6 +105,19 @@ def request_loader(request):
     user = Users.query.filter_by(username=username).first()
     return user if user else None
 
-class OAuth(OAuthConsumerMixin, db.Model):
-    user_id = db.Column(db.Integer, db.ForeignKey("Users.id", ondelete="cascade"), nullable=False)
+class OAuth(db.Model):
+
+    # Columns of flask_dance's OAuthConsumerMixin, declared here so the model
+    # does not import flask_dance when Github login is disabled
+    __tablename__ = 'flask_dance_oauth'
+    __table_args__ = (
+        # Token lookup of flask_dance's storage: provider, then the user
+        db.Index('ix_flask_dance_oauth_provider_user_id', 'provider', 'user_id'),
+    )
+
+    id         = db.Column(db.Integer, primary_key=True)
+    provider   = db.Column(db.String(50), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    token      = db.Column(MutableDict.as_mutable(db.JSON), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("Users.id", ondelete="cascade"), nullable=False, index=True)
     user = db.relationship(Users)
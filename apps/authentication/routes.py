@@ -3,21 +3,18 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
-from flask import render_template, redirect, request, url_for
+from flask import render_template, redirect, request, url_for, current_app
 from flask_login import (
     current_user,
     login_user,
     logout_user
 )
 
-from flask_dance.contrib.github import github
-
 from apps import db, login_manager
 from apps.authentication import blueprint
-from apps.authentication.forms import LoginForm, CreateAccountForm
-from apps.authentication.models import Users
+from apps.authentication.models import Users, register_user
 
-from apps.authentication.util import verify_pass
+from apps.authentication.util import verify_pass, needs_rehash, hash_pass, HashingBusy
 
 
 @blueprint.route('/')
@@ -29,6 +26,12 @@ def route_default():
 @blueprint.route("/github")
 def login_github():
     """ Github login """
+    if not current_app.config.get('SOCIAL_AUTH_GITHUB'):
+        return redirect(url_for('authentication_blueprint.login'))
+
+    # Import here: flask_dance is only loaded when Github login is enabled
+    from flask_dance.contrib.github import github
+
     if not github.authorized:
         return redirect(url_for("github.login"))
 
@@ -37,6 +40,9 @@ def login_github():
     
 @blueprint.route('/login', methods=['GET', 'POST'])
 def login():
+    # Import here: WTForms is only loaded once an account page is served
+    from apps.authentication.forms import LoginForm
+
     login_form = LoginForm(request.form)
     if 'login' in request.form:
 
@@ -48,7 +54,19 @@ def login():
         user = Users.query.filter_by(username=username).first()
 
         # Check the password
-        if user and verify_pass(password, user.password):
+        try:
+            valid = user and verify_pass(password, user.password)
+        except HashingBusy:
+            return render_template('accounts/login.html',
+                                   msg='Server busy, please try again',
+                                   form=login_form), 503
+
+        if valid:
+
+            # Store the hash again if the configured cost changed
+            if needs_rehash(user.password):
+                user.password = hash_pass(password)
+                db.session.commit()
 
             login_user(user)
             return redirect(url_for('authentication_blueprint.route_default'))
@@ -66,33 +84,26 @@ def login():
 
 @blueprint.route('/register', methods=['GET', 'POST'])
 def register():
+    # Import here: WTForms is only loaded once an account page is served
+    from apps.authentication.forms import CreateAccountForm
+
     create_account_form = CreateAccountForm(request.form)
     if 'register' in request.form:
 
-        username = request.form['username']
-        email = request.form['email']
-
-        # Check usename exists
-        user = Users.query.filter_by(username=username).first()
-        if user:
+        # One query on both unique columns, the constraints settle concurrent signups
+        try:
+            user, error = register_user(**request.form)
+        except HashingBusy:
             return render_template('accounts/register.html',
-                                   msg='Username already registered',
+                                   msg='Server busy, please try again',
                                    success=False,
-                                   form=create_account_form)
-
-        # Check email exists
-        user = Users.query.filter_by(email=email).first()
-        if user:
+                                   form=create_account_form), 503
+        if error:
             return render_template('accounts/register.html',
-                                   msg='Email already registered',
+                                   msg=error,
                                    success=False,
                                    form=create_account_form)
 
-        # else we can create the user
-        user = Users(**request.form)
-        db.session.add(user)
-        db.session.commit()
-
         # Delete user from session
         logout_user()
         
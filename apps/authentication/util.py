@@ -4,31 +4,162 @@ Copyright (c) 2019 - present AppSeed.us
 """
 
 import os
+import hmac
 import hashlib
 import binascii
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Inspiration -> https://www.vitoshacademy.com/hashing-passwords-in-python/
 
+# Hashes are stored as b'pbkdf2_sha512$<iterations>$<salt>$<hash>'.
+# Older ones are the bare salt (64 chars) + hash, with 100000 iterations
+HASH_PREFIX = 'pbkdf2_sha512'
+LEGACY_ITERATIONS = 100000
 
-def hash_pass(password):
-    """Hash a password for storing."""
 
-    salt = hashlib.sha256(os.urandom(60)).hexdigest().encode('ascii')
+class HashingBusy(Exception):
+    """Raised when too many password hashes are already running or queued"""
+
+
+class PasswordHasher:
+    """
+    Runs PBKDF2 on a bounded thread pool
+    hashlib releases the GIL while it hashes, so the pool uses several cores,
+    and a login burst is capped at workers + max_pending hashes: past that,
+    callers get HashingBusy at once instead of piling up on the workers
+    """
+    def __init__(self, iterations=LEGACY_ITERATIONS, workers=None, max_pending=16):
+        """
+        :param iterations: PBKDF2 rounds of new hashes
+        :param workers: Hashing threads (default: CPU count, 0 hashes inline)
+        :param max_pending: Hashes allowed to wait for a free worker
+        """
+        self.iterations = iterations
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending
+        self._configure()
+
+    def _configure(self):
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _pool(self):
+        """Thread pool of this process, created by its first hash"""
+        # Threads do not survive a fork: one pool per process
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='pbkdf2')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def init_app(self, app):
+        """
+        Load the hashing settings from the Flask app config
+
+        :param app: Flask application instance
+        """
+        self.iterations = app.config.get('PASSWORD_HASH_ITERATIONS', self.iterations)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self._configure()
+
+        @app.errorhandler(HashingBusy)
+        def hashing_busy(error):
+            # Import here to avoid circular imports
+            from flask import jsonify
+            return jsonify({'error': 'Server busy, please try again'}), 503, {'Retry-After': '1'}
+
+    def _run(self, password, salt, iterations):
+        """PBKDF2-SHA512 of a password, on the pool when there is one"""
+        if not self.workers:
+            return _pbkdf2(password, salt, iterations)
+
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            return self._pool().submit(_pbkdf2, password, salt, iterations).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Hash a password for storing."""
+        salt = hashlib.sha256(os.urandom(60)).hexdigest()
+        pwdhash = self._run(password, salt, self.iterations)
+        return '{}${}${}${}'.format(HASH_PREFIX, self.iterations, salt, pwdhash).encode('ascii')
+
+    def hash_many(self, passwords, workers=None):
+        """
+        Hash a list of passwords for storing, on the pool of the logins
+        Each hash holds a slot, and at most `workers` of them run for the
+        list at a time: the logins keep the other workers and queue behind a
+        few list hashes at most. Waits for free slots instead of raising
+        HashingBusy
+
+        :param passwords: Plain text passwords
+        :param workers: Workers hashing for the list at most (default: half of them)
+        """
+        salts = [hashlib.sha256(os.urandom(60)).hexdigest() for _ in passwords]
+        if not self.workers:
+            hashes = [_pbkdf2(password, salt, self.iterations) for password, salt in zip(passwords, salts)]
+        else:
+            hashes = [None] * len(passwords)
+            running = deque()
+            for i, (password, salt) in enumerate(zip(passwords, salts)):
+                if len(running) >= max(1, workers or self.workers // 2):
+                    j, future = running.popleft()
+                    hashes[j] = future.result()
+                self._slots.acquire()
+                future = self._pool().submit(_pbkdf2, password, salt, self.iterations)
+                future.add_done_callback(lambda future: self._slots.release())
+                running.append((i, future))
+            for j, future in running:
+                hashes[j] = future.result()
+        return ['{}${}${}${}'.format(HASH_PREFIX, self.iterations, salt, pwdhash).encode('ascii')
+                for salt, pwdhash in zip(salts, hashes)]
+
+    def verify(self, provided_password, stored_password):
+        """Verify a stored password against one provided by user"""
+        iterations, salt, pwdhash = _split(stored_password)
+        return hmac.compare_digest(self._run(provided_password, salt, iterations), pwdhash)
+
+    def needs_rehash(self, stored_password):
+        """True if the stored hash uses another cost than the configured one"""
+        return _split(stored_password)[0] != self.iterations
+
+
+def _pbkdf2(password, salt, iterations):
     pwdhash = hashlib.pbkdf2_hmac('sha512', password.encode('utf-8'),
-                                  salt, 100000)
-    pwdhash = binascii.hexlify(pwdhash)
-    return (salt + pwdhash)  # return bytes
+                                  salt.encode('ascii'), iterations)
+    return binascii.hexlify(pwdhash).decode('ascii')
+
+
+def _split(stored_password):
+    """(iterations, salt, hash) of a stored password, either format"""
+    stored_password = stored_password.decode('ascii')
+    if stored_password.startswith(HASH_PREFIX + '$'):
+        _, iterations, salt, pwdhash = stored_password.split('$')
+        return int(iterations), salt, pwdhash
+    return LEGACY_ITERATIONS, stored_password[:64], stored_password[64:]
+
+
+password_hasher = PasswordHasher()
+
+
+def hash_pass(password):
+    """Hash a password for storing."""
+    return password_hasher.hash(password)  # return bytes
 
 
 def verify_pass(provided_password, stored_password):
     """Verify a stored password against one provided by user"""
+    return password_hasher.verify(provided_password, stored_password)
 
-    stored_password = stored_password.decode('ascii')
-    salt = stored_password[:64]
-    stored_password = stored_password[64:]
-    pwdhash = hashlib.pbkdf2_hmac('sha512',
-                                  provided_password.encode('utf-8'),
-                                  salt.encode('ascii'),
-                                  100000)
-    pwdhash = binascii.hexlify(pwdhash).decode('ascii')
-    return pwdhash == stored_password
+
+def needs_rehash(stored_password):
+    """True if the password should be hashed again with the current cost"""
+    return password_hasher.needs_rehash(stored_password)
@@ -0,0 +1,192 @@
+# -*- encoding: utf-8 -*-
+"""
+Response Compression
+Compresses text responses (pages, JSON, plain static files) with the best
+encoding the client accepts: brotli and zstd when their packages are
+installed, gzip always
+"""
+
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_MIMETYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/csv', 'text/javascript',
+    'text/event-stream', 'application/javascript', 'application/json', 'application/xml',
+    'image/svg+xml',
+)
+
+
+class GzipEncoder:
+    """gzip (zlib), always available"""
+    def __init__(self, level):
+        # wbits 31: gzip container
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        """Everything compressed so far, decodable by the client right away"""
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    """brotli, with the brotli package"""
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    """zstd, with the zstandard package"""
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+ENCODERS = {
+    'br'  : BrotliEncoder if brotli else None,
+    'zstd': ZstdEncoder if zstandard else None,
+    'gzip': GzipEncoder,
+}
+
+
+class Compression:
+    """
+    Compresses responses in an after_request hook
+    Buffered bodies are compressed at once when they reach min_size,
+    streamed ones chunk by chunk, flushing after each chunk so that
+    streams (e.g. server-sent events) are not held back
+    """
+    def __init__(self, algorithms=('br', 'zstd', 'gzip'), levels=None, min_size=500,
+                 mimetypes=DEFAULT_MIMETYPES):
+        """
+        :param algorithms: Encodings in order of preference
+        :param levels: Compression level per encoding
+        :param min_size: Smallest buffered body worth compressing, in bytes
+        :param mimetypes: Content types that are compressed
+        """
+        self.algorithms = algorithms
+        self.levels = {'br': 4, 'zstd': 3, 'gzip': 6}
+        self.levels.update(levels or {})
+        self.min_size = min_size
+        self.mimetypes = frozenset(mimetypes)
+
+    def init_app(self, app):
+        """
+        Load the compression settings and register the hook
+        Call it before the other after_request hooks are registered:
+        Flask runs them in reverse order, so the compression runs last
+
+        :param app: Flask application instance
+        """
+        self.algorithms = tuple(app.config.get('COMPRESS_ALGORITHMS', self.algorithms))
+        self.levels.update(app.config.get('COMPRESS_LEVELS', {}))
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.mimetypes = frozenset(app.config.get('COMPRESS_MIMETYPES', self.mimetypes))
+
+        # Encodings usable here, in order of preference
+        self._available = tuple(name for name in self.algorithms if ENCODERS.get(name))
+
+        @app.after_request
+        def compress_response(response):
+            return self.compress(response)
+
+    def _negotiate(self):
+        """Best encoding accepted by the client, None for identity"""
+        best, quality = None, 0
+        for name in self._available:
+            accepted = request.accept_encodings[name]
+            if accepted > quality:
+                best, quality = name, accepted
+        return best
+
+    def compress(self, response):
+        """
+        Compress a response in place when it is worth it
+
+        :param response: Flask response
+        """
+        if (request.method == 'HEAD'
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.mimetype not in self.mimetypes
+                or 'Content-Encoding' in response.headers
+                or 'no-transform' in response.headers.get('Cache-Control', '')):
+            return response
+
+        if response.is_streamed:
+            size = response.content_length
+        else:
+            size = response.calculate_content_length()
+        if size is not None and size < self.min_size:
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        name = self._negotiate()
+        if name is None:
+            return response
+
+        encoder = ENCODERS[name](self.levels[name])
+        if response.is_streamed:
+            response.response = self._stream(response.response, encoder)
+            response.direct_passthrough = False
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(encoder.compress(response.get_data()) + encoder.finish())
+
+        response.headers['Content-Encoding'] = name
+
+        # Another representation: a strong validator of the plain body no longer matches it
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+        return response
+
+    @staticmethod
+    def _stream(chunks, encoder):
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                data = encoder.compress(chunk) + encoder.flush()
+                if data:
+                    yield data
+            yield encoder.finish()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+
+compression = Compression()
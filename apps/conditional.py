@@ -0,0 +1,151 @@
+# -*- encoding: utf-8 -*-
+"""
+Conditional Requests
+Weak ETags on rendered pages and API JSON, so that a client revalidating
+unchanged content (If-None-Match) gets a 304 without the body. Pages can
+also declare a per-user cache key, checked before the view renders them
+"""
+
+import hashlib
+import os
+from functools import wraps
+
+from flask import current_app, request, session
+from flask_login import current_user
+
+DEFAULT_MIMETYPES = ('text/html', 'application/json')
+
+# Per-user content: never stored by shared caches, always revalidated by the browser
+REVALIDATE = 'private, no-cache'
+
+# Columns of the user that do not show on the pages
+HIDDEN_USER_FIELDS = frozenset(('password',))
+
+
+def digest(*parts):
+    """Short hash of the parts, as an ETag value"""
+    return hashlib.blake2b('\0'.join(str(part) for part in parts).encode('utf-8'),
+                           digest_size=16).hexdigest()
+
+
+def user_key(**view_args):
+    """
+    Default page cache key: the page, the logged in user and what the pages show of them
+
+    :param view_args: Arguments of the view
+    """
+    if not current_user.is_authenticated:
+        return None
+    fields = sorted((column.key, getattr(current_user, column.key, None))
+                    for column in current_user.__table__.columns
+                    if column.key not in HIDDEN_USER_FIELDS)
+    return digest(request.path, sorted(view_args.items()), fields)
+
+
+class ConditionalRequests:
+    """
+    Adds a weak ETag (hash of the body) to the responses that have none and
+    answers 304 when it matches If-None-Match, in an after_request hook
+    The body is still built; @conditional.etag() avoids that for the pages
+    whose content is known from a key
+    """
+    def __init__(self, mimetypes=DEFAULT_MIMETYPES):
+        """
+        :param mimetypes: Content types that get an ETag
+        """
+        self.mimetypes = frozenset(mimetypes)
+        self.version = ''
+        self.keys_enabled = True
+
+    def init_app(self, app):
+        """
+        Load the settings and register the hook
+        Call it after Compression.init_app: the ETag is taken on the plain body
+
+        :param app: Flask application instance
+        """
+        self.mimetypes = frozenset(app.config.get('ETAG_MIMETYPES', self.mimetypes))
+
+        # Part of every page key, so that a deployment with other templates or assets
+        # invalidates the pages the browsers have
+        self.version = app.config.get('ETAG_VERSION') or self._deployment_version(app)
+
+        # Templates edited while the server runs: only the body ETags are reliable
+        self.keys_enabled = not (app.debug or app.config.get('TEMPLATES_AUTO_RELOAD'))
+
+        @app.after_request
+        def conditional_response(response):
+            return self.make_conditional(response)
+
+    @staticmethod
+    def _deployment_version(app):
+        """Hash of the templates and assets manifest modification times"""
+        mtimes = []
+        paths = [os.path.join(app.root_path, app.template_folder)] if app.template_folder else []
+        for folder in paths:
+            for root, _, files in os.walk(folder):
+                mtimes.extend(os.path.getmtime(os.path.join(root, name)) for name in files)
+        manifest = app.config.get('ASSETS_MANIFEST')
+        if manifest and os.path.isfile(manifest):
+            mtimes.append(os.path.getmtime(manifest))
+        return digest(max(mtimes, default=0), len(mtimes))
+
+    def make_conditional(self, response):
+        """
+        Add a weak ETag to the response and turn it into a 304 when the client has it
+
+        :param response: Flask response
+        """
+        if (request.method not in ('GET', 'HEAD')
+                or response.status_code != 200
+                or response.is_streamed
+                or response.mimetype not in self.mimetypes
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        if 'ETag' not in response.headers:
+            response.set_etag(hashlib.blake2b(response.get_data(), digest_size=16).hexdigest(), weak=True)
+        if 'Cache-Control' not in response.headers:
+            response.headers['Cache-Control'] = REVALIDATE
+        return response.make_conditional(request)
+
+    def etag(self, key=user_key):
+        """
+        Decorator to answer 304 before the view runs when the client has the page
+        The ETag comes from a key that changes whenever the page would, by
+        default the path, the user and their profile
+
+        :param key: Function of the view arguments returning the key, None to skip
+
+        Usage:
+        @blueprint.route('/index')
+        @login_required
+        @conditional.etag()
+        def index():
+            return render_template('home/index.html', segment='index')
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated(*args, **kwargs):
+                value = key(**kwargs) if self.keys_enabled else None
+
+                # Flashed messages are shown once: the page differs from its key
+                if value is None or '_flashes' in session:
+                    return f(*args, **kwargs)
+
+                etag = digest(self.version, value)
+                if request.if_none_match.contains_weak(etag):
+                    response = current_app.response_class(status=304)
+                    response.set_etag(etag, weak=True)
+                    response.headers['Cache-Control'] = REVALIDATE
+                    return response
+
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code == 200:
+                    response.set_etag(etag, weak=True)
+                return response
+            return decorated
+        return decorator
+
+
+conditional = ConditionalRequests()
@@ -17,8 +17,100 @@ class Config(object):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'db.sqlite3')
     SQLALCHEMY_TRACK_MODIFICATIONS = False 
 
+    # Database connection pool: connections kept open, extra ones allowed in bursts,
+    # seconds to wait for a free one, seconds before a connection is replaced
+    # (keep it below the server's idle timeout) and liveness check on checkout
+    DB_POOL_SIZE     = int(os.getenv('DB_POOL_SIZE'    , 5))
+    DB_MAX_OVERFLOW  = int(os.getenv('DB_MAX_OVERFLOW' , 10))
+    DB_POOL_TIMEOUT  = int(os.getenv('DB_POOL_TIMEOUT' , 10))
+    DB_POOL_RECYCLE  = int(os.getenv('DB_POOL_RECYCLE' , 1800))
+    DB_POOL_PRE_PING = (os.getenv('DB_POOL_PRE_PING', 'True') == 'True')
+
     # Assets Management
     ASSETS_ROOT = os.getenv('ASSETS_ROOT', '/static/assets')    
+
+    # Manifest of the fingerprinted assets (gulp assets), used when the file exists
+    ASSETS_MANIFEST = os.getenv('ASSETS_MANIFEST', os.path.join(basedir, 'static', 'assets', 'dist', 'manifest.json'))
+
+    # Response compression: encodings in order of preference (br and zstd need
+    # the brotli and zstandard packages) and smallest body compressed, in bytes
+    COMPRESS_ALGORITHMS = [name.strip() for name in os.getenv('COMPRESS_ALGORITHMS', 'br,zstd,gzip').split(',') if name.strip()]
+    COMPRESS_MIN_SIZE   = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+
+    # Dashboard metrics: seconds between two rollups of the in-process counters
+    # (0: none) and seconds of inactivity ending a session
+    METRICS_FLUSH_INTERVAL  = int(os.getenv('METRICS_FLUSH_INTERVAL' , 10))
+    METRICS_SESSION_TIMEOUT = int(os.getenv('METRICS_SESSION_TIMEOUT', 900))
+
+    # Days the per minute and per hour rollups are kept (the daily ones are never dropped)
+    METRICS_MINUTE_RETENTION_DAYS = int(os.getenv('METRICS_MINUTE_RETENTION_DAYS', 2))
+    METRICS_HOUR_RETENTION_DAYS   = int(os.getenv('METRICS_HOUR_RETENTION_DAYS'  , 90))
+
+    # Live dashboard updates (SSE): seconds between two stats pushes, between two
+    # heartbeats and before a stream is closed (the browser reconnects), frames a
+    # slow client may lag behind and streams per server process
+    LIVE_TICK_INTERVAL      = int(os.getenv('LIVE_TICK_INTERVAL'     , 5))
+    LIVE_HEARTBEAT_INTERVAL = int(os.getenv('LIVE_HEARTBEAT_INTERVAL', 15))
+    LIVE_MAX_DURATION       = int(os.getenv('LIVE_MAX_DURATION'      , 300))
+    LIVE_QUEUE_SIZE         = int(os.getenv('LIVE_QUEUE_SIZE'        , 4))
+    LIVE_MAX_SUBSCRIBERS    = int(os.getenv('LIVE_MAX_SUBSCRIBERS'   , 1000))
+
+    # Bulk user import: rows checked, hashed and inserted together, row errors
+    # listed in the report, and the largest body and row count of the API: a
+    # request hashes every row before it answers, larger files go through the CLI
+    USER_IMPORT_BATCH_SIZE = int(os.getenv('USER_IMPORT_BATCH_SIZE', 1000))
+    USER_IMPORT_MAX_ERRORS = int(os.getenv('USER_IMPORT_MAX_ERRORS', 1000))
+    USER_IMPORT_MAX_BYTES  = int(os.getenv('USER_IMPORT_MAX_BYTES' , 1024 * 1024))
+    USER_IMPORT_MAX_ROWS   = int(os.getenv('USER_IMPORT_MAX_ROWS'  , 200))
+
+    # SQL statements counted per request and endpoint (GET /api/metrics/queries,
+    # X-DB-* headers in debug mode); runs of one statement shape in a request
+    # logged as a possible N+1
+    QUERY_STATS_ENABLED    = (os.getenv('QUERY_STATS_ENABLED', 'True') == 'True')
+    QUERY_STATS_N_PLUS_ONE = int(os.getenv('QUERY_STATS_N_PLUS_ONE', 5))
+
+    # Test mode: EXPLAIN the queries of every request and fail the ones reading
+    # a whole table, except the comma-separated tables allowed to be scanned
+    QUERY_PLAN_CHECK         = (os.getenv('QUERY_PLAN_CHECK', 'False') == 'True')
+    QUERY_PLAN_ALLOWED_SCANS = [table.strip() for table in os.getenv('QUERY_PLAN_ALLOWED_SCANS', '').split(',') if table.strip()]
+
+    # Rendered layout fragments kept in memory ({% cache %} tag), 0 disables it
+    FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv('FRAGMENT_CACHE_MAX_ENTRIES', 1000))
+
+    # Version part of the page ETags, e.g. the release; by default taken
+    # from the templates and assets manifest modification times
+    ETAG_VERSION = os.getenv('ETAG_VERSION')
+
+    # CORS: '*' or a comma-separated list of allowed origins, and how long
+    # browsers may reuse a preflight answer, in seconds
+    CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*')
+    CORS_ORIGINS = CORS_ORIGINS if CORS_ORIGINS == '*' else [origin.strip() for origin in CORS_ORIGINS.split(',') if origin.strip()]
+    CORS_MAX_AGE = int(os.getenv('CORS_MAX_AGE', 7200))
+
+    # API Rate Limiting: fixed-window, sliding-window or token-bucket
+    RATE_LIMIT_STRATEGY     = os.getenv('RATE_LIMIT_STRATEGY'    , 'sliding-window')
+    RATE_LIMIT_WINDOW_MS    = int(os.getenv('RATE_LIMIT_WINDOW_MS'   , 15 * 60 * 1000))
+    RATE_LIMIT_MAX_REQUESTS = int(os.getenv('RATE_LIMIT_MAX_REQUESTS', 100))
+    RATE_LIMIT_SHARDS       = int(os.getenv('RATE_LIMIT_SHARDS'      , 16))
+
+    # 'memory' counts per process, 'sqlite:///<path>' shares the counts between workers
+    RATE_LIMIT_STORAGE      = os.getenv('RATE_LIMIT_STORAGE'     , 'memory')
+
+    # Cap on the clients tracked in memory (least recently seen are dropped first)
+    RATE_LIMIT_MAX_KEYS     = int(os.getenv('RATE_LIMIT_MAX_KEYS'    , 100000))
+
+    # Proxies allowed to set X-Forwarded-For (comma separated networks, '' for none)
+    RATE_LIMIT_TRUSTED_PROXIES = os.getenv('RATE_LIMIT_TRUSTED_PROXIES', '127.0.0.0/8,::1/128')
+
+    # Per-route limits, used as @rate_limiter.limit(policy='<name>')
+    # key 'user' counts per JWT user instead of per IP
+    RATE_LIMIT_POLICIES = {
+        'auth': {'max_requests': int(os.getenv('RATE_LIMIT_AUTH_MAX_REQUESTS', 20)),
+                 'window_ms'   : 15 * 60 * 1000},
+        'user': {'max_requests': int(os.getenv('RATE_LIMIT_USER_MAX_REQUESTS', 300)),
+                 'window_ms'   : 15 * 60 * 1000,
+                 'key'         : 'user'},
+    }
     
     SOCIAL_AUTH_GITHUB  = False
 
@@ -29,6 +121,23 @@ class Config(object):
     if GITHUB_ID and GITHUB_SECRET:
          SOCIAL_AUTH_GITHUB  = True
 
+    # Password hashing: PBKDF2 rounds of new hashes (older ones are upgraded at login),
+    # hashing threads (0 = inline) and hashes allowed to queue before logins get a 503
+    PASSWORD_HASH_ITERATIONS  = int(os.getenv('PASSWORD_HASH_ITERATIONS' , 100000))
+    PASSWORD_HASH_WORKERS     = int(os.getenv('PASSWORD_HASH_WORKERS'    , os.cpu_count() or 1))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 16))
+
+    # Verified JWT cache of the API (0 seconds disables it)
+    JWT_CACHE_TTL         = int(os.getenv('JWT_CACHE_TTL'        , 300))
+    JWT_CACHE_MAX_ENTRIES = int(os.getenv('JWT_CACHE_MAX_ENTRIES', 10000))
+
+    # Comma-separated usernames allowed on the admin API routes (jwt_required(admin=True))
+    ADMIN_USERNAMES = [name.strip() for name in os.getenv('ADMIN_USERNAMES', '').split(',') if name.strip()]
+
+    # Users columns embedded in the API tokens, read by jwt_required(claims=...);
+    # not the password nor user_id, username or the registered JWT claims
+    JWT_PROFILE_CLAIMS = [claim.strip() for claim in os.getenv('JWT_PROFILE_CLAIMS', 'email').split(',') if claim.strip()]
+
 class ProductionConfig(Config):
     DEBUG = False
 
@@ -42,6 +151,7 @@ class ProductionConfig(Config):
     
     # MySQL database
     DB_ENGINE   = os.getenv('DB_ENGINE'   , 'mysql')
+    DB_DRIVER   = os.getenv('DB_DRIVER'   , 'mysqldb')   # mysqldb (mysqlclient) or pymysql
     DB_HOST     = os.getenv('DB_HOST'     , 'localhost')
     DB_PORT     = os.getenv('DB_PORT'     , 3306)
     DB_NAME     = os.getenv('DB_NAME'     , 'appseed_db')
@@ -50,8 +160,9 @@ class ProductionConfig(Config):
 
     if DB_ENGINE == 'mysql':
         try:
-            SQLALCHEMY_DATABASE_URI = '{}://{}:{}@{}:{}/{}'.format(
+            SQLALCHEMY_DATABASE_URI = '{}+{}://{}:{}@{}:{}/{}'.format(
                 DB_ENGINE,
+                DB_DRIVER,
                 DB_USERNAME,
                 DB_PASS,
                 DB_HOST,
@@ -65,6 +176,9 @@ class ProductionConfig(Config):
 class DebugConfig(Config):
     DEBUG = True
 
+    # Plain assets, so edits show up without a rebuild
+    ASSETS_MANIFEST = os.getenv('ASSETS_MANIFEST')
+
 
 # Load all possible configurations
 config_dict = {
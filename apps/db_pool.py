@@ -0,0 +1,145 @@
+# -*- encoding: utf-8 -*-
+"""
+Database connection pool
+Builds the SQLAlchemy engine options from the DB_POOL_* settings and
+keeps checkout statistics (connections in use, overflow, wait time)
+"""
+
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+class MonitoredQueuePool(QueuePool):
+    """
+    QueuePool that records how long callers wait for a connection
+    The wait includes opening a new (overflow) connection, which is
+    what a request pays for when the pool is empty
+    """
+    # Log as SQLAlchemy's pool, not under the app's (debug level) logger
+    _sqla_logger_namespace = 'sqlalchemy.pool.impl.QueuePool'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+def engine_options(uri, pool_size=5, max_overflow=10, timeout=10, recycle=1800, pre_ping=True):
+    """
+    SQLAlchemy engine options for a database URI
+
+    :param uri: SQLALCHEMY_DATABASE_URI
+    :param pool_size: Connections kept open
+    :param max_overflow: Extra connections opened during bursts
+    :param timeout: Seconds to wait for a connection before failing
+    :param recycle: Seconds after which a connection is replaced
+    :param pre_ping: Test connections on checkout, replacing the dead ones
+    """
+    url = make_url(uri)
+
+    # In-memory SQLite lives in a single connection, keep Flask-SQLAlchemy's StaticPool
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {}
+
+    options = {
+        'poolclass'    : MonitoredQueuePool,
+        'pool_size'    : pool_size,
+        'max_overflow' : max_overflow,
+        'pool_timeout' : timeout,
+        'pool_recycle' : recycle,
+        'pool_pre_ping': pre_ping,
+    }
+
+    # Pooled SQLite connections move between threads
+    if url.get_backend_name() == 'sqlite':
+        options['connect_args'] = {'check_same_thread': False}
+
+    return options
+
+
+class PoolMonitor:
+    """
+    Applies the pool settings to the app and reports the pool state
+    """
+    def init_app(self, app):
+        """
+        Build SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* settings
+        Options set explicitly in SQLALCHEMY_ENGINE_OPTIONS take priority
+
+        :param app: Flask application instance
+        """
+        options = engine_options(
+            app.config['SQLALCHEMY_DATABASE_URI'],
+            pool_size=app.config.get('DB_POOL_SIZE', 5),
+            max_overflow=app.config.get('DB_MAX_OVERFLOW', 10),
+            timeout=app.config.get('DB_POOL_TIMEOUT', 10),
+            recycle=app.config.get('DB_POOL_RECYCLE', 1800),
+            pre_ping=app.config.get('DB_POOL_PRE_PING', True),
+        )
+        options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    def stats(self, engine):
+        """
+        Current state of the engine's pool
+
+        :param engine: SQLAlchemy engine
+        """
+        pool = engine.pool
+        data = {'pool': type(pool).__name__}
+
+        if isinstance(pool, QueuePool):
+            data.update({
+                'size'       : pool.size(),
+                'checked_in' : pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow'   : max(pool.overflow(), 0),
+                'max_overflow': pool._max_overflow,
+            })
+
+        if isinstance(pool, MonitoredQueuePool):
+            with pool._stats_lock:
+                data.update({
+                    'checkouts'  : pool.checkouts,
+                    'timeouts'   : pool.timeouts,
+                    'wait_avg_ms': round(pool.wait_total / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+                    'wait_max_ms': round(pool.wait_max * 1000, 3),
+                })
+
+        return data
+
+    def warm_up(self, engine):
+        """
+        Open the pool's steady-state connections
+
+        :param engine: SQLAlchemy engine
+        """
+        size = engine.pool.size() if isinstance(engine.pool, QueuePool) else 1
+        connections = [engine.connect() for _ in range(size)]
+        for connection in connections:
+            connection.close()
+
+
+pool_monitor = PoolMonitor()
@@ -0,0 +1,145 @@
+# -*- encoding: utf-8 -*-
+"""
+Template Fragment Cache
+Jinja `{% cache %}` tag keeping the rendered HTML of the layout includes
+(sidebar, navigation, footer ...) that only depend on a few variables
+"""
+
+import itertools
+import threading
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from jinja2.runtime import Undefined
+from markupsafe import Markup
+
+# Incremented each time a template with cached fragments is compiled
+_generations = itertools.count()
+
+
+class FragmentCache:
+    """
+    Bounded (LRU) cache of rendered template fragments
+    Keyed on the fragment name, its template and the variables given to the
+    tag. Compiling a template again (auto reload after an edit) drops its
+    fragments, and its new code uses a new generation in its keys
+    """
+    def __init__(self, max_entries=1000):
+        """
+        :param max_entries: Maximum number of cached fragments (0 disables the cache)
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def init_app(self, app):
+        """
+        Load the cache settings and add the {% cache %} tag to the app templates
+
+        :param app: Flask application instance
+        """
+        self.max_entries = app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', self.max_entries)
+        self.clear()
+
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+
+    def fetch(self, name, template, generation, key, render):
+        """
+        Cached HTML of a fragment, rendered and stored on a miss
+
+        :param name: Fragment name, the hit rates are counted per name
+        :param template: Template of the fragment
+        :param generation: Compilation of the template
+        :param key: Variables the fragment depends on
+        :param render: Function rendering the fragment
+        """
+        if self.max_entries <= 0:
+            return render()
+
+        key = (name, template, generation) + tuple(None if isinstance(part, Undefined) else part
+                                                  for part in key)
+        with self.lock:
+            counters = self.counters.setdefault(name, [0, 0])
+            html = self.entries.get(key)
+            if html is not None:
+                self.entries.move_to_end(key)
+                counters[0] += 1
+                return html
+            counters[1] += 1
+
+        # Rendered outside the lock, two threads may render the same fragment at once
+        html = Markup(render())
+        with self.lock:
+            self.entries[key] = html
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return html
+
+    def invalidate_template(self, template):
+        """Drop the fragments of a template"""
+        with self.lock:
+            for key in [key for key in self.entries if key[1] == template]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.counters.clear()
+
+    def stats(self):
+        """Hits, misses and hit rate of each fragment"""
+        with self.lock:
+            fragments = {}
+            for name, (hits, misses) in self.counters.items():
+                total = hits + misses
+                fragments[name] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_rate': round(hits / total, 4) if total else None,
+                }
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'fragments': fragments,
+            }
+
+
+class FragmentCacheExtension(Extension):
+    """
+    {% cache name, var1, var2 ... %} ... {% endcache %}
+
+    Usage:
+    {% cache 'sidebar', segment, current_user.get_id() %}
+        ...
+    {% endcache %}
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        name = parser.parse_expression()
+        key = []
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+
+        # The template is being compiled: the fragments of its previous version are stale
+        cache = getattr(self.environment, 'fragment_cache', None)
+        if cache is not None:
+            cache.invalidate_template(parser.name)
+
+        args = [name, nodes.Const(parser.name), nodes.Const(next(_generations)), nodes.List(key)]
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, name, template, generation, key, caller):
+        cache = getattr(self.environment, 'fragment_cache', None)
+        if cache is None:
+            return caller()
+        return cache.fetch(name, template, generation, key, caller)
+
+
+fragment_cache = FragmentCache()
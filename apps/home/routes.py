@@ -8,6 +8,7 @@ from flask import render_template, request, redirect, url_for, flash, jsonify, c
 from flask_login import login_required, current_user
 from jinja2 import TemplateNotFound
 from apps import db
+from apps.conditional import conditional
 from apps.authentication.models import Users
 import os
 from werkzeug.utils import secure_filename
@@ -16,12 +17,14 @@ import uuid
 
 @blueprint.route('/index')
 @login_required
+@conditional.etag()
 def index():
     return render_template('home/index.html', segment='index')
 
 
 @blueprint.route('/profile', methods=['GET'])
 @login_required
+@conditional.etag()
 def profile():
     return render_template('home/user.html', segment='user')
 
@@ -80,6 +83,7 @@ def upload_profile_image():
 
 @blueprint.route('/<template>')
 @login_required
+@conditional.etag()
 def route_template(template):
     try:
         if not template.endswith('.html'):
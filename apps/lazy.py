@@ -0,0 +1,44 @@
+# -*- encoding: utf-8 -*-
+"""
+Deferred imports
+Keeps modules that are not needed to serve most requests out of the app
+startup (gunicorn workers, serverless cold starts)
+"""
+
+import importlib.util
+import sys
+
+# Modules the serving path must not import at startup, checked by benchmarks/startup.py:
+# migration tooling (flask db only), Github OAuth (SOCIAL_AUTH_GITHUB only),
+# the account forms (login and register pages) and PyJWT (first API token)
+DEFERRED_MODULES = (
+    'alembic',
+    'flask_migrate',
+    'flask_dance',
+    'requests_oauthlib',
+    'wtforms',
+    'flask_wtf',
+    'email_validator',
+    'jwt',
+)
+
+
+def lazy_import(name):
+    """
+    Module object that runs the import on first attribute access
+
+    Usage:
+    jwt = lazy_import('jwt')
+
+    :param name: Absolute module name
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,202 @@
+# -*- encoding: utf-8 -*-
+"""
+Live Dashboard Updates
+Server-Sent Events channel: the stats are computed once per tick and the
+same frame is pushed to every connected dashboard, instead of each one
+polling /api/dashboard/stats
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Frames a slow client can be behind before the oldest are dropped; only the
+# last one is sent when it catches up, a stats frame replaces the previous ones
+QUEUE_SIZE = 4
+
+
+class Subscriber:
+    """
+    Connected dashboard: bounded queue of the frames it has not received yet
+    The queue drops its oldest frame when full, so a client that cannot keep
+    up (slow network, paused tab) holds a few frames at most
+    """
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.frames = deque(maxlen=queue_size)
+        self.ready = threading.Event()
+        self.dropped = 0
+
+    def push(self, frame):
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+        self.ready.set()
+
+    def wait(self, timeout):
+        """Frames received since the last call, [] after timeout seconds without any"""
+        if not self.frames:
+            self.ready.wait(timeout)
+        self.ready.clear()
+        frames = []
+        while self.frames:
+            frames.append(self.frames.popleft())
+        return frames
+
+
+class LiveUpdates:
+    """
+    Fan-out of the dashboard stats to the subscribed connections
+    A thread of each server process builds the stats frame every tick while
+    it has subscribers, and pushes it when the stats changed; the streams
+    send a heartbeat comment when idle, so proxies keep the connection and a
+    client gone away is noticed
+    """
+    def __init__(self, tick=5, heartbeat=15, queue_size=QUEUE_SIZE, max_subscribers=1000,
+                 max_duration=300):
+        """
+        :param tick: Seconds between two stats computations
+        :param heartbeat: Seconds of silence after which a stream sends a heartbeat
+        :param queue_size: Frames a slow client can be behind before the oldest are dropped
+        :param max_subscribers: Streams a server process accepts (503 beyond)
+        :param max_duration: Seconds after which a stream ends and the browser reconnects,
+                             so workers can be restarted gracefully
+        """
+        self.tick_interval = tick
+        self.heartbeat = heartbeat
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.max_duration = max_duration
+        self.app = None
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.frame = None
+        self.stats = None
+        self.sequence = 0
+        self._thread_pid = None
+
+    def init_app(self, app):
+        """
+        Load the live updates settings
+
+        :param app: Flask application instance
+        """
+        self.app = app
+        self.tick_interval = app.config.get('LIVE_TICK_INTERVAL', self.tick_interval)
+        self.heartbeat = app.config.get('LIVE_HEARTBEAT_INTERVAL', self.heartbeat)
+        self.queue_size = app.config.get('LIVE_QUEUE_SIZE', self.queue_size)
+        self.max_subscribers = app.config.get('LIVE_MAX_SUBSCRIBERS', self.max_subscribers)
+        self.max_duration = app.config.get('LIVE_MAX_DURATION', self.max_duration)
+        with self.lock:
+            self.subscribers = set()
+        self.frame = None
+        self.stats = None
+
+    def subscribe(self):
+        """New Subscriber, None when the process has max_subscribers already"""
+        subscriber = Subscriber(self.queue_size)
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                return None
+            self.subscribers.add(subscriber)
+
+        # Started by the first subscriber of each server process
+        if self.tick_interval and self._thread_pid != os.getpid():
+            self._start_ticker()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def _start_ticker(self):
+        """Start a thread computing and pushing the stats every tick"""
+        with self.lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+
+        def ticker():
+            while True:
+                time.sleep(self.tick_interval)
+                if not self.subscribers:
+                    continue
+                try:
+                    with self.app.app_context():
+                        self.tick()
+                except Exception:
+                    self.app.logger.exception('Live updates tick failed')
+
+        thread = threading.Thread(target=ticker, daemon=True)
+        thread.start()
+
+    def compute(self):
+        """Dashboard stats, as served by /api/dashboard/stats"""
+        # Import here to avoid circular imports
+        from apps.metrics import metrics
+        return metrics.snapshot()
+
+    def tick(self):
+        """
+        Compute the stats and push them to every subscriber if they changed
+        Needs an application context
+        """
+        stats = self.compute()
+        if stats == self.stats and self.frame is not None:
+            return False
+
+        # Serialized once for all the connections
+        self.sequence += 1
+        self.frame = 'id: {}\nevent: stats\ndata: {}\n\n'.format(
+            self.sequence, json.dumps(stats, separators=(',', ':'))).encode('utf-8')
+        self.stats = stats
+
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.push(self.frame)
+        return True
+
+    def stream(self, subscriber):
+        """
+        Body of an SSE response: the current stats right away, then the
+        changes, with heartbeats in between
+
+        :param subscriber: Subscriber of the connection, unsubscribed when it ends
+        """
+        try:
+            # Browsers reconnect after this many milliseconds when the stream ends
+            yield 'retry: {}\n\n'.format(self.tick_interval * 1000).encode('utf-8')
+
+            if self.frame is None:
+                with self.app.app_context():
+                    self.tick()
+            sent = self.frame
+            yield sent
+
+            ends = time.monotonic() + self.max_duration
+            while time.monotonic() < ends:
+                frames = subscriber.wait(min(self.heartbeat, max(ends - time.monotonic(), 0)))
+                if not frames:
+                    yield b': heartbeat\n\n'
+                elif frames[-1] is not sent:
+                    # The last frame holds the current stats, the older ones are stale
+                    subscriber.dropped += sum(frame is not sent for frame in frames[:-1])
+                    sent = frames[-1]
+                    yield sent
+        finally:
+            self.unsubscribe(subscriber)
+
+    def summary(self):
+        """Subscribers of this process and the frames dropped for slow ones"""
+        with self.lock:
+            subscribers = list(self.subscribers)
+        return {
+            'subscribers': len(subscribers),
+            'dropped_frames': sum(subscriber.dropped for subscriber in subscribers),
+            'sequence': self.sequence,
+        }
+
+
+live_updates = LiveUpdates()
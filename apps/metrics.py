@@ -0,0 +1,304 @@
+# -*- encoding: utf-8 -*-
+"""
+Dashboard Metrics
+Requests, signups and active sessions are counted in process, then rolled
+up by a background thread into per minute, hour and day aggregates and
+running totals, which /api/dashboard/stats reads instead of scanning Users
+"""
+
+import datetime
+import os
+import threading
+import time
+
+from flask import request, session
+from sqlalchemy import and_, event, func
+from sqlalchemy.exc import IntegrityError
+
+from apps import db
+
+# Bucket sizes of the rollups, in seconds
+GRANULARITIES = (
+    ('minute', 60),
+    ('hour'  , 3600),
+    ('day'   , 86400),
+)
+
+# Counted events, the metrics of the rollups
+COUNTERS = ('requests', 'signups', 'deletions')
+
+# How long the rollups of each granularity are kept by default, in seconds (None: forever)
+RETENTION = {
+    'minute': 2 * 86400,
+    'hour'  : 90 * 86400,
+    'day'   : None,
+}
+
+
+class MetricRollup(db.Model):
+    """Value of a metric over a minute, hour or day"""
+
+    __tablename__ = 'metric_rollups'
+
+    metric      = db.Column(db.String(32), primary_key=True)
+    granularity = db.Column(db.String(8), primary_key=True)
+    bucket      = db.Column(db.DateTime, primary_key=True)
+    value       = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class MetricTotal(db.Model):
+    """Running total or current value of a metric"""
+
+    __tablename__ = 'metric_totals'
+
+    name       = db.Column(db.String(32), primary_key=True)
+    value      = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+
+class ActiveSession(db.Model):
+    """Last request of a logged in user, shared by the server processes"""
+
+    __tablename__ = 'metric_sessions'
+
+    user_id   = db.Column(db.Integer, primary_key=True)
+    last_seen = db.Column(db.DateTime, nullable=False, index=True)
+
+
+def bucket_start(timestamp, size):
+    """UTC start of the bucket of the given size containing timestamp"""
+    return datetime.datetime.utcfromtimestamp(int(timestamp // size * size))
+
+
+def upsert(connection, table, key, update, insert=None):
+    """
+    Update the row of a table with the given key, insert it when there is none
+    Return False, without inserting, when there is none and insert is False
+
+    :param key: Primary key columns and values
+    :param update: Values set on the existing row
+    :param insert: Values of a new row, those of update by default
+    """
+    where = and_(*(table.c[name] == value for name, value in key.items()))
+    if connection.execute(table.update().where(where).values(**update)).rowcount:
+        return True
+    if insert is False:
+        return False
+    connection.execute(table.insert().values(**key, **(update if insert is None else insert)))
+    return True
+
+
+class Metrics:
+    """
+    Metrics recorder and rollup
+    Recording is a dict update under a lock. Every flush_interval seconds a
+    thread of the server process moves the counts to the database in one
+    transaction, updates the totals and reads back the snapshot the
+    dashboard serves, so polling it runs no query
+    """
+    def __init__(self, flush_interval=10, session_timeout=900):
+        """
+        :param flush_interval: Seconds between two rollups (0: only on flush() calls)
+        :param session_timeout: Seconds after their last request a session stops being active
+        """
+        self.flush_interval = flush_interval
+        self.session_timeout = session_timeout
+        self.retention = dict(RETENTION)
+        self.app = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = {}
+        self.sessions = {}
+        self._snapshot = None
+        self._snapshot_time = 0
+        self._thread_pid = None
+        self._listening = False
+
+    def init_app(self, app):
+        """
+        Load the metrics settings and record the requests and signups
+
+        :param app: Flask application instance
+        """
+        self.app = app
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', self.flush_interval)
+        self.session_timeout = app.config.get('METRICS_SESSION_TIMEOUT', self.session_timeout)
+        self.retention = dict(RETENTION)
+        for granularity in ('minute', 'hour'):
+            days = app.config.get('METRICS_{}_RETENTION_DAYS'.format(granularity.upper()))
+            if days:
+                self.retention[granularity] = days * 86400
+        with self.lock:
+            self.pending = {}
+            self.sessions = {}
+        self._snapshot = None
+
+        @app.before_request
+        def record_request():
+            if request.endpoint == 'static':
+                return
+            self.incr('requests')
+
+            # Logged in through the session cookie (flask_login), which Flask already loaded
+            user_id = session.get('_user_id')
+            if user_id is not None:
+                # Under the lock flush() swaps the dict with: a write to the old
+                # one would change it while the flush thread iterates it
+                with self.lock:
+                    self.sessions[user_id] = time.time()
+
+            # Started by the first request of each server process, not by the
+            # gunicorn master that preloads the app
+            if self.flush_interval and self._thread_pid != os.getpid():
+                self._start_flush_thread()
+
+        if not self._listening:
+            # Import here to avoid circular imports
+            from apps.authentication.models import Users
+
+            def count_signup(mapper, connection, user):
+                self.incr('signups')
+
+            def count_deletion(mapper, connection, user):
+                self.incr('deletions')
+
+            event.listen(Users, 'after_insert', count_signup)
+            event.listen(Users, 'after_delete', count_deletion)
+            self._listening = True
+
+    def incr(self, metric, value=1):
+        """
+        Count an event now
+
+        :param metric: Metric name, e.g. 'requests'
+        :param value: Number of events
+        """
+        key = (metric, int(time.time() // 60))
+        with self.lock:
+            self.pending[key] = self.pending.get(key, 0) + value
+
+    def _start_flush_thread(self):
+        """Start a thread rolling the counters up periodically"""
+        with self.lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+
+        def rollup():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    with self.app.app_context():
+                        self.flush()
+                except Exception:
+                    self.app.logger.exception('Metrics rollup failed')
+
+        thread = threading.Thread(target=rollup, daemon=True)
+        thread.start()
+
+    def flush(self):
+        """
+        Roll the pending counts up into the database and refresh the snapshot
+        Needs an application context
+        """
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                sessions, self.sessions = self.sessions, {}
+
+            try:
+                try:
+                    self._write(pending, sessions)
+                except IntegrityError:
+                    # Another process inserted the same row first: its insert is now an update
+                    self._write(pending, sessions)
+            except Exception:
+                # Counted again on the next flush
+                with self.lock:
+                    for key, value in pending.items():
+                        self.pending[key] = self.pending.get(key, 0) + value
+                    for user_id, seen in sessions.items():
+                        self.sessions.setdefault(user_id, seen)
+                raise
+
+            self._snapshot = self._read()
+            self._snapshot_time = time.time()
+
+    def _write(self, pending, sessions):
+        now = time.time()
+        rollups = MetricRollup.__table__
+        totals = MetricTotal.__table__
+        active_sessions = ActiveSession.__table__
+
+        # Counts per bucket of each granularity
+        values = {}
+        for (metric, minute), value in pending.items():
+            for granularity, size in GRANULARITIES:
+                key = (metric, granularity, bucket_start(minute * 60, size))
+                values[key] = values.get(key, 0) + value
+
+        users = sum(value for (metric, _), value in pending.items() if metric == 'signups')
+        users -= sum(value for (metric, _), value in pending.items() if metric == 'deletions')
+
+        updated_at = datetime.datetime.utcfromtimestamp(now)
+        with db.engine.begin() as connection:
+            for (metric, granularity, bucket), value in values.items():
+                upsert(connection, rollups, {'metric': metric, 'granularity': granularity, 'bucket': bucket},
+                       {'value': rollups.c.value + value}, {'value': value})
+
+            if not upsert(connection, totals, {'name': 'users'},
+                          {'value': totals.c.value + users, 'updated_at': updated_at}, insert=False):
+                # Not seeded by the migration (db.create_all): counted once, the count
+                # includes the pending signups
+                from apps.authentication.models import Users
+                count = connection.execute(func.count(Users.__table__.c.id).select()).scalar()
+                connection.execute(totals.insert().values(name='users', value=count, updated_at=updated_at))
+
+            # Active sessions: the last request of every user, shared by the processes
+            for user_id, seen in sessions.items():
+                upsert(connection, active_sessions, {'user_id': int(user_id)},
+                       {'last_seen': datetime.datetime.utcfromtimestamp(seen)})
+            connection.execute(active_sessions.delete().where(
+                active_sessions.c.last_seen < datetime.datetime.utcfromtimestamp(now - self.session_timeout)))
+            active = connection.execute(func.count(active_sessions.c.user_id).select()).scalar()
+            upsert(connection, totals, {'name': 'active_sessions'}, {'value': active, 'updated_at': updated_at})
+
+            # Old fine-grained rollups
+            for granularity, retention in self.retention.items():
+                if retention:
+                    connection.execute(rollups.delete().where(
+                        (rollups.c.granularity == granularity)
+                        & (rollups.c.bucket < datetime.datetime.utcfromtimestamp(now - retention))))
+
+    def _read(self):
+        # On its own connection: the request session may have pending changes
+        totals = MetricTotal.__table__
+        rollups = MetricRollup.__table__
+        with db.engine.connect() as connection:
+            values = dict(connection.execute(
+                totals.select().with_only_columns([totals.c.name, totals.c.value])
+                .where(totals.c.name.in_(('users', 'active_sessions')))).fetchall())
+            today = connection.execute(
+                rollups.select().with_only_columns([rollups.c.value])
+                .where((rollups.c.metric == 'requests') & (rollups.c.granularity == 'day')
+                       & (rollups.c.bucket == bucket_start(time.time(), 86400)))).scalar()
+        return {
+            'total_users': values.get('users', 0),
+            'active_sessions': values.get('active_sessions', 0),
+            'daily_requests': today or 0,
+        }
+
+    def snapshot(self):
+        """
+        Dashboard values as of the last rollup: total users, active sessions
+        and requests of the day (UTC)
+        Needs an application context
+        """
+        if self._snapshot is None or time.time() - self._snapshot_time > max(self.flush_interval, 1) * 2:
+            # No rollup thread in this process (yet), read the aggregates directly
+            self._snapshot = self._read()
+            self._snapshot_time = time.time()
+        return self._snapshot
+
+
+metrics = Metrics()
@@ -0,0 +1,128 @@
+# -*- encoding: utf-8 -*-
+"""
+Query Plan Check
+Test mode (QUERY_PLAN_CHECK): every query a request runs is EXPLAINed once,
+and one reading a whole table raises FullScan, so a lookup without an index
+fails the request instead of slowing down with the table
+"""
+
+import re
+import threading
+
+from flask import has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CHECKED = ('SELECT', 'UPDATE', 'DELETE')
+
+
+class FullScan(Exception):
+    """Raised in check mode when a request query reads a whole table"""
+    def __init__(self, statement, tables, plan):
+        super().__init__('Full scan of {} by: {}\nPlan:\n  {}'.format(
+            ', '.join(sorted(tables)), statement, '\n  '.join(plan)))
+        self.statement = statement
+        self.tables = tables
+        self.plan = plan
+
+
+def full_scans(dialect, rows, columns):
+    """
+    Tables an EXPLAIN output reads entirely
+
+    :param dialect: SQLAlchemy dialect name
+    :param rows: EXPLAIN result rows
+    :param columns: Column names of the rows
+    """
+    tables = set()
+    for row in rows:
+        row = dict(zip(columns, row))
+        if dialect == 'sqlite':
+            # SCAN <table> [USING [COVERING] INDEX ...]: every row or index entry
+            match = re.match(r'SCAN (?:TABLE )?("?)(\w+)\1', row['detail'])
+            if match and match.group(2) != 'CONSTANT':
+                tables.add(match.group(2))
+        elif dialect == 'postgresql':
+            match = re.search(r'Seq Scan on "?(\w+)"?', row['QUERY PLAN'])
+            if match:
+                tables.add(match.group(1))
+        elif dialect in ('mysql', 'mariadb'):
+            if row.get('type') == 'ALL' and row.get('table'):
+                tables.add(row['table'])
+    return tables
+
+
+def explain(dialect, connection, statement, parameters):
+    """(plan lines, tables read entirely) of a statement, on a DBAPI connection"""
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    cursor = connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    plan = [' | '.join(str(value) for value in row) for row in rows]
+    return plan, full_scans(dialect, rows, columns)
+
+
+class QueryPlanChecker:
+    """
+    EXPLAINs the queries run by requests, once per statement, and raises
+    FullScan for the ones reading a whole table that is not allowed to be
+    scanned (tables known to stay small)
+    PostgreSQL plans small tables with sequential scans: check on SQLite or
+    MySQL, or with enable_seqscan off
+    """
+    def __init__(self, allowed_tables=()):
+        """
+        :param allowed_tables: Tables that may be read entirely
+        """
+        self.enabled = False
+        self.allowed_tables = set(allowed_tables)
+        self.lock = threading.Lock()
+        self.plans = {}
+        self._listening = False
+
+    def init_app(self, app):
+        """
+        Load the check settings, listen to the queries in check mode
+
+        :param app: Flask application instance
+        """
+        self.enabled = app.config.get('QUERY_PLAN_CHECK', False)
+        self.allowed_tables = set(app.config.get('QUERY_PLAN_ALLOWED_SCANS', self.allowed_tables))
+        with self.lock:
+            self.plans = {}
+        if self.enabled and not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            self._listening = True
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not self.enabled or executemany or not has_request_context():
+            return
+        if not statement.lstrip()[:6].upper().startswith(CHECKED):
+            return
+
+        checked = self.plans.get(statement)
+        if checked is None:
+            dialect = conn.dialect.name
+            checked = explain(dialect, conn.connection, statement, parameters)
+            with self.lock:
+                self.plans[statement] = checked
+
+        plan, tables = checked
+        scanned = tables - self.allowed_tables
+        if scanned:
+            raise FullScan(statement, scanned, plan)
+
+    def report(self):
+        """Statements checked so far with their plan, full scans first"""
+        with self.lock:
+            plans = list(self.plans.items())
+        return sorted(({'statement': statement, 'plan': plan, 'full_scans': sorted(tables - self.allowed_tables)}
+                       for statement, (plan, tables) in plans),
+                      key=lambda item: not item['full_scans'])
+
+
+query_plans = QueryPlanChecker()
@@ -0,0 +1,167 @@
+# -*- encoding: utf-8 -*-
+"""
+Query Statistics
+Counts the SQL statements of each request, their time and the duplicates,
+aggregated per endpoint; a statement shape repeated within a request (the
+same query with other parameters, typically in a loop) is reported as a
+possible N+1
+"""
+
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Placeholder lists of IN clauses, whatever their length: "(?, ?, ?)", "(%(id_1)s, ...)"
+PLACEHOLDERS = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)')
+
+# N+1 shapes kept per endpoint
+MAX_SHAPES = 10
+
+
+def shape(statement):
+    """Statement without its parameter values and list lengths, on one line"""
+    return ' '.join(PLACEHOLDERS.sub('(?)', statement).split())
+
+
+class RequestQueries:
+    """Statements of the current request"""
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+        self.shapes = Counter()
+
+    @property
+    def duplicates(self):
+        """Statements run again with the same parameters"""
+        return sum(count - 1 for count in self.statements.values())
+
+    def repeated(self, threshold):
+        """Shapes run threshold times or more, most repeated first"""
+        return [(statement, count) for statement, count in self.shapes.most_common() if count >= threshold]
+
+
+class QueryStats:
+    """
+    Listens to the statements run inside requests
+    In debug mode the response carries X-DB-Queries, X-DB-Time (ms),
+    X-DB-Duplicates and a Server-Timing entry for the browser tools
+    """
+    def __init__(self, n_plus_one=5):
+        """
+        :param n_plus_one: Runs of one statement shape in a request reported as a possible N+1
+        """
+        self.enabled = True
+        self.n_plus_one = n_plus_one
+        self.headers = False
+        self.app = None
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self._listening = False
+
+    def init_app(self, app):
+        """
+        Load the settings, listen to the statements and report them after each request
+
+        :param app: Flask application instance
+        """
+        self.app = app
+        self.enabled = app.config.get('QUERY_STATS_ENABLED', self.enabled)
+        self.n_plus_one = app.config.get('QUERY_STATS_N_PLUS_ONE', self.n_plus_one)
+        self.headers = app.debug
+        with self.lock:
+            self.endpoints = {}
+        if not self.enabled:
+            return
+
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+            self._listening = True
+
+        app.after_request(self.record)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # The start goes with the statement's execution context: a statement
+        # that fails gets no after_cursor_execute, and leaves nothing behind
+        if self.enabled and context is not None and has_request_context():
+            context._query_stats_start = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_query_stats_start', None)
+        if start is None or not has_request_context():
+            return
+        elapsed = time.perf_counter() - start
+
+        queries = g.get('_queries')
+        if queries is None:
+            queries = g._queries = RequestQueries()
+        queries.count += 1
+        queries.time += elapsed
+        if not executemany:
+            queries.statements[statement, repr(parameters)] += 1
+        queries.shapes[shape(statement)] += 1
+
+    def record(self, response):
+        """after_request hook: add the request to its endpoint, the debug headers"""
+        queries = g.pop('_queries', None) or RequestQueries()
+        endpoint = request.endpoint or 'unknown'
+        repeated = queries.repeated(self.n_plus_one)
+        for statement, count in repeated:
+            self.app.logger.warning('Possible N+1 query in %s: %d x %s', endpoint, count, statement)
+
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                'requests': 0, 'queries': 0, 'max_queries': 0, 'time': 0.0,
+                'duplicates': 0, 'n_plus_one': 0, 'shapes': Counter(),
+            })
+            stats['requests'] += 1
+            stats['queries'] += queries.count
+            stats['max_queries'] = max(stats['max_queries'], queries.count)
+            stats['time'] += queries.time
+            stats['duplicates'] += queries.duplicates
+            if repeated:
+                stats['n_plus_one'] += 1
+                for statement, count in repeated:
+                    if statement in stats['shapes'] or len(stats['shapes']) < MAX_SHAPES:
+                        stats['shapes'][statement] = max(stats['shapes'][statement], count)
+
+        if self.headers:
+            response.headers['X-DB-Queries'] = str(queries.count)
+            response.headers['X-DB-Time'] = '{:.2f}'.format(queries.time * 1000)
+            response.headers['X-DB-Duplicates'] = str(queries.duplicates)
+            response.headers.add('Server-Timing', 'db;dur={:.2f};desc="{} queries"'.format(
+                queries.time * 1000, queries.count))
+        return response
+
+    def summary(self):
+        """Per endpoint: requests, queries (average, max), time and the N+1 shapes, busiest first"""
+        with self.lock:
+            endpoints = {name: dict(stats, shapes=stats['shapes'].most_common())
+                         for name, stats in self.endpoints.items()}
+        return {
+            'n_plus_one_threshold': self.n_plus_one,
+            'endpoints': {
+                name: {
+                    'requests': stats['requests'],
+                    'queries': stats['queries'],
+                    'queries_avg': round(stats['queries'] / stats['requests'], 2),
+                    'queries_max': stats['max_queries'],
+                    'time_ms': round(stats['time'] * 1000, 3),
+                    'time_avg_ms': round(stats['time'] * 1000 / stats['requests'], 3),
+                    'duplicates': stats['duplicates'],
+                    'n_plus_one_requests': stats['n_plus_one'],
+                    'n_plus_one': [{'statement': statement, 'max_repeats': count}
+                                   for statement, count in stats['shapes']],
+                }
+                for name, stats in sorted(endpoints.items(), key=lambda item: -item[1]['queries'])
+            },
+        }
+
+
+query_stats = QueryStats()
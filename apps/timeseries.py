@@ -0,0 +1,248 @@
+# -*- encoding: utf-8 -*-
+"""
+Time Series
+Chart data from the metric rollups: an in-process columnar cache of the
+buckets (one array of timestamps, one of values per metric and
+granularity) and downsampling to the number of points a chart can show
+"""
+
+import datetime
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from apps import db
+from apps.metrics import GRANULARITIES, MetricRollup, bucket_start, metrics
+
+METHODS = ('lttb', 'minmax')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def epoch(bucket):
+    """Timestamp of a naive UTC datetime"""
+    return int((bucket - EPOCH).total_seconds())
+
+
+def lttb(times, values, points):
+    """
+    Largest-Triangle-Three-Buckets: keeps the points that shape the line,
+    the first and last ones always
+
+    :param times: Timestamps, ascending
+    :param values: Values of the timestamps
+    :param points: Number of points to keep (3 or more)
+    """
+    length = len(times)
+    if points >= length or points < 3:
+        return list(times), list(values)
+
+    sampled_times, sampled_values = [times[0]], [values[0]]
+    every = (length - 2) / (points - 2)
+    a = 0
+    for i in range(points - 2):
+        # Average of the next bucket, the third point of the triangles
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, length)
+        count = next_end - next_start
+        avg_time = sum(times[next_start:next_end]) / count
+        avg_value = sum(values[next_start:next_end]) / count
+
+        # Point of this bucket making the largest triangle with the last kept one
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        a_time, a_value = times[a], values[a]
+        largest, chosen = -1, start
+        for j in range(start, end):
+            area = abs((a_time - avg_time) * (values[j] - a_value)
+                       - (a_time - times[j]) * (avg_value - a_value))
+            if area > largest:
+                largest, chosen = area, j
+
+        sampled_times.append(times[chosen])
+        sampled_values.append(values[chosen])
+        a = chosen
+
+    sampled_times.append(times[-1])
+    sampled_values.append(values[-1])
+    return sampled_times, sampled_values
+
+
+def minmax(times, values, points):
+    """
+    Min/max bucketing: the lowest and highest point of each of points / 2
+    buckets, in time order, so that no peak is lost
+
+    :param times: Timestamps, ascending
+    :param values: Values of the timestamps
+    :param points: Number of points to keep (2 or more)
+    """
+    length = len(times)
+    if points >= length or points < 2:
+        return list(times), list(values)
+
+    buckets = points // 2
+    sampled_times, sampled_values = [], []
+    for i in range(buckets):
+        start, end = length * i // buckets, length * (i + 1) // buckets
+        chunk = values[start:end]
+        low = start + chunk.index(min(chunk))
+        high = start + chunk.index(max(chunk))
+        for j in sorted({low, high}):
+            sampled_times.append(times[j])
+            sampled_values.append(values[j])
+    return sampled_times, sampled_values
+
+
+class Column:
+    """Buckets of one metric and granularity, from `since` to the last rollup"""
+    def __init__(self):
+        self.times = array('q')
+        self.values = array('q')
+        self.since = None
+        self.refreshed = 0
+
+
+class SeriesStore:
+    """
+    Columnar cache of the metric rollups
+    A range is loaded from the database the first time it is asked for, the
+    buckets after the last one loaded once per rollup interval; the buckets
+    past the retention are dropped with their rollups
+    """
+    def __init__(self, refresh_interval=10):
+        """
+        :param refresh_interval: Seconds the recent buckets are served before being read again
+        """
+        self.refresh_interval = refresh_interval
+        self.columns = {}
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        """
+        Load the store settings
+
+        :param app: Flask application instance
+        """
+        self.refresh_interval = app.config.get('METRICS_FLUSH_INTERVAL', self.refresh_interval)
+        with self.lock:
+            self.columns = {}
+
+    def _fetch(self, metric, granularity, start, end=None):
+        rollups = MetricRollup.__table__
+        query = (rollups.select().with_only_columns([rollups.c.bucket, rollups.c.value])
+                 .where((rollups.c.metric == metric) & (rollups.c.granularity == granularity)
+                        & (rollups.c.bucket >= bucket_start(start, 1))))
+        if end is not None:
+            query = query.where(rollups.c.bucket < bucket_start(end, 1))
+        with db.engine.connect() as connection:
+            rows = connection.execute(query.order_by(rollups.c.bucket)).fetchall()
+        return array('q', (epoch(bucket) for bucket, _ in rows)), array('q', (value for _, value in rows))
+
+    def _column(self, metric, granularity, start):
+        """
+        Column holding the buckets from start, loaded and refreshed as needed
+        The database is read outside the lock, the rows are applied only if no
+        other request changed the column meanwhile
+        """
+        now = time.time()
+        with self.lock:
+            column = self.columns.setdefault((metric, granularity), Column())
+
+        while True:
+            with self.lock:
+                since = column.since
+            if since is not None and start >= since:
+                break
+
+            # First load, or an older range than loaded so far
+            times, values = self._fetch(metric, granularity, start, since)
+            with self.lock:
+                if column.since == since:
+                    column.times = times + column.times
+                    column.values = values + column.values
+                    column.since = start
+                    if since is None:
+                        column.refreshed = now
+                    break
+            # Loaded by another request meanwhile: load again before what it holds
+
+        with self.lock:
+            refreshed = column.refreshed
+            since = column.times[-1] if column.times else column.since
+
+        if now - refreshed > self.refresh_interval:
+            # The last bucket loaded may have grown since: read again from it
+            times, values = self._fetch(metric, granularity, since)
+            with self.lock:
+                # Skipped when another request refreshed the column meanwhile
+                if column.refreshed == refreshed:
+                    keep = bisect_left(column.times, since)
+                    del column.times[keep:]
+                    del column.values[keep:]
+                    column.times.extend(times)
+                    column.values.extend(values)
+                    column.refreshed = now
+
+        with self.lock:
+            retention = metrics.retention.get(granularity)
+            if retention and column.times and column.times[0] < now - retention:
+                drop = bisect_left(column.times, now - retention)
+                del column.times[:drop]
+                del column.values[:drop]
+                column.since = max(column.since, now - retention)
+
+        return column
+
+    @staticmethod
+    def granularity(start, end, points):
+        """
+        Coarsest granularity still giving `points` buckets over the range,
+        the finest one kept that long when none does
+        """
+        now = time.time()
+        kept = [(name, size) for name, size in GRANULARITIES
+                if not metrics.retention.get(name) or start >= now - metrics.retention[name]]
+        chosen = kept[0][0]
+        for name, size in kept:
+            if (end - start) / size >= points:
+                chosen = name
+        return chosen
+
+    def query(self, metric, start, end, points=300, method='lttb'):
+        """
+        Values of a metric between two timestamps, downsampled to at most `points`
+        Buckets without any event are absent (zero)
+
+        :param metric: Metric name, see apps.metrics.COUNTERS
+        :param start: First timestamp (seconds)
+        :param end: Last timestamp (seconds)
+        :param points: Maximum number of points returned
+        :param method: 'lttb' (shape of the line) or 'minmax' (peaks)
+        """
+        granularity = self.granularity(start, end, points)
+
+        # From the bucket containing start
+        size = dict(GRANULARITIES)[granularity]
+        start = int(start // size * size)
+
+        column = self._column(metric, granularity, start)
+        with self.lock:
+            first = bisect_left(column.times, start)
+            last = bisect_right(column.times, end)
+            times, values = column.times[first:last], column.values[first:last]
+
+        sample = lttb if method == 'lttb' else minmax
+        times, values = sample(times, values, points)
+        return {
+            'metric': metric,
+            'granularity': granularity,
+            'start': start,
+            'end': int(end),
+            'method': method,
+            't': times,
+            'v': values,
+        }
+
+
+series_store = SeriesStore()
@@ -0,0 +1,23 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+import os
+from   uvicorn.middleware.wsgi import WSGIMiddleware
+
+threads = int(os.getenv('ASGI_THREADS', 32))
+
+# A live stream (/api/dashboard/stream) holds a thread as long as it is open:
+# at most half of them, set before the app reads its config
+os.environ['LIVE_MAX_SUBSCRIBERS'] = str(min(int(os.getenv('LIVE_MAX_SUBSCRIBERS', threads)), threads // 2))
+
+from run import app as wsgi_app
+
+# ASGI entry point, next to the WSGI one (run:app):
+#   $ uvicorn asgi:app --host 0.0.0.0 --port 5005
+#
+# The event loop accepts and parses every connection, while the Flask app
+# runs on a pool of ASGI_THREADS threads: a slow request (a password hash,
+# an upload) holds one thread instead of the whole server
+app = WSGIMiddleware(wsgi_app, workers=threads)
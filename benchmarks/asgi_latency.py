@@ -0,0 +1,126 @@
+# -*- encoding: utf-8 -*-
+"""
+WSGI vs ASGI latency benchmark
+
+Starts the app under gunicorn (run:app, one sync worker as in
+gunicorn-cfg.py) and under uvicorn (asgi:app), then opens 500 concurrent
+connections to /api/status and reports p50/p99 latency. With --logins,
+that many clients loop on /api/auth/login at the same time, to show how a
+slow request affects everyone else.
+
+Usage:
+$ python benchmarks/asgi_latency.py [--connections 500] [--requests 4] [--logins 0]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+SERVERS = {
+    'wsgi': ['gunicorn', '--workers', '1', '--bind', '127.0.0.1:{port}', 'run:app'],
+    'asgi': ['uvicorn', '--port', '{port}', '--log-level', 'warning', 'asgi:app'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start(mode, port):
+    """Start a server and wait until it accepts connections"""
+    env = dict(os.environ, DEBUG='True', RATE_LIMIT_MAX_REQUESTS=str(10 ** 9),
+               RATE_LIMIT_AUTH_MAX_REQUESTS=str(10 ** 9))
+    command = [arg.format(port=port) for arg in SERVERS[mode]]
+    server = subprocess.Popen(command, cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('{} server did not start'.format(mode))
+
+
+async def request(port, method, path, body=b''):
+    """One HTTP/1.1 request on a new connection, return its status code"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    headers = 'Host: localhost\r\nConnection: close\r\nContent-Length: {}\r\n'.format(len(body))
+    if body:
+        headers += 'Content-Type: application/json\r\n'
+    writer.write('{} {} HTTP/1.1\r\n{}\r\n'.format(method, path, headers).encode('ascii') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b' ', 2)[1])
+
+
+async def load(port, connections, requests, logins):
+    latencies, errors = [], 0
+    done = asyncio.Event()
+    credentials = json.dumps({'username': 'bench', 'password': 'benchpass'}).encode()
+
+    async def client():
+        nonlocal errors
+        for _ in range(requests):
+            start = time.perf_counter()
+            try:
+                if await request(port, 'GET', '/api/status') != 200:
+                    errors += 1
+            except OSError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    async def login():
+        while not done.is_set():
+            try:
+                await request(port, 'POST', '/api/auth/login', credentials)
+            except OSError:
+                pass
+
+    await request(port, 'POST', '/api/auth/register', json.dumps(
+        {'username': 'bench', 'email': 'bench@example.com', 'password': 'benchpass'}).encode())
+    slow = [asyncio.ensure_future(login()) for _ in range(logins)]
+    await asyncio.gather(*[client() for _ in range(connections)])
+    done.set()
+    await asyncio.gather(*slow)
+
+    latencies.sort()
+    return (latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connections', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=4, help='requests per connection')
+    parser.add_argument('--logins', type=int, default=0, help='concurrent clients looping on login')
+    args = parser.parse_args()
+
+    print('{} connections x {} requests to /api/status, {} login clients\n'.format(
+        args.connections, args.requests, args.logins))
+    print('{:<6} {:>10} {:>10} {:>8}'.format('mode', 'p50 ms', 'p99 ms', 'errors'))
+    for mode in SERVERS:
+        port = free_port()
+        server = start(mode, port)
+        try:
+            p50, p99, errors = asyncio.run(load(port, args.connections, args.requests, args.logins))
+        finally:
+            server.terminate()
+            server.wait()
+        print('{:<6} {:>10.1f} {:>10.1f} {:>8}'.format(mode, p50, p99, errors))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
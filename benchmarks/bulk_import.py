@@ -0,0 +1,77 @@
+# -*- encoding: utf-8 -*-
+"""
+Bulk user import benchmark
+
+Creates the same number of users either:
+
+- one by one: a POST /api/auth/register per user (two existence queries,
+  a hash on the request thread, a commit each)
+- in bulk: one POST /api/users/import of the users as JSON Lines (a query,
+  a parallel hashing round, an executemany and a commit per batch)
+
+Reports the users per second of each and the time 50,000 users would take.
+PBKDF2 dominates both: lower --iterations for a quick run.
+
+Usage:
+$ python benchmarks/bulk_import.py [--users 2000] [--iterations 100000] [--batch-size 1000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from common import api_token, make_app
+
+from apps import db
+from apps.authentication.models import Users
+
+ORG_SIZE = 50000
+
+
+def users(prefix, count):
+    for i in range(count):
+        yield {'username': '{}{}'.format(prefix, i), 'email': '{}{}@example.com'.format(prefix, i),
+               'password': 'password{}'.format(i)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--iterations', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    # The import is for admins: the benchmark user is one. The request limits
+    # are lifted to measure the import itself
+    app = make_app(PASSWORD_HASH_ITERATIONS=args.iterations, USER_IMPORT_BATCH_SIZE=args.batch_size,
+                   ADMIN_USERNAMES=['bench'], USER_IMPORT_MAX_ROWS=args.users, USER_IMPORT_MAX_BYTES=10 ** 9)
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + api_token(client)}
+
+    start = time.perf_counter()
+    for user in users('single', args.users):
+        client.post('/api/auth/register', json=user)
+    single = args.users / (time.perf_counter() - start)
+
+    body = ''.join(json.dumps(user) + '\n' for user in users('bulk', args.users)).encode('utf-8')
+    start = time.perf_counter()
+    report = client.post('/api/users/import', data=body, headers=headers,
+                         content_type='application/x-ndjson').get_json()
+    bulk = args.users / (time.perf_counter() - start)
+
+    with app.app_context():
+        created = Users.query.count() - 1
+        db.session.remove()
+    print('{:,} users each way, PBKDF2 {:,} iterations, {} CPUs ({:,} created, {} import errors)\n'.format(
+        args.users, args.iterations, os.cpu_count(), created, report['failed']))
+    print('{:<12} {:>12} {:>16}'.format('', 'users/s', '50k users'))
+    for label, rate in (('one by one', single), ('bulk import', bulk)):
+        print('{:<12} {:>12,.0f} {:>14.1f} s'.format(label, rate, ORG_SIZE / rate))
+
+
+if __name__ == '__main__':
+    main()
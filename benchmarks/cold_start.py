@@ -0,0 +1,98 @@
+# -*- encoding: utf-8 -*-
+"""
+Cold start benchmark
+
+Starts fresh Python processes, like new gunicorn workers or serverless
+instances, and times the app start and its first request:
+
+- create_all: the former before_first_request hook, where every new
+  process checked (and created) the schema on its first request
+- migrated: the schema was upgraded once at deploy time, workers skip it
+
+The database is the SQLite stand-in of db_pool.py, with a network
+round-trip per statement as with MySQL.
+
+Usage:
+$ python benchmarks/cold_start.py [--runs 10] [--latency-ms 2]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def child(mode, database, latency_ms):
+    """Runs in the fresh process: print the timings as JSON"""
+    start = time.perf_counter()
+    from common import make_app
+    from db_pool import RemoteConnection
+    from apps import db
+    imported = time.perf_counter()
+
+    RemoteConnection.latency = latency_ms / 1000
+    app = make_app(database, SQLALCHEMY_ENGINE_OPTIONS={
+        'connect_args': {'check_same_thread': False, 'factory': RemoteConnection}})
+    if mode == 'create_all':
+        app.before_first_request(db.create_all)
+    created = time.perf_counter()
+
+    app.test_client().get('/api/status')
+    done = time.perf_counter()
+
+    print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                      'first_request': done - created}))
+
+
+def deploy(database):
+    """Upgrade a new database to the latest migration, return the seconds it took"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from common import make_app
+    from flask_migrate import upgrade
+    from apps import register_migrations
+
+    app = make_app(database)
+    register_migrations(app)
+    start = time.perf_counter()
+    with app.app_context():
+        upgrade()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=2)
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'DATABASE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.child[0], args.child[1], args.latency_ms)
+
+    database = os.path.join(tempfile.mkdtemp(), 'db.sqlite3')
+    print('deploy: flask db upgrade of a new database took {:.1f} ms (once)\n'.format(deploy(database) * 1000))
+
+    print('{} cold starts per mode, {} ms round-trip\n'.format(args.runs, args.latency_ms))
+    print('{:<12} {:>12} {:>14} {:>18} {:>18}'.format(
+        'mode', 'import ms', 'create_app ms', 'first request ms', 'first request max'))
+    for mode in ('create_all', 'migrated'):
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', mode, database,
+                 '--latency-ms', str(args.latency_ms)],
+                check=True, capture_output=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        first = sorted(run['first_request'] * 1000 for run in runs)
+        print('{:<12} {:>12.1f} {:>14.1f} {:>18.1f} {:>18.1f}'.format(
+            mode,
+            sum(run['import'] for run in runs) / len(runs) * 1000,
+            sum(run['create_app'] for run in runs) / len(runs) * 1000,
+            first[len(first) // 2], first[-1]))
+
+
+if __name__ == '__main__':
+    main()
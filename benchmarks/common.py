@@ -0,0 +1,63 @@
+# -*- encoding: utf-8 -*-
+"""
+Helpers shared by the benchmarks that drive the Flask app
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from apps import create_app, db
+from apps.config import config_dict
+
+
+def make_app(database=None, **settings):
+    """
+    Build the Debug app on a throw-away SQLite file, without rate limits
+    getting in the way of the measurements
+
+    :param database: Existing SQLite file to use instead, its schema is left as is
+    :param settings: Config overrides
+    """
+    class BenchmarkConfig(config_dict['Debug']):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + (database or os.path.join(tempfile.mkdtemp(), 'db.sqlite3'))
+        RATE_LIMIT_MAX_REQUESTS = 10 ** 9
+        RATE_LIMIT_POLICIES = {
+            'auth': {'max_requests': 10 ** 9},
+            'user': {'max_requests': 10 ** 9, 'key': 'user'},
+        }
+
+    for key, value in settings.items():
+        setattr(BenchmarkConfig, key, value)
+
+    app = create_app(BenchmarkConfig)
+    if database is None:
+        with app.app_context():
+            db.create_all()
+    return app
+
+
+def api_token(client, username='bench', password='benchpass'):
+    """Register a user through the API and return a JWT for it"""
+    client.post('/api/auth/register', json={
+        'username': username, 'email': username + '@example.com', 'password': password})
+    response = client.post('/api/auth/login', json={'username': username, 'password': password})
+    return response.get_json()['token']
+
+
+def measure(fn, requests):
+    """Call fn requests times, return (requests/s, p50 ms, p99 ms)"""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(requests):
+        began = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return (requests / elapsed,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000)
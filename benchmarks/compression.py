@@ -0,0 +1,58 @@
+# -*- encoding: utf-8 -*-
+"""
+Response compression benchmark
+
+Requests rendered dashboard pages, API JSON and a plain stylesheet with
+each encoding the server supports (br and zstd need the brotli and
+zstandard packages) and reports the bytes sent and the CPU time per
+response, against identity.
+
+Usage:
+$ python benchmarks/compression.py [--requests 200]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from common import api_token, make_app
+
+from apps.compression import ENCODERS
+
+PATHS = ('/index', '/tables', '/api/dashboard/stats', '/api/status', '/static/assets/css/nucleo-icons.css')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    app = make_app()
+    client = app.test_client()
+    token = api_token(client)
+    client.post('/login', data={'username': 'bench', 'password': 'benchpass', 'login': ''})
+    headers = {'Authorization': 'Bearer ' + token}
+
+    encodings = ['identity'] + [name for name, encoder in ENCODERS.items() if encoder]
+    print('{:<38} {:<9} {:>10} {:>8} {:>12} {:>12}'.format(
+        'path', 'encoding', 'bytes', 'ratio', 'CPU ms/resp', 'overhead ms'))
+    for path in PATHS:
+        baseline = None
+        for encoding in encodings:
+            headers['Accept-Encoding'] = encoding
+            size = len(client.get(path, headers=headers).data)
+            start = time.process_time()
+            for _ in range(args.requests):
+                client.get(path, headers=headers).data
+            cpu = (time.process_time() - start) / args.requests * 1000
+            if baseline is None:
+                baseline = (size, cpu)
+            print('{:<38} {:<9} {:>10,} {:>8.2f} {:>12.3f} {:>12.3f}'.format(
+                path, encoding, size, size / baseline[0], cpu, cpu - baseline[1]))
+
+
+if __name__ == '__main__':
+    main()
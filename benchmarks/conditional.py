@@ -0,0 +1,73 @@
+# -*- encoding: utf-8 -*-
+"""
+Conditional requests benchmark
+
+A polling client (dashboard auto-refresh, monitoring script) requests the
+same pages and API JSON over and over. Compares, per poll, the bytes
+received and the latency of:
+
+- full: no validator sent, the full body every time
+- etag: If-None-Match with the last ETag, 304 while the content is unchanged
+- etag (body only): the same with the page cache keys disabled, so the
+  pages are rendered before their body hash is compared
+
+Usage:
+$ python benchmarks/conditional.py [--polls 300]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from common import api_token, make_app, measure
+
+from apps.conditional import conditional
+
+PATHS = ('/index', '/tables', '/api/dashboard/stats', '/api/profile')
+
+
+def poll(client, path, headers, polls, revalidate):
+    """Return (bytes per poll, p50 ms, p99 ms)"""
+    etag = {}
+    received = []
+
+    def request():
+        sent = dict(headers)
+        if revalidate and etag:
+            sent['If-None-Match'] = etag['value']
+        response = client.get(path, headers=sent)
+        if response.status_code == 200:
+            etag['value'] = response.headers.get('ETag')
+        received.append(len(response.data))
+
+    _, p50, p99 = measure(request, polls)
+    return sum(received) / len(received), p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--polls', type=int, default=300)
+    args = parser.parse_args()
+
+    # Production-like: the page keys are disabled in debug mode
+    app = make_app(DEBUG=False)
+    client = app.test_client()
+    token = api_token(client)
+    client.post('/login', data={'username': 'bench', 'password': 'benchpass', 'login': ''})
+    headers = {'Authorization': 'Bearer ' + token, 'Accept-Encoding': 'gzip'}
+
+    print('{:<24} {:<18} {:>12} {:>10} {:>10}'.format('path', 'client', 'bytes/poll', 'p50 ms', 'p99 ms'))
+    for path in PATHS:
+        clients = [('full', False, True), ('etag', True, True)]
+        if not path.startswith('/api'):
+            clients.append(('etag (body only)', True, False))
+        for label, revalidate, keys in clients:
+            conditional.keys_enabled = keys
+            received, p50, p99 = poll(client, path, headers, args.polls, revalidate)
+            print('{:<24} {:<18} {:>12,.0f} {:>10.3f} {:>10.3f}'.format(path, label, received, p50, p99))
+
+
+if __name__ == '__main__':
+    main()
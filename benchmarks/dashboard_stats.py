@@ -0,0 +1,86 @@
+# -*- encoding: utf-8 -*-
+"""
+Dashboard stats benchmark
+
+Fills the Users table with a million rows (SQLite file) and compares what
+a poll of /api/dashboard/stats costs:
+
+- count: the live Users.query.count() the endpoint used to run
+- aggregates: the precomputed totals and rollups read from the database
+- snapshot: the values kept by the rollup thread, no query at all
+
+then the endpoint itself, and the cost of a rollup (flush) of the counters.
+
+Usage:
+$ python benchmarks/dashboard_stats.py [--users 1000000] [--requests 200]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from common import api_token, make_app, measure
+
+from apps import db
+from apps.authentication.models import Users
+from apps.metrics import metrics
+
+
+def fill(database, users):
+    """Insert the users straight through sqlite3, hashing a million passwords would take hours"""
+    connection = sqlite3.connect(database)
+    connection.executemany(
+        'INSERT INTO Users (username, email, password) VALUES (?, ?, ?)',
+        (('user{}'.format(i), 'user{}@example.com'.format(i), b'x') for i in range(users)))
+    connection.commit()
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'db.sqlite3')
+    app = make_app(database=database, METRICS_FLUSH_INTERVAL=0)
+    with app.app_context():
+        db.create_all()
+    start = time.perf_counter()
+    fill(database, args.users)
+    print('{:,} users inserted in {:.1f} s\n'.format(args.users, time.perf_counter() - start))
+
+    client = app.test_client()
+    token = api_token(client)
+    headers = {'Authorization': 'Bearer ' + token}
+
+    with app.app_context():
+        start = time.perf_counter()
+        metrics.flush()
+        print('first rollup (counts the users once): {:.1f} ms'.format((time.perf_counter() - start) * 1000))
+
+        for _ in range(1000):
+            metrics.incr('requests')
+        start = time.perf_counter()
+        metrics.flush()
+        print('rollup of 1000 requests: {:.1f} ms\n'.format((time.perf_counter() - start) * 1000))
+
+        print('{:<24} {:>10} {:>10} {:>10}'.format('read', 'req/s', 'p50 ms', 'p99 ms'))
+        for label, read in (('count', Users.query.count),
+                            ('aggregates', metrics._read),
+                            ('snapshot', metrics.snapshot)):
+            rate, p50, p99 = measure(read, args.requests)
+            print('{:<24} {:>10.0f} {:>10.3f} {:>10.3f}'.format(label, rate, p50, p99))
+
+    rate, p50, p99 = measure(lambda: client.get('/api/dashboard/stats', headers=headers), args.requests)
+    print('{:<24} {:>10.0f} {:>10.3f} {:>10.3f}'.format('GET /api/dashboard/stats', rate, p50, p99))
+    print('\n' + str(client.get('/api/dashboard/stats', headers=headers).get_json()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+# -*- encoding: utf-8 -*-
+"""
+Database connection pool load test
+
+Runs the app's engine against a SQLite "MySQL stand-in": every statement
+pays a network round-trip and the server drops connections left idle
+longer than its wait_timeout. Two scenarios:
+
+- burst: many threads query at once, for several pool sizes; reports
+  throughput, checkout wait times, timeouts and peak connections in use
+- stale: connections sit idle past the server timeout, then serve queries;
+  reports the failed queries without and with pre-ping / recycle
+
+Usage:
+$ python benchmarks/db_pool.py [--threads 64] [--queries 50] [--latency-ms 2]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from common import make_app
+from sqlalchemy import exc, text
+
+from apps import db
+from apps.db_pool import pool_monitor
+
+
+class RemoteConnection(sqlite3.Connection):
+    """sqlite3 connection that behaves like one to a remote server"""
+    latency = 0.002
+    idle_timeout = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_used = time.monotonic()
+
+    def cursor(self, *args):
+        # The server closed the connection while it was idle
+        if self.idle_timeout and time.monotonic() - self.last_used > self.idle_timeout:
+            self.close()
+        self.last_used = time.monotonic()
+        time.sleep(self.latency)
+        return super().cursor(*args)
+
+
+def stand_in(**settings):
+    """App whose engine talks to the stand-in server"""
+    settings.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+        'connect_args': {'check_same_thread': False, 'factory': RemoteConnection}})
+    return make_app(**settings)
+
+
+def query(engine):
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1')).scalar()
+
+
+def burst(args, pool_size, max_overflow, timeout):
+    """Return (queries/s, pool stats, peak connections in use)"""
+    app = stand_in(DB_POOL_SIZE=pool_size, DB_MAX_OVERFLOW=max_overflow, DB_POOL_TIMEOUT=timeout)
+    with app.app_context():
+        engine = db.engine
+        engine.dispose()
+        pool_monitor.warm_up(engine)
+
+    peak = [0]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], engine.pool.checkedout())
+            time.sleep(0.0005)
+
+    def client():
+        for _ in range(args.queries):
+            try:
+                query(engine)
+            except exc.TimeoutError:
+                pass
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    threads = [threading.Thread(target=client) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+
+    stats = pool_monitor.stats(engine)
+    engine.dispose()
+    return args.threads * args.queries / elapsed, stats, peak[0]
+
+
+def stale(pre_ping, recycle, idle_timeout=0.5, queries=20):
+    """Return the queries that failed after the pool sat idle"""
+    app = stand_in(DB_POOL_SIZE=5, DB_POOL_PRE_PING=pre_ping, DB_POOL_RECYCLE=recycle)
+    with app.app_context():
+        engine = db.engine
+        engine.dispose()
+        pool_monitor.warm_up(engine)
+
+    RemoteConnection.idle_timeout = idle_timeout
+    try:
+        time.sleep(idle_timeout * 1.5)
+        failed = 0
+        for _ in range(queries):
+            try:
+                query(engine)
+            except exc.DBAPIError:
+                failed += 1
+    finally:
+        RemoteConnection.idle_timeout = None
+        engine.dispose()
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=2)
+    args = parser.parse_args()
+    RemoteConnection.latency = args.latency_ms / 1000
+
+    print('burst: {} threads x {} queries, {} ms round-trip\n'.format(
+        args.threads, args.queries, args.latency_ms))
+    print('{:<22} {:>10} {:>10} {:>12} {:>12} {:>9} {:>6}'.format(
+        'pool', 'queries/s', 'timeouts', 'wait avg ms', 'wait max ms', 'overflow', 'peak'))
+    for pool_size, max_overflow, timeout in ((5, 0, 0.5), (5, 10, 10), (20, 40, 10)):
+        rate, stats, peak = burst(args, pool_size, max_overflow, timeout)
+        print('{:<22} {:>10,.0f} {:>10} {:>12.2f} {:>12.2f} {:>9} {:>6}'.format(
+            '{}+{} (timeout {}s)'.format(pool_size, max_overflow, timeout), rate, stats['timeouts'],
+            stats['wait_avg_ms'], stats['wait_max_ms'], stats['max_overflow'], peak))
+
+    print('\nstale: queries after the server dropped idle connections\n')
+    print('{:<30} {:>8}'.format('settings', 'failed'))
+    for label, pre_ping, recycle in (('no pre-ping, no recycle', False, -1),
+                                     ('recycle below idle timeout', False, 0.4),
+                                     ('pre-ping', True, -1)):
+        print('{:<30} {:>8}'.format(label, stale(pre_ping, recycle)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# -*- encoding: utf-8 -*-
+"""
+Template fragment cache benchmark
+
+Renders the dashboard pages served by route_template for a logged in user,
+with the layout fragments (sidebar, navigation, footer, fixed plugin,
+scripts) rendered every time and served from the fragment cache, and
+reports the page latency and the hit rate of each fragment.
+
+Usage:
+$ python benchmarks/fragment_cache.py [--requests 300]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from common import make_app, measure
+
+from apps.fragments import fragment_cache
+
+PAGES = ('/tables', '/icons', '/map', '/notifications', '/typography', '/user')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    print('{:<16} {:<10} {:>10} {:>10} {:>10}'.format('page', 'fragments', 'req/s', 'p50 ms', 'p99 ms'))
+    for label, max_entries in (('rendered', 0), ('cached', 1000)):
+        app = make_app(FRAGMENT_CACHE_MAX_ENTRIES=max_entries)
+        client = app.test_client()
+        client.post('/register', data={'username': 'bench', 'email': 'bench@example.com',
+                                       'password': 'benchpass', 'register': ''})
+        client.post('/login', data={'username': 'bench', 'password': 'benchpass', 'login': ''})
+
+        for page in PAGES:
+            client.get(page)
+            rate, p50, p99 = measure(lambda: client.get(page).data, args.requests)
+            print('{:<16} {:<10} {:>10.0f} {:>10.3f} {:>10.3f}'.format(page, label, rate, p50, p99))
+
+    stats = fragment_cache.stats()
+    print('\n{} fragments cached'.format(stats['entries']))
+    for name, counters in sorted(stats['fragments'].items()):
+        print('  {:<14} hit rate {:.1%}'.format(name, counters['hit_rate']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# -*- encoding: utf-8 -*-
+"""
+Verified JWT cache benchmark
+
+Polls JWT protected endpoints that load the user, with the token cache
+disabled (JWT_CACHE_TTL=0) and enabled, and counts the SQL statements each
+run issues:
+- /bench/user: a plain @jwt_required route, added by the benchmark
+- /api/profile with a token issued without the profile claims (as before
+  JWT_PROFILE_CLAIMS), which falls back to the user lookup
+
+The claims-only routes with current tokens never query the database and
+are left out: the cache makes no difference to them.
+
+Usage:
+$ python benchmarks/jwt_cache.py [--requests 5000]
+"""
+
+import argparse
+
+from flask import jsonify
+from sqlalchemy import event
+
+from common import make_app, api_token, measure
+from apps import db
+from apps.api_security import jwt_required
+
+
+def bench_user(current_user):
+    """A route that needs the user, at /bench/user"""
+    return jsonify({'id': current_user.id, 'username': current_user.username})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    print('{:<22} {:<10} {:>10} {:>9} {:>9} {:>12}'.format(
+        'endpoint', 'cache', 'req/s', 'p50 ms', 'p99 ms', 'SQL/request'))
+
+    for ttl in (0, 300):
+        # Tokens without the profile claims
+        app = make_app(JWT_CACHE_TTL=ttl, JWT_PROFILE_CLAIMS=[])
+        app.add_url_rule('/bench/user', 'bench_user', jwt_required(bench_user))
+        client = app.test_client()
+        headers = {'Authorization': 'Bearer ' + api_token(client)}
+
+        statements = []
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', lambda *a: statements.append(1))
+
+        for url in ('/bench/user', '/api/profile'):
+            del statements[:]
+            rate, p50, p99 = measure(lambda: client.get(url, headers=headers), args.requests)
+            print('{:<22} {:<10} {:>10,.0f} {:>9.3f} {:>9.3f} {:>12.2f}'.format(
+                url, 'on' if ttl else 'off', rate, p50, p99, len(statements) / args.requests))
+
+
+if __name__ == '__main__':
+    main()
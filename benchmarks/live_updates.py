@@ -0,0 +1,115 @@
+# -*- encoding: utf-8 -*-
+"""
+Live dashboard updates benchmark
+
+1,000 dashboards kept up to date every 5 seconds, either:
+
+- polling: each one requests /api/dashboard/stats every tick
+- SSE: each one holds a /api/dashboard/stream connection; the stats are
+  computed once per tick and the same frame is written to every stream
+  (connections are reopened every LIVE_MAX_DURATION seconds, their setup
+  is counted over that period)
+
+Reports the server CPU time and the database queries per second of each.
+
+Usage:
+$ python benchmarks/live_updates.py [--dashboards 1000] [--tick 5] [--ticks 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from common import api_token, make_app
+from sqlalchemy import event
+
+from apps import db
+from apps.live import live_updates
+from apps.metrics import metrics
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.increment)
+
+    def increment(self, *args):
+        self.count += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dashboards', type=int, default=1000)
+    parser.add_argument('--tick', type=int, default=5)
+    parser.add_argument('--ticks', type=int, default=20)
+    args = parser.parse_args()
+
+    # No ticker thread: the ticks are driven here
+    app = make_app(LIVE_TICK_INTERVAL=0, LIVE_MAX_SUBSCRIBERS=args.dashboards,
+                   METRICS_FLUSH_INTERVAL=args.tick)
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + api_token(client)}
+    with app.app_context():
+        queries = QueryCounter(db.engine)
+
+    def changed_stats():
+        # Traffic between two ticks: the stats change every tick (outside the measures)
+        with app.app_context():
+            metrics.incr('requests', 100)
+            metrics.flush()
+
+    # Polling: dashboards x ticks requests
+    polls = args.dashboards * args.ticks // 10
+    cpu, counted = 0, 0
+    for _ in range(args.ticks // 2 or 1):
+        changed_stats()
+        queries.count, start = 0, time.process_time()
+        for _ in range(polls // (args.ticks // 2 or 1)):
+            client.get('/api/dashboard/stats', headers=headers)
+        cpu += time.process_time() - start
+        counted += queries.count
+    per_poll_cpu, per_poll_queries = cpu / polls, counted / polls
+    rate = args.dashboards / args.tick
+    print('polling: {:,.0f} requests/s'.format(rate))
+    print('  {:<22} {:>10.1f} ms/s ({:.2f} CPU)'.format('server CPU', per_poll_cpu * rate * 1000, per_poll_cpu * rate))
+    print('  {:<22} {:>10.1f} /s'.format('database queries', per_poll_queries * rate))
+
+    # SSE: open the streams, then drive the ticks
+    queries.count, start = 0, time.process_time()
+    streams = []
+    for _ in range(args.dashboards):
+        response = client.get('/api/dashboard/stream', headers=headers, buffered=False)
+        stream = iter(response.response)
+        next(stream), next(stream)
+        streams.append((response, stream))
+    connect_cpu, connect_queries = time.process_time() - start, queries.count
+
+    cpu, counted = 0, 0
+    for _ in range(args.ticks):
+        changed_stats()
+        queries.count, start = 0, time.process_time()
+        with app.app_context():
+            live_updates.tick()
+        for _, stream in streams:
+            next(stream)
+        cpu += time.process_time() - start
+        counted += queries.count
+
+    period = live_updates.max_duration
+    tick_cpu = cpu / args.ticks / args.tick + connect_cpu / period
+    tick_queries = counted / args.ticks / args.tick + connect_queries / period
+    print('\nSSE: {:,} streams, {} frames each, {} dropped'.format(
+        live_updates.summary()['subscribers'], args.ticks, live_updates.summary()['dropped_frames']))
+    print('  {:<22} {:>10.1f} ms/s ({:.2f} CPU)'.format('server CPU', tick_cpu * 1000, tick_cpu))
+    print('  {:<22} {:>10.1f} /s'.format('database queries', tick_queries))
+    print('  {:<22} {:>10.1f} ms per tick for all the streams'.format('fan-out', cpu / args.ticks * 1000))
+
+    for response, _ in streams:
+        response.close()
+
+
+if __name__ == '__main__':
+    main()
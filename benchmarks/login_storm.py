@@ -0,0 +1,84 @@
+# -*- encoding: utf-8 -*-
+"""
+Login storm benchmark
+
+Fires a burst of concurrent /api/auth/login requests while a probe client
+polls /api/status, with password hashing inline on the request threads
+(PASSWORD_HASH_WORKERS=0, the original behaviour) and on the bounded pool.
+
+Usage:
+$ python benchmarks/login_storm.py [--clients 64] [--logins 4]
+"""
+
+import argparse
+import threading
+import time
+
+from common import make_app, api_token
+
+
+def storm(app, clients, logins):
+    """Return (status codes of the logins, their latencies, /api/status latencies)"""
+    codes, latencies, probes = [], [], []
+    barrier = threading.Barrier(clients + 1)
+    done = threading.Event()
+
+    def login():
+        client = app.test_client()
+        barrier.wait()
+        for _ in range(logins):
+            start = time.perf_counter()
+            response = client.post('/api/auth/login', json={'username': 'bench', 'password': 'benchpass'})
+            latencies.append(time.perf_counter() - start)
+            codes.append(response.status_code)
+
+    def probe():
+        client = app.test_client()
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get('/api/status')
+            probes.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=login) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    prober = threading.Thread(target=probe)
+    prober.start()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    done.set()
+    prober.join()
+    return codes, sorted(latencies), sorted(probes)
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--logins', type=int, default=4)
+    args = parser.parse_args()
+
+    print('{} concurrent clients x {} logins\n'.format(args.clients, args.logins))
+    print('{:<10} {:>6} {:>6} {:>10} {:>10} {:>10} {:>14}'.format(
+        'hashing', '200', '503', 'seconds', 'p50 ms', 'p99 ms', 'status p99 ms'))
+
+    for workers in (0, None):
+        settings = {'PASSWORD_HASH_WORKERS': workers} if workers is not None else {}
+        app = make_app(**settings)
+        api_token(app.test_client())
+
+        start = time.perf_counter()
+        codes, latencies, probes = storm(app, args.clients, args.logins)
+        elapsed = time.perf_counter() - start
+        print('{:<10} {:>6} {:>6} {:>10.2f} {:>10.1f} {:>10.1f} {:>14.1f}'.format(
+            'inline' if workers == 0 else 'pool', codes.count(200), codes.count(503), elapsed,
+            percentile(latencies, 0.5), percentile(latencies, 0.99), percentile(probes, 0.99)))
+
+
+if __name__ == '__main__':
+    main()
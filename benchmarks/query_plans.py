@@ -0,0 +1,143 @@
+# -*- encoding: utf-8 -*-
+"""
+Query plan check
+
+Runs the routes against a large Users table with QUERY_PLAN_CHECK on: every
+query they issue is EXPLAINed, and a full table scan fails the request.
+Also runs the Github login lookups (Users.oauth_github, flask_dance's token
+query), then times the oauth_github lookup with and without its index.
+
+Prints each statement with its plan and exits with status 1 on a full scan
+or an unexpected status (a refused request's queries are never checked).
+
+Usage:
+$ python benchmarks/query_plans.py [--users 100000] [--verbose]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from common import api_token, make_app, measure
+
+from apps import db
+from apps.authentication.models import OAuth, Users
+from apps.query_plans import FullScan, query_plans
+
+
+def fill(database, count):
+    """count users, one in ten with a Github login and a token"""
+    connection = sqlite3.connect(database)
+    connection.executemany(
+        'INSERT INTO "Users" (username, email, password, oauth_github) VALUES (?, ?, ?, ?)',
+        (('user{}'.format(i), 'user{}@example.com'.format(i), b'x', 'gh{}'.format(i) if i % 10 == 0 else None)
+         for i in range(count)))
+    connection.executemany(
+        'INSERT INTO flask_dance_oauth (provider, created_at, token, user_id) VALUES (?, ?, ?, ?)',
+        (('github', '2026-01-01 00:00:00', '{}', i + 1) for i in range(0, count, 10)))
+    connection.commit()
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--verbose', action='store_true', help='print the plan of every statement')
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'db.sqlite3')
+    app = make_app(database=database, QUERY_PLAN_CHECK=True, PASSWORD_HASH_ITERATIONS=1000,
+                   METRICS_FLUSH_INTERVAL=1, ADMIN_USERNAMES=['benchadmin'], TESTING=True)
+    with app.app_context():
+        db.create_all()
+    fill(database, args.users)
+
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + api_token(client)}
+    admin_headers = {'Authorization': 'Bearer ' + api_token(client, 'benchadmin')}
+    now = datetime.datetime.utcnow()
+    series = '/api/dashboard/series?metric=requests&start={}&end={}'.format(
+        (now - datetime.timedelta(days=1)).isoformat(), now.isoformat())
+
+    def github_login():
+        # apps.authentication.oauth: the user of a Github account, then flask_dance's token
+        user = Users.query.filter_by(oauth_github='gh10').one()
+        OAuth.query.filter_by(provider='github', user_id=user.id).one()
+
+    steps = (
+        ('POST /api/auth/register', lambda: client.post('/api/auth/register', json={
+            'username': 'newuser', 'email': 'newuser@example.com', 'password': 'password'})),
+        ('POST /api/auth/register (taken)', lambda: client.post('/api/auth/register', json={
+            'username': 'user5', 'email': 'other@example.com', 'password': 'password'})),
+        ('POST /api/auth/login', lambda: client.post('/api/auth/login', json={
+            'username': 'newuser', 'password': 'password'})),
+        ('GET /api/profile', lambda: client.get('/api/profile', headers=headers)),
+        ('GET /api/dashboard/stats', lambda: client.get('/api/dashboard/stats', headers=headers)),
+        ('GET /api/dashboard/series', lambda: client.get(series, headers=headers)),
+        ('POST /api/users/import', lambda: client.post('/api/users/import', headers=admin_headers, data='\n'.join(
+            json.dumps({'username': name, 'email': name + '@example.com', 'password': 'password'})
+            for name in ('imported1', 'imported2', 'user7')))),
+        ('POST /login', lambda: client.post('/login', data={
+            'login': '1', 'username': 'newuser', 'password': 'password'})),
+        ('GET /index', lambda: client.get('/index')),
+        ('GET /profile', lambda: client.get('/profile')),
+        ('GET /tables.html', lambda: client.get('/tables.html')),
+        ('GET /logout', lambda: client.get('/logout')),
+        ('POST /register', lambda: client.post('/register', data={
+            'register': '1', 'username': 'formuser', 'email': 'formuser@example.com', 'password': 'password'})),
+        ('Github login lookups', lambda: app.test_request_context().push() or github_login()),
+    )
+
+    # Anything else must answer 2xx
+    expected = {'POST /api/auth/register (taken)': 400, 'POST /login': 302, 'GET /logout': 302}
+
+    failures = 0
+    for label, step in steps:
+        time.sleep(1.1 if 'stats' in label else 0)  # a metrics rollup runs in a request
+        try:
+            response = step()
+            status = response.status_code if response is not None else 'ok'
+            if response is not None and not (status == expected[label] if label in expected else 200 <= status < 300):
+                # Refused before its queries ran: nothing was checked
+                failures += 1
+                print('{:<34} {} {}'.format(label, status, response.get_data(as_text=True)[:200].strip()))
+                continue
+        except FullScan as e:
+            failures += 1
+            status = 'FULL SCAN'
+            print('{:<34} {}\n  {}\n'.format(label, status, str(e).replace('\n', '\n  ')))
+            continue
+        print('{:<34} {}'.format(label, status))
+
+    report = query_plans.report()
+    print('\n{} statements checked, {} with a full scan'.format(
+        len(report), sum(1 for item in report if item['full_scans'])))
+    if args.verbose:
+        for item in report:
+            print('\n' + ' '.join(item['statement'].split()))
+            for line in item['plan']:
+                print('  ' + line)
+
+    # The Github login lookup, with and without its index
+    query_plans.enabled = False
+    with app.app_context():
+        lookup = lambda: Users.query.filter_by(oauth_github='gh{}'.format(args.users // 2 // 10 * 10)).first()
+        indexed = measure(lookup, 200)[1]
+        db.session.execute('DROP INDEX "ix_Users_oauth_github"')
+        scanned = measure(lookup, 20)[1]
+        db.session.remove()
+    print('\nUsers.oauth_github lookup, {:,} users: {:.3f} ms indexed, {:.3f} ms without the index'.format(
+        args.users, indexed, scanned))
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# -*- encoding: utf-8 -*-
+"""
+Rate limiter microbenchmark
+
+Compares the strategy engines of apps.api_limiter against the original
+list-of-timestamps implementation, with requests spread over 10k IPs, then
+replays the same traffic from several threads against a single-lock store
+and a sharded one while the cleanup sweep runs.
+
+Usage:
+$ python benchmarks/rate_limiter.py [--ips 10000] [--requests 500000] [--threads 8]
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from apps.api_limiter import RateLimiter, STRATEGIES
+
+
+class ListRateLimiter:
+    """The original algorithm: one timestamp list per IP, rebuilt on every hit"""
+    def __init__(self, window_ms, max_requests):
+        self.window_ms = window_ms
+        self.max_requests = max_requests
+        self.store = {}
+
+    def hit(self, ip, now):
+        if ip not in self.store:
+            self.store[ip] = []
+        self.store[ip].append(now)
+        self.store[ip] = [ts for ts in self.store[ip]
+                          if now - ts < self.window_ms]
+        return len(self.store[ip]) <= self.max_requests
+
+
+def state_size(items):
+    """Deep size in bytes of (key, list/tuple state) pairs"""
+    size = 0
+    for key, state in items:
+        size += sys.getsizeof(key) + sys.getsizeof(state)
+        size += sum(sys.getsizeof(item) for item in state)
+    return size
+
+
+def run(limiter, traffic):
+    """Replay the traffic, return (seconds, allowed, state bytes)"""
+    start = time.perf_counter()
+    allowed = 0
+    for ip, now in traffic:
+        allowed += limiter.hit(ip, now)
+    elapsed = time.perf_counter() - start
+    return elapsed, allowed, state_size(limiter.store.items())
+
+
+def run_threaded(limiter, traffic, threads):
+    """
+    Replay the traffic from several threads while evicting
+    Return (seconds, p99 hit latency, worst hit latency)
+    """
+    chunks = [traffic[i::threads] for i in range(threads)]
+    latencies = []
+    done = threading.Event()
+
+    def worker(chunk):
+        clock = time.perf_counter
+        samples = []
+        for ip, now in chunk:
+            start = clock()
+            limiter.hit(ip, now)
+            samples.append(clock() - start)
+        latencies.extend(samples)
+
+    def sweeper():
+        # Evict continuously, as a worst case for the background thread
+        while not done.is_set():
+            for partition in range(limiter.store.partitions):
+                limiter._cleanup_expired(limiter.policies['default'], partition)
+
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    cleanup = threading.Thread(target=sweeper)
+    start = time.perf_counter()
+    cleanup.start()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    cleanup.join()
+    latencies.sort()
+    return elapsed, latencies[int(len(latencies) * 0.99)], latencies[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ips', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=500000)
+    parser.add_argument('--max-requests', type=int, default=100)
+    parser.add_argument('--window-ms', type=int, default=15 * 60 * 1000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    # Requests arrive evenly over one window, from random IPs
+    rnd = random.Random(42)
+    ips = ['10.{}.{}.{}'.format(i >> 16 & 255, i >> 8 & 255, i & 255) for i in range(args.ips)]
+    start = time.time() * 1000
+    step = args.window_ms / args.requests
+    traffic = [(ips[rnd.randrange(args.ips)], start + i * step)
+               for i in range(args.requests)]
+
+    candidates = [('list (original)', ListRateLimiter(args.window_ms, args.max_requests))]
+    for name in STRATEGIES:
+        candidates.append((name, RateLimiter(args.window_ms, args.max_requests, strategy=name)))
+
+    print('{} requests over {} IPs, limit {}/{}ms\n'.format(
+        args.requests, args.ips, args.max_requests, args.window_ms))
+    print('{:<18} {:>10} {:>12} {:>10} {:>12}'.format(
+        'engine', 'seconds', 'req/s', 'allowed', 'memory KiB'))
+    for name, limiter in candidates:
+        elapsed, allowed, size = run(limiter, traffic)
+        print('{:<18} {:>10.3f} {:>12,.0f} {:>10} {:>12,.0f}'.format(
+            name, elapsed, args.requests / elapsed, allowed, size / 1024))
+
+    print('\n{} threads, sliding-window, cleanup sweeping concurrently\n'.format(args.threads))
+    print('{:<18} {:>10} {:>12} {:>10} {:>10}'.format('store', 'seconds', 'req/s', 'p99 us', 'max ms'))
+    for shards in (1, 16, 64):
+        limiter = RateLimiter(args.window_ms, args.max_requests, shards=shards)
+        elapsed, p99, worst = run_threaded(limiter, traffic, args.threads)
+        print('{:<18} {:>10.3f} {:>12,.0f} {:>10.1f} {:>10.2f}'.format(
+            '{} shard(s)'.format(shards), elapsed, args.requests / elapsed, p99 * 1e6, worst * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# -*- encoding: utf-8 -*-
+"""
+Rate limiter memory benchmark
+
+Simulates a spoofed-client flood: every request comes from a new key, as
+when an attacker rotates source addresses. Reports the memory held by the
+limiter with and without the RATE_LIMIT_MAX_KEYS cap.
+
+Usage:
+$ python benchmarks/rate_limiter_memory.py [--keys 1000000] [--max-keys 100000]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from apps.api_limiter import RateLimiter
+
+
+def run(limiter, keys, checkpoints):
+    """Hit the limiter once per unique key, sampling the traced memory"""
+    tracemalloc.start()
+    now = time.time() * 1000
+    samples = []
+    start = time.perf_counter()
+    for i in range(keys):
+        limiter.hit('2001:db8::{:x}'.format(i), now)
+        if i + 1 in checkpoints:
+            samples.append(tracemalloc.get_traced_memory()[0])
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return samples, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--keys', type=int, default=1000000)
+    parser.add_argument('--max-keys', type=int, default=100000)
+    args = parser.parse_args()
+
+    checkpoints = [args.keys // 4, args.keys // 2, args.keys * 3 // 4, args.keys]
+    print('{} unique keys, sliding-window strategy\n'.format(args.keys))
+    print('{:<14}'.format('max_keys') + ''.join('{:>12}'.format('@{:,}'.format(c)) for c in checkpoints)
+          + '{:>12} {:>10} {:>8}'.format('peak MiB', 'tracked', 'sec'))
+
+    for max_keys in (None, args.max_keys):
+        limiter = RateLimiter(max_keys=max_keys)
+        samples, peak, elapsed = run(limiter, args.keys, set(checkpoints))
+        print('{:<14}'.format(str(max_keys)) + ''.join('{:>12.1f}'.format(s / 2 ** 20) for s in samples)
+              + '{:>12.1f} {:>10,} {:>8.1f}'.format(peak / 2 ** 20, len(limiter.store), elapsed))
+        del limiter
+
+    print('\n(columns: MiB held by the limiter after that many keys)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# -*- encoding: utf-8 -*-
+"""
+Rate limiter load test across processes
+
+Starts N worker processes (like gunicorn workers) that hammer the same set
+of client keys, then checks how many requests were let through per key.
+With the per-process memory store each worker counts on its own and the
+effective limit is multiplied by N; with the SQLite store the global limit
+must hold exactly. Exits with status 1 if it does not.
+
+Usage:
+$ python benchmarks/rate_limiter_processes.py [--workers 4] [--keys 50] [--max-requests 100]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from apps.api_limiter import RateLimiter
+
+
+def worker(storage, args, start, queue):
+    """Send requests for every key until the limit is surely exceeded"""
+    limiter = RateLimiter(args.window_ms, args.max_requests,
+                          strategy=args.strategy, storage=storage)
+    allowed = dict.fromkeys(range(args.keys), 0)
+    began = time.perf_counter()
+    for _ in range(args.max_requests * 2):
+        for key in allowed:
+            # All workers share one clock reading, so no window rolls over
+            allowed[key] += limiter.hit('client-{}'.format(key), start)
+    queue.put((allowed, time.perf_counter() - began))
+
+
+def run(storage, args):
+    """Return (allowed requests per key, total requests/s)"""
+    queue = multiprocessing.Queue()
+    start = time.time() * 1000
+    processes = [multiprocessing.Process(target=worker, args=(storage, args, start, queue))
+                 for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    totals = dict.fromkeys(range(args.keys), 0)
+    for allowed, _ in results:
+        for key, count in allowed.items():
+            totals[key] += count
+    sent = args.workers * args.keys * args.max_requests * 2
+    return totals, sent / max(elapsed for _, elapsed in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--keys', type=int, default=50)
+    parser.add_argument('--max-requests', type=int, default=100)
+    parser.add_argument('--window-ms', type=int, default=15 * 60 * 1000)
+    parser.add_argument('--strategy', default='fixed-window')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'rate_limits.sqlite3')
+    print('{} workers, {} keys, limit {} per key\n'.format(args.workers, args.keys, args.max_requests))
+    print('{:<10} {:>10} {:>10} {:>12}'.format('storage', 'min/key', 'max/key', 'req/s'))
+
+    ok = True
+    for storage in ('memory', 'sqlite:///' + path):
+        totals, rate = run(storage, args)
+        print('{:<10} {:>10} {:>10} {:>12,.0f}'.format(
+            storage.split(':')[0], min(totals.values()), max(totals.values()), rate))
+        if storage != 'memory':
+            ok = all(count == args.max_requests for count in totals.values())
+
+    print('\nglobal limit {}'.format('holds' if ok else 'VIOLATED'))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
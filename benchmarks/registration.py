@@ -0,0 +1,134 @@
+# -*- encoding: utf-8 -*-
+"""
+Registration benchmark
+
+- latency: POST /api/auth/register for new users and for taken usernames,
+  with the database queries each one runs
+- concurrency: --threads clients register the same username at the same
+  time (different emails); exactly one must get the account, the others
+  'Username already registered', none a server error. The script exits
+  with status 1 when a round of the current handler does otherwise
+
+The previous handler (a query per unique column, then the INSERT, without
+the unique constraints as a guard) is run
+the same way for comparison. A low PBKDF2 cost keeps the hash out of the
+latencies (--iterations).
+
+Usage:
+$ python benchmarks/registration.py [--requests 500] [--threads 16] [--iterations 1000]
+"""
+
+import argparse
+import os
+import sys
+import threading
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from common import make_app, measure
+from flask import jsonify, request
+from sqlalchemy import event
+
+from apps import db
+from apps.api_validation import user_registration_schema, validate_with_schema
+from apps.authentication.models import Users
+
+
+def previous_register():
+    """The handler before the single INSERT, at /bench/register"""
+    data = request.validated_data
+    if Users.query.filter_by(username=data['username']).first():
+        return jsonify({'error': 'Username already registered'}), 400
+    if Users.query.filter_by(email=data['email']).first():
+        return jsonify({'error': 'Email already registered'}), 400
+    db.session.add(Users(**data))
+    db.session.commit()
+    return jsonify({'message': 'User registered successfully'}), 201
+
+
+def race(app, url, name, threads):
+    """Outcomes of threads simultaneous signups of the same username"""
+    barrier = threading.Barrier(threads)
+    outcomes = Counter()
+
+    def signup(i):
+        client = app.test_client()
+        barrier.wait()
+        response = client.post(url, json={'username': name, 'email': '{}{}@example.com'.format(name, i),
+                                          'password': 'password'})
+        outcomes[response.status_code, (response.get_json() or {}).get('error')] += 1
+
+    workers = [threading.Thread(target=signup, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    with app.app_context():
+        created = Users.query.filter_by(username=name).count()
+        db.session.remove()
+    return created, outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = make_app(PASSWORD_HASH_ITERATIONS=args.iterations, PROPAGATE_EXCEPTIONS=False)
+    app.add_url_rule('/bench/register', 'bench_register', validate_with_schema(user_registration_schema)(previous_register),
+                     methods=['POST'])
+    # The server errors of the race are counted, not logged
+    app.logger.disabled = True
+    client = app.test_client()
+    with app.app_context():
+        queries = Counter()
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: queries.update([statement.split()[0]]))
+
+    print('{:<10} {:<8} {:>10} {:>9} {:>9}   {}'.format('handler', 'signup', 'req/s', 'p50 ms', 'p99 ms', 'queries per signup'))
+    for label, url in (('previous', '/bench/register'), ('current', '/api/auth/register')):
+        for kind in ('new', 'taken'):
+            counter = iter(range(args.requests))
+            name = '{}-{}'.format(label, kind)
+
+            def signup():
+                i = next(counter)
+                username = name + str(i) if kind == 'new' else name
+                client.post(url, json={'username': username, 'email': '{}{}@example.com'.format(name, i),
+                                       'password': 'password'})
+
+            if kind == 'taken':
+                client.post(url, json={'username': name, 'email': name + '@example.com', 'password': 'password'})
+            queries.clear()
+            rate, p50, p99 = measure(signup, args.requests)
+            per_signup = ', '.join('{} {:g}'.format(statement, count / args.requests)
+                                   for statement, count in sorted(queries.items()))
+            print('{:<10} {:<8} {:>10,.0f} {:>9.2f} {:>9.2f}   {}'.format(label, kind, rate, p50, p99, per_signup))
+
+    print('\n{} concurrent signups of one username, {} rounds'.format(args.threads, args.rounds))
+    failed_rounds = 0
+    for label, url in (('previous', '/bench/register'), ('current', '/api/auth/register')):
+        accounts, outcomes = Counter(), Counter()
+        for round in range(args.rounds):
+            created, round_outcomes = race(app, url, 'race-{}-{}'.format(label, round), args.threads)
+            accounts[created] += 1
+            outcomes.update(round_outcomes)
+            expected = {(201, None): 1, (400, 'Username already registered'): args.threads - 1}
+            if label == 'current' and (created != 1 or round_outcomes != expected):
+                failed_rounds += 1
+        print('{:<10} accounts created per round: {}'.format(label, dict(accounts)))
+        for (status, error), count in sorted(outcomes.items(), key=lambda item: item[0][0]):
+            print('{:<10}   {} {:<30} x{}'.format('', status, error or '', count))
+
+    if failed_rounds:
+        print('\nFAILED: {} of {} rounds of the current handler did not create exactly one account'.format(
+            failed_rounds, args.rounds))
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
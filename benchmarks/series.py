@@ -0,0 +1,121 @@
+# -*- encoding: utf-8 -*-
+"""
+Time series API benchmark
+
+Fills metric_rollups with a year of per-minute request counts (daily and
+weekly cycles, noise, a few spikes) and their hourly and daily rollups,
+then requests /api/dashboard/series over ranges from an hour to the
+year. Reports the granularity used, the points and bytes sent, and the
+latency of the first request (range loaded from the database) and of
+the next ones (cached), against the raw per-minute rows as JSON.
+
+Usage:
+$ python benchmarks/series.py [--points 300] [--requests 50]
+"""
+
+import argparse
+import datetime
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from common import api_token, make_app
+
+from apps import db
+
+RANGES = (
+    ('hour', 3600),
+    ('day', 86400),
+    ('week', 7 * 86400),
+    ('month', 30 * 86400),
+    ('year', 365 * 86400),
+)
+
+
+def fill(database, now):
+    """A year of minutes, with the hour and day sums; return the minute rows count"""
+    random.seed(1)
+    start = int(now // 86400 * 86400) - 365 * 86400
+    minutes, hours, days = [], {}, {}
+    for t in range(start, int(now), 60):
+        daily = math.sin((t % 86400) / 86400 * 2 * math.pi - math.pi / 2) + 1.2
+        weekly = 0.6 if (t // 86400) % 7 in (2, 3) else 1
+        value = int(40 * daily * weekly + random.gauss(0, 4) + (400 if random.random() < 1e-4 else 0))
+        value = max(value, 0)
+        minutes.append(('requests', 'minute', t, value))
+        hours[t // 3600 * 3600] = hours.get(t // 3600 * 3600, 0) + value
+        days[t // 86400 * 86400] = days.get(t // 86400 * 86400, 0) + value
+
+    def rows():
+        for name, granularity, t, value in minutes:
+            yield name, granularity, t, value
+        for t, value in hours.items():
+            yield 'requests', 'hour', t, value
+        for t, value in days.items():
+            yield 'requests', 'day', t, value
+
+    connection = sqlite3.connect(database)
+    connection.executemany(
+        'INSERT INTO metric_rollups (metric, granularity, bucket, value) VALUES (?, ?, ?, ?)',
+        ((name, granularity, datetime.datetime.utcfromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S.000000'), value)
+         for name, granularity, t, value in rows()))
+    connection.commit()
+    connection.close()
+    return len(minutes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--points', type=int, default=300)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'db.sqlite3')
+    app = make_app(database=database, METRICS_FLUSH_INTERVAL=0,
+                   METRICS_MINUTE_RETENTION_DAYS=400, METRICS_HOUR_RETENTION_DAYS=400)
+    with app.app_context():
+        db.create_all()
+    now = time.time()
+    count = fill(database, now)
+    print('{:,} per-minute rows, {:,.0f} KiB as raw JSON\n'.format(
+        count, count * len(json.dumps([1700000000, 42])) / 1024))
+
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + api_token(client)}
+
+    print('{:<7} {:<7} {:<11} {:>7} {:>9} {:>10} {:>10} {:>10}'.format(
+        'range', 'method', 'granularity', 'points', 'KiB', 'raw KiB', 'first ms', 'p50 ms'))
+    for method in ('lttb', 'minmax'):
+        for label, span in RANGES:
+            end = datetime.datetime.utcfromtimestamp(now)
+            start = end - datetime.timedelta(seconds=span)
+            url = '/api/dashboard/series?metric=requests&start={}&end={}&points={}&method={}'.format(
+                start.isoformat(), end.isoformat(), args.points, method)
+
+            began = time.perf_counter()
+            response = client.get(url, headers=headers)
+            first = (time.perf_counter() - began) * 1000
+            data = response.get_json()
+
+            latencies = []
+            for _ in range(args.requests):
+                began = time.perf_counter()
+                client.get(url, headers=headers)
+                latencies.append((time.perf_counter() - began) * 1000)
+            latencies.sort()
+
+            raw = span // 60 * len(json.dumps([1700000000, 42]))
+            print('{:<7} {:<7} {:<11} {:>7} {:>9.1f} {:>10,.0f} {:>10.1f} {:>10.1f}'.format(
+                label, method, data['granularity'], len(data['t']), len(response.data) / 1024,
+                raw / 1024, first, latencies[len(latencies) // 2]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# -*- encoding: utf-8 -*-
+"""
+Startup import-time benchmark and budget check
+
+Imports run.py (the gunicorn / Vercel entry point) in fresh processes
+with `python -X importtime` and reports:
+
+- the total import time, and the part above the framework floor (Flask,
+  Flask-SQLAlchemy, Flask-Login), which is what the app itself adds
+- the heaviest modules imported directly by the app
+- any module of apps.lazy.DEFERRED_MODULES imported at startup
+
+Exits with status 1 if a deferred module is imported or if the median
+app overhead exceeds the budget, so a startup regression fails the run.
+
+Usage:
+$ python benchmarks/startup.py [--runs 7] [--budget-ms 150] [--debug]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from apps.lazy import DEFERRED_MODULES
+
+FLOOR = ('flask', 'flask_sqlalchemy', 'flask_login')
+
+
+def importtime(module, debug):
+    """
+    Import module in a fresh interpreter
+    Return (cumulative us, [(name, cumulative us, depth)] of its imports)
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT, DEBUG=str(debug))
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            cwd=tempfile.gettempdir(), env=env, check=True,
+                            capture_output=True, text=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0 and name.strip() == module.split(',')[-1].strip():
+            return int(cumulative), imports
+        if depth == 0:
+            # Interpreter startup (site, encodings) or a previous module of the list
+            imports = [] if ',' not in module else imports + [(name.strip(), int(cumulative), depth)]
+        else:
+            imports.append((name.strip(), int(cumulative), depth))
+    raise RuntimeError('{} not found in the importtime output'.format(module))
+
+
+def floor_time(debug):
+    """Cumulative us of the framework imports alone"""
+    last, imports = importtime(', '.join(FLOOR), debug)
+    return last + sum(cumulative for name, cumulative, depth in imports if depth == 0)
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('STARTUP_BUDGET_MS', 150)))
+    parser.add_argument('--debug', action='store_true', help='import with DEBUG=True')
+    args = parser.parse_args()
+
+    floors, totals = [], []
+    for _ in range(args.runs):
+        floors.append(floor_time(args.debug) / 1000)
+        total, imports = importtime('run', args.debug)
+        totals.append(total / 1000)
+
+    floor, total = median(floors), median(totals)
+    overhead = median([t - f for t, f in zip(totals, floors)])
+    print('import run ({}, {} runs, median)\n'.format('DEBUG' if args.debug else 'production', args.runs))
+    print('{:<28} {:>10.1f} ms'.format('total', total))
+    print('{:<28} {:>10.1f} ms'.format('framework floor', floor))
+    print('{:<28} {:>10.1f} ms   (budget {:.0f} ms)'.format('app overhead', overhead, args.budget_ms))
+
+    # Heaviest modules imported by run.py and the apps package
+    heaviest = [(cumulative, name) for name, cumulative, depth in imports
+                if depth == 1 or (name.startswith('apps') and depth <= 3)]
+    print('\nheaviest imports (cumulative ms)')
+    for cumulative, name in sorted(heaviest, reverse=True)[:12]:
+        print('  {:<36} {:>8.1f}'.format(name, cumulative / 1000))
+
+    deferred = sorted({name.split('.')[0] for name, _, _ in imports} & set(DEFERRED_MODULES))
+    print('\ndeferred modules imported at startup: {}'.format(', '.join(deferred) or 'none'))
+
+    ok = not deferred and overhead <= args.budget_ms
+    print('\nstartup budget {}'.format('met' if ok else 'EXCEEDED'))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
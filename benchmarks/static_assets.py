@@ -0,0 +1,72 @@
+# -*- encoding: utf-8 -*-
+"""
+Static assets benchmark
+
+Loads the dashboard page like a browser with a cache: the first visit
+fetches every asset of the page, a repeat visit reuses the cached copies,
+revalidating those not marked fresh (304). Compares plain assets with the
+fingerprinted build of `gulp assets` (run it first), on requests and bytes
+sent per visit.
+
+Usage:
+$ npx gulp assets
+$ python benchmarks/static_assets.py
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from common import api_token, make_app
+
+MANIFEST = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'apps', 'static', 'assets',
+                                        'dist', 'manifest.json'))
+
+
+def visit(client, cache):
+    """Load /index and its assets, return (asset requests, bytes received, ms)"""
+    start = time.perf_counter()
+    html = client.get('/index').get_data(as_text=True)
+    requests, received = 0, 0
+    for url in re.findall(r'(?:href|src)="(/static/[^"]+)"', html):
+        cached = cache.get(url)
+        if cached and 'immutable' in cached['cache-control']:
+            continue
+
+        headers = {'Accept-Encoding': 'br, gzip'}
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached.get('last-modified'):
+            headers['If-Modified-Since'] = cached['last-modified']
+        response = client.get(url, headers=headers)
+        requests += 1
+        received += len(response.data)
+        if response.status_code == 200:
+            cache[url] = {'cache-control': response.headers.get('Cache-Control', ''),
+                          'etag': response.headers.get('ETag'),
+                          'last-modified': response.headers.get('Last-Modified')}
+    return requests, received, (time.perf_counter() - start) * 1000
+
+
+def main():
+    if not os.path.isfile(MANIFEST):
+        sys.exit('Build the assets first: npx gulp assets')
+
+    print('{:<14} {:<8} {:>10} {:>12} {:>10}'.format('assets', 'visit', 'requests', 'KiB', 'ms'))
+    for label, manifest in (('plain', None), ('fingerprinted', MANIFEST)):
+        app = make_app(ASSETS_MANIFEST=manifest)
+        client = app.test_client()
+        api_token(client)
+        client.post('/login', data={'username': 'bench', 'password': 'benchpass', 'login': ''})
+
+        cache = {}
+        for name in ('first', 'repeat'):
+            requests, received, elapsed = visit(client, cache)
+            print('{:<14} {:<8} {:>10} {:>12.1f} {:>10.1f}'.format(label, name, requests, received / 1024, elapsed))
+
+
+if __name__ == '__main__':
+    main()
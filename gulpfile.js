@@ -15,6 +15,10 @@ var sass = require('gulp-sass')(require('node-sass'));
 var wait = require('gulp-wait');
 var sourcemaps = require('gulp-sourcemaps');
 var rename = require("gulp-rename");
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+const zlib = require('zlib');
 
 // Define COMMON paths
 
@@ -25,7 +29,8 @@ const paths = {
         scss: './apps/static/assets/scss',
         node_modules: './node_modules/',
         vendor: './vendor'
-    }
+    },
+    dist: './apps/static/assets/dist'
 };
 
 // Compile SCSS
@@ -68,5 +73,91 @@ gulp.task('minify:css', function() {
         .pipe(gulp.dest(paths.src.css))
 });
 
-// Default Task: Compile SCSS and minify the result
-gulp.task('default', gulp.series('scss', 'minify:css'));
+// Fingerprinted assets
+
+// Worth compressing (fonts like woff/woff2 and images are compressed already)
+const compressible = ['.css', '.js', '.svg', '.json', '.txt', '.ttf', '.eot', '.otf', '.ico'];
+
+function assetFiles(dir) {
+    return fs.readdirSync(dir, { withFileTypes: true }).flatMap(function(entry) {
+        var file = path.join(dir, entry.name);
+        if (entry.isDirectory()) {
+            // Sources, previous builds and user uploads stay out
+            return ['scss', 'dist', 'profile_uploads'].includes(entry.name) ? [] : assetFiles(file);
+        }
+        return entry.name.endsWith('.map') ? [] : [file];
+    });
+}
+
+function fingerprint(file, content) {
+    var hash = crypto.createHash('sha256').update(content).digest('hex').slice(0, 10);
+    var ext = path.extname(file);
+    return file.slice(0, -ext.length) + '.' + hash + ext;
+}
+
+// url(...) of a stylesheet, pointed at the fingerprinted files
+function rewriteUrls(css, cssPath, manifest) {
+    return css.replace(/url\((['"]?)([^'")]+)\1\)/g, function(match, quote, url) {
+        if (/^(data:|https?:|\/\/|#)/.test(url)) {
+            return match;
+        }
+        var parts = url.match(/^([^?#]*)(.*)$/);
+        var target = path.posix.normalize(path.posix.join(path.posix.dirname(cssPath), parts[1]));
+        if (!manifest[target]) {
+            return match;
+        }
+        var hashed = path.posix.relative(path.posix.dirname(cssPath), manifest[target]);
+        return 'url(' + quote + hashed + parts[2] + quote + ')';
+    });
+}
+
+function writeAsset(relative, content) {
+    var target = path.join(paths.dist, relative);
+    fs.mkdirSync(path.dirname(target), { recursive: true });
+    fs.writeFileSync(target, content);
+
+    // Precompressed variants, kept only when they save something
+    if (compressible.includes(path.extname(relative))) {
+        var gzip = zlib.gzipSync(content, { level: 9 });
+        var brotli = zlib.brotliCompressSync(content, {
+            params: { [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY }
+        });
+        if (gzip.length < content.length * 0.9) {
+            fs.writeFileSync(target + '.gz', gzip);
+        }
+        if (brotli.length < content.length * 0.9) {
+            fs.writeFileSync(target + '.br', brotli);
+        }
+    }
+}
+
+// Content-hashed copies of the assets with gzip and brotli variants in assets/dist,
+// and the manifest (original path -> fingerprinted path) read by the Flask app
+gulp.task('assets', function(done) {
+    fs.rmSync(paths.dist, { recursive: true, force: true });
+
+    var manifest = {};
+    var files = assetFiles(paths.src.base).map(function(file) {
+        return path.relative(paths.src.base, file).split(path.sep).join('/');
+    });
+
+    // Stylesheets last: their hash covers the rewritten url(...) references
+    var sheets = files.filter(function(file) { return path.extname(file) === '.css'; });
+    files.filter(function(file) { return !sheets.includes(file); }).forEach(function(file) {
+        var content = fs.readFileSync(path.join(paths.src.base, file));
+        manifest[file] = fingerprint(file, content);
+        writeAsset(manifest[file], content);
+    });
+    sheets.forEach(function(file) {
+        var css = fs.readFileSync(path.join(paths.src.base, file), 'utf8');
+        var content = Buffer.from(rewriteUrls(css, file, manifest));
+        manifest[file] = fingerprint(file, content);
+        writeAsset(manifest[file], content);
+    });
+
+    fs.writeFileSync(path.join(paths.dist, 'manifest.json'), JSON.stringify(manifest, null, 2));
+    done();
+});
+
+// Default Task: Compile SCSS, minify the result and fingerprint the assets
+gulp.task('default', gulp.series('scss', 'minify:css', 'assets'));
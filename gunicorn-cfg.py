@@ -3,9 +3,70 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
-bind = '0.0.0.0:5005'
-workers = 1
-accesslog = '-'
-loglevel = 'debug'
-capture_output = True
-enable_stdio_inheritance = True
+import multiprocessing
+import os
+
+# GUNICORN_PROFILE: 'development' (one worker, debug logs) or 'production'
+profile = os.getenv('GUNICORN_PROFILE', 'development')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5005')
+
+if profile == 'production':
+
+    cpus = multiprocessing.cpu_count()
+
+    # gthread (default) or gevent
+    worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+    if worker_class == 'gevent':
+        # Patch before the app is preloaded, so its locks and sockets are cooperative
+        from gevent import monkey
+        monkey.patch_all()
+
+        workers = int(os.getenv('WEB_CONCURRENCY', cpus))
+        worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+    else:
+        # CPU-bound work (PBKDF2, rendering) gets a process per core,
+        # I/O waits (database, uploads) are covered by the threads
+        workers = int(os.getenv('WEB_CONCURRENCY', cpus * 2 + 1))
+        threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+        # A live stream (/api/dashboard/stream) holds a thread as long as it is
+        # open: at most half of them, the others keep serving the requests
+        os.environ['LIVE_MAX_SUBSCRIBERS'] = str(min(int(os.getenv('LIVE_MAX_SUBSCRIBERS', threads)), threads // 2))
+
+    # Import the app once in the master, workers share it copy-on-write
+    preload_app = True
+
+    # Recycle workers to bound slow leaks, staggered so they never restart together
+    max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+    max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+    timeout = 30
+    graceful_timeout = 30
+    keepalive = 5
+
+    loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
+    accesslog = os.getenv('GUNICORN_ACCESSLOG') or None
+    errorlog = '-'
+
+    def post_worker_init(worker):
+        """Open the database pool before the worker accepts traffic"""
+        from apps import warm_up
+        warm_up(worker.wsgi)
+        worker.log.info('Worker warmed up (pid: %s)', worker.pid)
+
+    def worker_exit(server, worker):
+        """Roll up the metrics the worker counted since its last rollup (max_requests restarts)"""
+        from apps.metrics import metrics
+        with worker.wsgi.app_context():
+            metrics.flush()
+
+else:
+    workers = 1
+    # The sync worker serves one request at a time: no live streams, the dashboard polls
+    os.environ['LIVE_MAX_SUBSCRIBERS'] = '0'
+    accesslog = '-'
+    loglevel = 'debug'
+    capture_output = True
+    enable_stdio_inheritance = True
@@ -0,0 +1,50 @@
+"""initial
+
+Revision ID: 6afb59fd1fbe
+Revises: 
+Create Date: 2026-10-18 06:28:13.235603
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6afb59fd1fbe'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created before the migrations (db.create_all, update_db.py)
+    # already have these tables, they only need the later revisions
+    tables = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'Users' not in tables:
+        op.create_table('Users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=64), nullable=True),
+        sa.Column('email', sa.String(length=64), nullable=True),
+        sa.Column('password', sa.LargeBinary(), nullable=True),
+        sa.Column('oauth_github', sa.String(length=100), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+        sa.UniqueConstraint('username')
+        )
+
+    if 'flask_dance_oauth' not in tables:
+        op.create_table('flask_dance_oauth',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('provider', sa.String(length=50), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('token', sa.JSON(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['Users.id'], ondelete='cascade'),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('flask_dance_oauth')
+    op.drop_table('Users')
@@ -0,0 +1,45 @@
+"""user profile
+
+Revision ID: b3c1d2e4f5a6
+Revises: 6afb59fd1fbe
+Create Date: 2026-10-18 06:41:02.518244
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3c1d2e4f5a6'
+down_revision = '6afb59fd1fbe'
+branch_labels = None
+depends_on = None
+
+
+def profile_columns():
+    return [
+        sa.Column('first_name', sa.String(length=64), nullable=True),
+        sa.Column('last_name', sa.String(length=64), nullable=True),
+        sa.Column('address', sa.String(length=128), nullable=True),
+        sa.Column('city', sa.String(length=64), nullable=True),
+        sa.Column('country', sa.String(length=64), nullable=True),
+        sa.Column('postal_code', sa.String(length=16), nullable=True),
+        sa.Column('about_me', sa.Text(), nullable=True),
+        sa.Column('position', sa.String(length=64), server_default='Member', nullable=True),
+        sa.Column('profile_image', sa.String(length=128), server_default='img/default-avatar.png', nullable=True),
+    ]
+
+
+def upgrade():
+    # update_db.py may have added some of them already
+    existing = {column['name'].lower() for column in sa.inspect(op.get_bind()).get_columns('Users')}
+
+    for column in profile_columns():
+        if column.name.lower() not in existing:
+            op.add_column('Users', column)
+
+
+def downgrade():
+    with op.batch_alter_table('Users') as batch_op:
+        for column in reversed(profile_columns()):
+            batch_op.drop_column(column.name)
@@ -0,0 +1,61 @@
+"""dashboard metrics
+
+Revision ID: c7e2a9d41b08
+Revises: b3c1d2e4f5a6
+Create Date: 2026-10-18 09:12:47.301655
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2a9d41b08'
+down_revision = 'b3c1d2e4f5a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all may have made them already (development databases)
+    tables = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'metric_rollups' not in tables:
+        op.create_table('metric_rollups',
+        sa.Column('metric', sa.String(length=32), nullable=False),
+        sa.Column('granularity', sa.String(length=8), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('metric', 'granularity', 'bucket')
+        )
+
+    if 'metric_totals' not in tables:
+        op.create_table('metric_totals',
+        sa.Column('name', sa.String(length=32), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+        )
+
+    if 'metric_sessions' not in tables:
+        op.create_table('metric_sessions',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('last_seen', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id')
+        )
+        op.create_index(op.f('ix_metric_sessions_last_seen'), 'metric_sessions', ['last_seen'], unique=False)
+
+    # The running total of users starts from a count, the last one
+    bind = op.get_bind()
+    users = sa.table('Users', sa.column('id'))
+    totals = sa.table('metric_totals', sa.column('name'), sa.column('value'), sa.column('updated_at'))
+    if bind.execute(sa.select(totals.c.name).where(totals.c.name == 'users')).first() is None:
+        count = bind.execute(sa.select(sa.func.count(users.c.id))).scalar()
+        bind.execute(totals.insert().values(name='users', value=count, updated_at=sa.func.now()))
+
+
+def downgrade():
+    op.drop_index(op.f('ix_metric_sessions_last_seen'), table_name='metric_sessions')
+    op.drop_table('metric_sessions')
+    op.drop_table('metric_totals')
+    op.drop_table('metric_rollups')
@@ -0,0 +1,35 @@
+"""lookup indexes
+
+Revision ID: d4a8f2c6e913
+Revises: c7e2a9d41b08
+Create Date: 2026-10-18 14:03:21.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a8f2c6e913'
+down_revision = 'c7e2a9d41b08'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_Users_oauth_github', 'Users', ['oauth_github']),
+    ('ix_flask_dance_oauth_provider_user_id', 'flask_dance_oauth', ['provider', 'user_id']),
+    ('ix_flask_dance_oauth_user_id', 'flask_dance_oauth', ['user_id']),
+)
+
+
+def upgrade():
+    # db.create_all may have made them already (development databases)
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        if name not in {index['name'] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -4,12 +4,10 @@ Copyright (c) 2019 - present AppSeed.us
 """
 
 import os
-from   flask_migrate import Migrate
-from   flask_minify  import Minify
 from   sys import exit
 
 from apps.config import config_dict
-from apps import create_app, db
+from apps import create_app, register_commands, register_migrations
 
 # WARNING: Don't run with debug turned on in production!
 DEBUG = (os.getenv('DEBUG', 'False') == 'True')
@@ -30,9 +28,14 @@ except KeyError:
     exit('Error: Invalid <config_mode>. Expected values [Debug, Production] ')
 
 app = create_app(app_config)
-Migrate(app, db)
+
+# Migration tooling and commands only for the `flask` CLI (flask db upgrade, ...), not when serving
+if os.getenv('FLASK_RUN_FROM_CLI') == 'true':
+    register_migrations(app)
+    register_commands(app)
 
 if not DEBUG:
+    from flask_minify import Minify
     Minify(app=app, html=True, js=False, cssless=False)
     
 if DEBUG:
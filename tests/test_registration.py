@@ -0,0 +1,91 @@
+# -*- encoding: utf-8 -*-
+"""
+Concurrent registrations of one username: the unique constraints let a
+single one through, the others get the error of a taken username
+
+$ python -m unittest discover tests
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from apps import create_app, db
+from apps.authentication import models
+from apps.authentication.models import Users, register_user
+from apps.config import config_dict
+
+
+class RegistrationRaceTest(unittest.TestCase):
+
+    def setUp(self):
+        class TestConfig(config_dict['Debug']):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'db.sqlite3')
+            PASSWORD_HASH_ITERATIONS = 1000
+
+        self.app = create_app(TestConfig)
+        with self.app.app_context():
+            db.create_all()
+
+    def register_together(self, threads):
+        """Outcomes of register_user run by threads at once, for the same username and email"""
+        barrier = threading.Barrier(threads)
+        outcomes = []
+
+        def register():
+            with self.app.app_context():
+                barrier.wait()
+                user, error = register_user(username='racer', email='racer@example.com', password='password')
+                outcomes.append(error)
+                db.session.remove()
+
+        workers = [threading.Thread(target=register) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return outcomes
+
+    def count(self):
+        with self.app.app_context():
+            return Users.query.filter_by(username='racer').count()
+
+    def test_both_past_the_lookup(self):
+        # Both registrations find the username free, then both INSERT: the
+        # constraint rejects one, mapped to the error of the lookup
+        lookup = models.registration_error
+        passed = threading.Barrier(2)
+        local = threading.local()
+        calls = []
+
+        def lookup_then_wait(username, email):
+            calls.append(username)
+            error = lookup(username, email)
+            if not getattr(local, 'waited', False):
+                local.waited = True
+                passed.wait()
+            return error
+
+        with mock.patch.object(models, 'registration_error', lookup_then_wait):
+            outcomes = self.register_together(2)
+
+        self.assertEqual(sorted(outcomes, key=str), [None, 'Username already registered'])
+        self.assertEqual(self.count(), 1)
+        # The two lookups, then the one naming the column after the IntegrityError
+        self.assertEqual(len(calls), 3)
+
+    def test_many_at_once(self):
+        outcomes = self.register_together(16)
+
+        self.assertEqual(outcomes.count(None), 1)
+        self.assertEqual(outcomes.count('Username already registered'), 15)
+        self.assertEqual(self.count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()